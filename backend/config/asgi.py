@@ -0,0 +1,7 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Route webhooks and Pub/Sub pushes to the async views (see ASYNC_INGESTION)
+os.environ.setdefault('ASYNC_INGESTION', 'true')
+application = get_asgi_application()
@@ -1,4 +1,5 @@
 from pathlib import Path
+import json
 import os
 from dotenv import load_dotenv
 
@@ -63,6 +64,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
 
 # Database
 import dj_database_url
@@ -108,4 +110,77 @@ CSRF_TRUSTED_ORIGINS = [
     'http://localhost:3000',
     'http://127.0.0.1:3000',
     'http://localhost:8000',
-]
\ No newline at end of file
+]
+
+# Integration processing
+JS_COMPILE_CACHE_SIZE = int(os.getenv('JS_COMPILE_CACHE_SIZE', '512'))
+# Evaluate simple conditions/transforms natively instead of through Js2Py
+NATIVE_EXPRESSIONS_ENABLED = os.getenv('NATIVE_EXPRESSIONS_ENABLED', 'True') == 'True'
+# Messages requested per Pub/Sub pull; pulled messages are transformed as one batch
+PUBSUB_PULL_MAX_MESSAGES = int(os.getenv('PUBSUB_PULL_MAX_MESSAGES', '10'))
+# Run Js2Py scripts in a pool of warm worker processes with CPU/memory limits
+JS_SANDBOX_ENABLED = os.getenv('JS_SANDBOX_ENABLED', 'False') == 'True'
+JS_SANDBOX_WORKERS = int(os.getenv('JS_SANDBOX_WORKERS', '2'))  # per server process; 0 = one per CPU core
+JS_SANDBOX_CPU_TIMEOUT = float(os.getenv('JS_SANDBOX_CPU_TIMEOUT', '2'))
+JS_SANDBOX_MEMORY_MB = int(os.getenv('JS_SANDBOX_MEMORY_MB', '256'))
+JS_SANDBOX_START_TIMEOUT = float(os.getenv('JS_SANDBOX_START_TIMEOUT', '30'))  # worker warm-up (Js2Py import)
+# JSON library for payloads and run logs: auto (orjson, then msgspec), orjson, msgspec or json
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+# Outbound HTTP: keep-alive connection pool per target origin
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))
+HTTP_POOL_BLOCK = os.getenv('HTTP_POOL_BLOCK', 'False') == 'True'
+HTTP_KEEP_ALIVE = os.getenv('HTTP_KEEP_ALIVE', 'True') == 'True'
+# Asyncio delivery engine: concurrent in-flight requests per integration / per target host
+DELIVERY_MAX_CONCURRENCY_PER_INTEGRATION = int(os.getenv('DELIVERY_MAX_CONCURRENCY_PER_INTEGRATION', '10'))
+DELIVERY_MAX_CONCURRENCY_PER_HOST = int(os.getenv('DELIVERY_MAX_CONCURRENCY_PER_HOST', '50'))
+DELIVERY_MAX_CONNECTIONS = int(os.getenv('DELIVERY_MAX_CONNECTIONS', '1000'))
+# Per-host circuit breaker: consecutive failures before opening, seconds before a half-open probe
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '30'))
+# Outbound rate limits: token buckets shared through Redis (in-process fallback)
+REDIS_URL = os.getenv('REDIS_URL')
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv('RATE_LIMIT_MAX_WAIT_SECONDS', '30'))
+# Per target host, e.g. {"api.example.com": {"requestsPerSecond": 20, "burst": 20}}
+TARGET_RATE_LIMITS = json.loads(os.getenv('TARGET_RATE_LIMITS', '{}'))
+# Response capture: bytes of each target response body kept on the run,
+# largest body that is JSON-decoded, and how much is read before the connection is dropped
+RESPONSE_CAPTURE_MAX_BYTES = int(os.getenv('RESPONSE_CAPTURE_MAX_BYTES', '262144'))
+RESPONSE_PARSE_MAX_BYTES = int(os.getenv('RESPONSE_PARSE_MAX_BYTES', '65536'))
+RESPONSE_DRAIN_MAX_BYTES = int(os.getenv('RESPONSE_DRAIN_MAX_BYTES', '16777216'))
+# Adaptive delivery timeouts: multiplier x p99 latency per target host, clamped to these bounds (seconds)
+DELIVERY_TIMEOUT_MULTIPLIER = float(os.getenv('DELIVERY_TIMEOUT_MULTIPLIER', '4'))
+DELIVERY_TIMEOUT_MIN_SAMPLES = int(os.getenv('DELIVERY_TIMEOUT_MIN_SAMPLES', '20'))
+DELIVERY_LATENCY_WINDOW_SECONDS = int(os.getenv('DELIVERY_LATENCY_WINDOW_SECONDS', '300'))
+DELIVERY_CONNECT_TIMEOUT_MIN = float(os.getenv('DELIVERY_CONNECT_TIMEOUT_MIN', '1'))
+DELIVERY_CONNECT_TIMEOUT_MAX = float(os.getenv('DELIVERY_CONNECT_TIMEOUT_MAX', '10'))
+DELIVERY_READ_TIMEOUT_MIN = float(os.getenv('DELIVERY_READ_TIMEOUT_MIN', '1'))
+DELIVERY_READ_TIMEOUT_MAX = float(os.getenv('DELIVERY_READ_TIMEOUT_MAX', '30'))
+# Threads sending the email legs of fan-out (`targets`) deliveries
+FANOUT_EMAIL_WORKERS = int(os.getenv('FANOUT_EMAIL_WORKERS', '8'))
+# Request bodies smaller than this are not compressed (target.compression)
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+# SMTP connection pool for email targets
+SMTP_POOL_MAX_IDLE = int(os.getenv('SMTP_POOL_MAX_IDLE', '4'))            # idle connections kept per server/user
+SMTP_POOL_IDLE_SECONDS = int(os.getenv('SMTP_POOL_IDLE_SECONDS', '60'))   # close connections idle longer than this
+SMTP_POOL_NOOP_SECONDS = int(os.getenv('SMTP_POOL_NOOP_SECONDS', '5'))    # NOOP-check connections idle longer than this
+# Async webhooks (config_json.async): durable job table drained by `manage.py run_webhook_workers`
+WEBHOOK_QUEUE_POLL_SECONDS = float(os.getenv('WEBHOOK_QUEUE_POLL_SECONDS', '1'))     # idle wait between polls
+WEBHOOK_QUEUE_LOCK_SECONDS = int(os.getenv('WEBHOOK_QUEUE_LOCK_SECONDS', '300'))     # reclaim jobs held longer than this
+WEBHOOK_QUEUE_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_QUEUE_MAX_ATTEMPTS', '5'))       # claims before a job is failed
+# Webhook/push endpoint routing cache: reload entries older than this (changes are also pushed via Redis or Postgres NOTIFY)
+ROUTING_CACHE_TTL_SECONDS = float(os.getenv('ROUTING_CACHE_TTL_SECONDS', '60'))
+# Batch webhooks (/webhook/<path>/batch/): records processed per pipeline batch, and read per request
+WEBHOOK_BATCH_CHUNK_SIZE = int(os.getenv('WEBHOOK_BATCH_CHUNK_SIZE', '500'))
+WEBHOOK_BATCH_MAX_RECORDS = int(os.getenv('WEBHOOK_BATCH_MAX_RECORDS', '10000'))
+# Serve webhook and Pub/Sub push endpoints with native async views (set by config/asgi.py)
+ASYNC_INGESTION = os.getenv('ASYNC_INGESTION', 'false').lower() == 'true'
+# Duplicate suppression (config_json.deduplication): how long keys are remembered, and per-process LRU size
+DEDUP_TTL_SECONDS = int(os.getenv('DEDUP_TTL_SECONDS', '86400'))
+DEDUP_LOCAL_MAX_KEYS = int(os.getenv('DEDUP_LOCAL_MAX_KEYS', '100000'))
+# Compiled mapping plans kept in memory per process (least recently used are dropped)
+MAPPING_PLAN_CACHE_SIZE = int(os.getenv('MAPPING_PLAN_CACHE_SIZE', '1024'))
+# Retries left behind by a dead process: how often retrying runs are swept, and how overdue they must be
+RETRY_SWEEP_SECONDS = float(os.getenv('RETRY_SWEEP_SECONDS', '60'))
+RETRY_SWEEP_GRACE_SECONDS = int(os.getenv('RETRY_SWEEP_GRACE_SECONDS', '300'))
+# Deduplication on a hash of the whole payload (no id source configured): short, to only catch sender retries
+DEDUP_PAYLOAD_TTL_SECONDS = int(os.getenv('DEDUP_PAYLOAD_TTL_SECONDS', '300'))
@@ -9,7 +9,10 @@ from integrations.views import (
     IntegrationConfigurationViewSet,
     IntegrationRunViewSet,
     webhook_handler,
+    webhook_batch_handler,
     pubsub_push_handler,
+    async_webhook_handler,
+    async_pubsub_push_handler,
     mapper_view
 )
 
@@ -17,10 +20,15 @@ router = DefaultRouter()
 router.register(r'integrations', IntegrationConfigurationViewSet, basename='integration')
 router.register(r'runs', IntegrationRunViewSet, basename='integration-run')
 
+# Under ASGI (config/asgi.py) the ingestion endpoints are served by native async views
+if settings.ASYNC_INGESTION:
+    webhook_handler, pubsub_push_handler = async_webhook_handler, async_pubsub_push_handler
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
     path('webhook/<str:webhook_path>/', webhook_handler, name='webhook-handler'),
+    path('webhook/<str:webhook_path>/batch/', webhook_batch_handler, name='webhook-batch-handler'),
     path('pubsub/<str:push_path>/', pubsub_push_handler, name='pubsub-push-handler'),
     path('mapper/', mapper_view, name='mapper'),
 ]
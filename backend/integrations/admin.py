@@ -3,7 +3,7 @@ import json
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import IntegrationConfiguration, IntegrationRun
+from .models import IntegrationConfiguration, IntegrationRun, WebhookJob
 
 
 @admin.register(IntegrationConfiguration)
@@ -48,18 +48,20 @@ class IntegrationConfigurationAdmin(admin.ModelAdmin):
 
 @admin.register(IntegrationRun)
 class IntegrationRunAdmin(admin.ModelAdmin):
-    list_display = ['integration', 'status', 'created_at', 'transformation_time_ms', 'api_call_time_ms']
-    list_filter = ['status', 'created_at', 'integration']
+    list_display = ['integration', 'status', 'created_at', 'transformation_time_ms', 'api_call_time_ms',
+                    'attempt_count', 'circuit_state']
+    list_filter = ['status', 'circuit_state', 'created_at', 'integration']
     search_fields = ['integration__name', 'error_message']
     readonly_fields = [
         'id', 'integration', 'condition_display', 'incoming_payload_display', 'transformed_payload_display',
         'outgoing_request_display', 'outgoing_response_display', 'status',
-        'error_message', 'transformation_time_ms', 'api_call_time_ms', 'created_at'
+        'error_message', 'transformation_time_ms', 'api_call_time_ms', 'created_at',
+        'attempt_count', 'next_retry_at', 'circuit_state', 'parent_run'
     ]
 
     fieldsets = [
         ('Run Information', {
-            'fields': ['id', 'integration', 'status', 'created_at']
+            'fields': ['id', 'integration', 'status', 'created_at', 'parent_run']
         }),
         ('Condition Evaluation', {
             'fields': ['condition_display']
@@ -76,6 +78,9 @@ class IntegrationRunAdmin(admin.ModelAdmin):
         ('Response', {
             'fields': ['outgoing_response_display']
         }),
+        ('Delivery Attempts', {
+            'fields': ['attempt_count', 'next_retry_at', 'circuit_state']
+        }),
         ('Errors', {
             'fields': ['error_message']
         }),
@@ -121,3 +126,16 @@ class IntegrationRunAdmin(admin.ModelAdmin):
         return format_html('<pre>{}</pre>', json.dumps(obj.outgoing_response, indent=2))
     outgoing_response_display.short_description = 'Outgoing Response'
 
+
+
+@admin.register(WebhookJob)
+class WebhookJobAdmin(admin.ModelAdmin):
+    list_display = ['integration', 'status', 'attempts', 'locked_by', 'locked_until', 'created_at']
+    list_filter = ['status', 'integration']
+    readonly_fields = ['id', 'integration', 'run', 'status', 'attempts', 'locked_by', 'locked_until', 'created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -8,6 +8,13 @@ class IntegrationsConfig(AppConfig):
 
     def ready(self):
         """Start Pub/Sub listeners when Django starts"""
+        # Register custom mapping transforms from every installed app's transforms.py
+        from django.utils.module_loading import autodiscover_modules
+        autodiscover_modules('transforms')
+
+        # Routing cache invalidation on integration changes
+        from . import routing_cache  # noqa: F401
+
         # Only run in main process (not in reloader)
         import os
         if os.environ.get('RUN_MAIN') != 'true':
@@ -15,6 +22,10 @@ class IntegrationsConfig(AppConfig):
             
         from .models import IntegrationConfiguration
         from .pubsub_listener import start_pubsub_listener
+        from .resilience import get_retry_scheduler
+
+        # Pick up retries left behind by a previous run of the server
+        get_retry_scheduler()
         
         # Start all active Pub/Sub listeners
         try:
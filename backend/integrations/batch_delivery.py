@@ -0,0 +1,272 @@
+# batch_delivery.py
+"""
+Bulk delivery: accumulate transformed payloads per integration and send them
+to the target as one JSON array or NDJSON request.
+
+Enabled per integration with `target.batch` in config_json:
+
+    "batch": {"format": "array", "maxCount": 100, "maxBytes": 1000000, "maxLingerMs": 1000}
+
+(`"batch": true` uses the defaults). Every message is logged right away as a
+'queued' IntegrationRun; when its batch is flushed the run is updated with the
+shared request and response, identified by `outgoing_request.batch_id`.
+A batch is flushed when it reaches maxCount items or maxBytes of body, or
+maxLingerMs after its first item arrived.
+
+Batch requests go through the delivery engine, so each target host's circuit
+breaker applies to them; a failed batch is retried as a whole under the
+target's `retry` policy. Pending batches live in memory: a queued run's
+`next_retry_at` is when its batch is due, and the retry sweeper (resilience)
+puts runs abandoned by a dead process into a new batch. Fan-out targets with
+`batch` are batched per target.
+"""
+import atexit
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from django.utils import timezone
+
+from .compression import compress_body
+from .delivery_engine import DeliveryRequest, DeliveryResponse, submit_delivery
+from .http_sessions import get_origin
+from .latency_tracker import TimeoutPolicy
+from .linger_queue import LingerQueue
+from .models import IntegrationConfiguration, IntegrationRun
+from .rate_limiter import RateLimit
+from .resilience import RetryJob, get_circuit_breaker, get_retry_policy, get_retry_scheduler
+from .response_capture import CaptureOptions, response_log
+from .serialization import encode_payload
+
+BATCH_FORMATS = {
+    'array': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class BatchOptions:
+    """Parsed `target.batch` settings"""
+
+    def __init__(self, format: str = 'array', max_count: int = 100, max_bytes: int = 1000000,
+                 max_linger_ms: int = 1000):
+        if format not in BATCH_FORMATS:
+            raise ValueError(f"Unsupported batch format: {format}")
+        self.format = format
+        self.max_count = max(1, max_count)
+        self.max_bytes = max_bytes
+        self.max_linger = max_linger_ms / 1000.0
+
+    @classmethod
+    def from_config(cls, batch_config: Any) -> Optional['BatchOptions']:
+        """Options for a `target.batch` value, or None when batching is off"""
+        if batch_config is True:
+            return cls()
+        if not isinstance(batch_config, dict) or not batch_config.get('enabled', True):
+            return None
+        return cls(
+            format=batch_config.get('format', 'array'),
+            max_count=int(batch_config.get('maxCount', 100)),
+            max_bytes=int(batch_config.get('maxBytes', 1000000)),
+            max_linger_ms=int(batch_config.get('maxLingerMs', 1000)),
+        )
+
+
+def get_batch_options(integration: IntegrationConfiguration) -> Optional[BatchOptions]:
+    target_config = integration.config_json.get('target', {})
+    if target_config.get('type', 'http') == 'email' or target_config.get('method') == 'GET':
+        return None
+    return BatchOptions.from_config(target_config.get('batch'))
+
+
+class _Batch:
+    def __init__(self, integration: IntegrationConfiguration, options: BatchOptions):
+        self.integration = integration
+        self.options = options
+        self.id = str(uuid.uuid4())
+        self.run_ids: List[Any] = []
+        self.bodies: List[bytes] = []
+        self.size = 0
+        self.deadline = time.monotonic() + options.max_linger
+
+    def add(self, run_id: Any, body: bytes) -> None:
+        self.run_ids.append(run_id)
+        self.bodies.append(body)
+        self.size += len(body) + 1
+
+    def is_full(self) -> bool:
+        return len(self.bodies) >= self.options.max_count or self.size >= self.options.max_bytes
+
+    def encode(self) -> bytes:
+        if self.options.format == 'ndjson':
+            return b'\n'.join(self.bodies) + b'\n'
+        return b'[' + b','.join(self.bodies) + b']'
+
+
+class BatchDeliveryQueue(LingerQueue):
+    """Per-integration batches with a background thread flushing them"""
+
+    thread_name = 'batch-delivery'
+
+    def enqueue(self, integration: IntegrationConfiguration, options: BatchOptions,
+                incoming_payload: Dict[str, Any], transformed_payload: Dict[str, Any],
+                transformation_time: int, run_id=None, parent_run_id=None) -> Dict[str, Any]:
+        """Log a queued run for the payload (or reuse `run_id`) and add it to the integration's open batch"""
+        from .integration_processor import save_run, target_leg_info
+
+        payload = encode_payload(transformed_payload)
+        run_id = save_run(
+            integration, run_id,
+            parent_run_id=parent_run_id,
+            incoming_payload=incoming_payload,
+            transformed_payload=payload,
+            outgoing_request={'queued': True, 'batch_format': options.format, **target_leg_info(integration)},
+            outgoing_response={},
+            status='queued',
+            error_message=None,
+            transformation_time_ms=transformation_time,
+            api_call_time_ms=None,
+            # When the batch is due; the retry sweeper takes over runs still queued well after it
+            next_retry_at=timezone.now() + timedelta(seconds=options.max_linger)
+        )
+
+        key = f"{integration.id}:{getattr(integration, 'target_index', '')}"
+        # Close the open batch first if this payload would push it over maxBytes
+        self._add(key, lambda: _Batch(integration, options), lambda batch: batch.add(run_id, payload.encoded),
+                  close_first=lambda batch: batch.bodies and batch.size + len(payload.encoded) > options.max_bytes)
+
+        return {
+            'run_id': run_id,
+            'status': 'queued',
+            'message': 'Payload queued for batch delivery'
+        }
+
+    def _flush(self, batches: List[_Batch]) -> None:
+        # Send all batches concurrently, then record each one's outcome
+        in_flight = []
+        for batch in batches:
+            request = build_batch_request(batch)
+            try:
+                in_flight.append((batch, request, submit_delivery(request), None))
+            except Exception as e:
+                in_flight.append((batch, request, None, e))
+
+        for batch, request, future, error in in_flight:
+            response = None
+            if future is not None:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+            record_batch(batch, request, response, error)
+
+
+def build_batch_request(batch: _Batch) -> DeliveryRequest:
+    """Build the shared POST request for a batch"""
+    from .integration_processor import add_authentication
+
+    integration = batch.integration
+    target_config = integration.config_json.get('target', {})
+    headers = add_authentication(dict(target_config.get('headers', {})), target_config.get('authType'),
+                                 target_config.get('auth', {}))
+    headers['Content-Type'] = BATCH_FORMATS[batch.options.format]
+    body = compress_body(headers, batch.encode(), target_config.get('compression'))
+    return DeliveryRequest(integration.id, 'POST', integration.target_url, headers, body=body,
+                           timeout=TimeoutPolicy.from_config(target_config.get('timeout')),
+                           rate_limit=RateLimit.from_config(target_config.get('rateLimit')),
+                           capture=CaptureOptions.from_config(target_config.get('responseCapture')),
+                           target_index=getattr(integration, 'target_index', None))
+
+
+def record_batch(batch: _Batch, request: DeliveryRequest, response: Optional[DeliveryResponse],
+                 error: Optional[Exception], attempt: int = 1) -> None:
+    """
+    Update the runs of a batch with the shared request and its outcome. A
+    failure covered by the target's retry policy marks them 'retrying' and
+    reschedules the same request.
+    """
+    from .integration_processor import refresh_fanout_run, target_leg_info
+
+    integration = batch.integration
+    condition = integration.config_json.get('condition')
+    outgoing_request = {
+        'url': request.url,
+        'method': request.method,
+        'headers': {k: v for k, v in request.headers.items() if k.lower() != 'authorization'},
+        'batch_id': batch.id,
+        'batch_format': batch.options.format,
+        'batch_size': len(batch.run_ids),
+        'condition': condition if condition else None,
+        'condition_result': True if condition else None,
+        **target_leg_info(integration)
+    }
+
+    if response is None:
+        status, error_message = 'error', str(error)
+        outgoing_response, api_call_time = {'error': str(error)}, 0
+    else:
+        status = 'success' if response.ok else 'error'
+        error_message = None if response.ok else f"HTTP {response.status_code}"
+        outgoing_response, api_call_time = response_log(response, request.capture)[0], response.elapsed_ms
+
+    retry_delay = None
+    policy = get_retry_policy(integration)
+    if status == 'error' and policy is not None and \
+            policy.should_retry(attempt, response.status_code if response is not None else None):
+        retry_delay = policy.delay(attempt)
+        status = 'retrying'
+
+    IntegrationRun.objects.filter(id__in=batch.run_ids).update(
+        status=status,
+        error_message=error_message,
+        outgoing_request=outgoing_request,
+        outgoing_response=outgoing_response,
+        api_call_time_ms=api_call_time,
+        attempt_count=attempt,
+        next_retry_at=timezone.now() + timedelta(seconds=retry_delay) if retry_delay is not None else None,
+        circuit_state=get_circuit_breaker(get_origin(request.url)).state
+    )
+
+    if retry_delay is not None:
+        get_retry_scheduler().schedule(
+            retry_delay, RetryJob(integration.id, batch.run_ids[0], request, attempt + 1, batch=batch)
+        )
+
+    # Batched fan-out legs: bring their parent runs' status up to date
+    if getattr(integration, 'target_index', None) is not None:
+        parent_run_ids = IntegrationRun.objects.filter(id__in=batch.run_ids, parent_run__isnull=False) \
+            .values_list('parent_run_id', flat=True).distinct()
+        for parent_run_id in parent_run_ids:
+            refresh_fanout_run(parent_run_id)
+
+
+def requeue_run(run: IntegrationRun) -> None:
+    """Add a batched run abandoned by another process (queued or retrying) to this process's next batch"""
+    from .integration_processor import integration_target
+
+    integration = run.integration
+    target_index = run.outgoing_request.get('target_index')
+    if target_index is not None:
+        integration = integration_target(integration, target_index)
+    options = get_batch_options(integration)
+    if options is None:
+        raise ValueError('Batching is no longer enabled for this target')
+    get_batch_queue().enqueue(integration, options, run.incoming_payload, run.transformed_payload,
+                              run.transformation_time_ms or 0, run_id=run.id, parent_run_id=run.parent_run_id)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_batch_queue() -> BatchDeliveryQueue:
+    """Get or start the process-wide batch queue"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = BatchDeliveryQueue()
+                _queue.start()
+                atexit.register(_queue.flush_all)
+    return _queue
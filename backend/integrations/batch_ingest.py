@@ -0,0 +1,248 @@
+# batch_ingest.py
+"""
+Batch webhook ingestion: many records in one POST to /webhook/<path>/batch/.
+
+The body is either a JSON array of objects or NDJSON (one object per line);
+it is told apart by its first non-whitespace byte. The body is read in
+chunks and split into records as it arrives, and every
+WEBHOOK_BATCH_CHUNK_SIZE records are run through process_integration_batch
+(conditions, one batch transform, concurrent deliveries), or queued for the
+workers when the integration is async.
+
+A record that is not valid JSON, or not an object, is reported in the
+results by its index and does not stop the others. Array elements are split
+on top-level commas, so one malformed element is skipped like a malformed
+NDJSON line; an array that is never closed ends the batch at that element.
+With `deduplication`, an Idempotency-Key header identifies each record as
+key + its index, so a retried batch request skips the records already seen.
+If processing a chunk raises, its records are reported as errors and their
+keys released, and the other chunks are kept. If the request itself fails
+(the body cannot be read), every key it claimed is released, since the
+sender only sees an error and will retry the whole batch.
+"""
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from django.conf import settings
+
+from .dedup import claim_message, release_message
+from .models import IntegrationConfiguration
+from .serialization import loads
+
+CHUNK_SIZE = 65536
+
+_STRUCTURAL = re.compile(rb'[\[\]{}",]')
+_STRING_SPECIAL = re.compile(rb'["\\]')
+
+
+class NDJSONSplitter:
+    """Split a byte stream into lines"""
+
+    def __init__(self):
+        self._buffer = b''
+        self.done = False
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        lines = (self._buffer + chunk).split(b'\n')
+        self._buffer = lines.pop()
+        return lines
+
+    def close(self) -> Tuple[List[bytes], Optional[str]]:
+        """Remaining records and an error, if the stream ended badly"""
+        return [self._buffer], None
+
+
+class ArraySplitter:
+    """Split the bytes of a JSON array (after its opening bracket) into the raw bytes of its elements"""
+
+    def __init__(self):
+        self._element = bytearray()
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.done = False
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        elements = []
+        start = i = 0
+        while i < len(chunk) and not self.done:
+            if self._escape:
+                self._escape = False
+                i += 1
+                continue
+            match = (_STRING_SPECIAL if self._in_string else _STRUCTURAL).search(chunk, i)
+            if match is None:
+                break
+            i = match.start()
+            char = chunk[i:i + 1]
+            if self._in_string:
+                if char == b'\\':
+                    self._escape = True
+                else:
+                    self._in_string = False
+            elif char == b'"':
+                self._in_string = True
+            elif char in b'[{':
+                self._depth += 1
+            elif self._depth:
+                if char in b']}':
+                    self._depth -= 1
+            elif char in b',]':
+                # End of a top-level element; ']' also closes the array
+                self._element += chunk[start:i]
+                elements.append(bytes(self._element))
+                self._element.clear()
+                start = i + 1
+                self.done = char == b']'
+            i += 1
+        if not self.done:
+            self._element += chunk[start:]
+        return elements
+
+    def close(self) -> Tuple[List[bytes], Optional[str]]:
+        if self.done:
+            return [], None
+        return [bytes(self._element)], 'Unterminated JSON array'
+
+
+def decode_record(raw: bytes) -> Tuple[Any, Optional[str]]:
+    """(record, None) for a JSON object, or (None, error)"""
+    try:
+        record = loads(raw)
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+    if not isinstance(record, dict):
+        return None, 'Record is not a JSON object'
+    return record, None
+
+
+def iter_records(stream, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[Any, Optional[str]]]:
+    """Yield (record, error) for each record of a JSON array or NDJSON body; blank entries are skipped"""
+    splitter = None
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if splitter is None:
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+            if chunk[:1] == b'[':
+                splitter, chunk = ArraySplitter(), chunk[1:]
+            else:
+                splitter = NDJSONSplitter()
+        for raw in splitter.feed(chunk):
+            if raw.strip():
+                yield decode_record(raw)
+        if splitter.done:
+            break
+
+    if splitter is None:
+        return
+    remaining, error = splitter.close()
+    for raw in remaining:
+        if raw.strip():
+            yield (None, error) if error else decode_record(raw)
+
+
+def _chunks(records: Iterable, size: int) -> Iterator[List]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _ingest_chunk(integration: IntegrationConfiguration, chunk: List, headers: Optional[Mapping[str, str]],
+                  queue: bool, claimed: List[str]) -> List[Dict[str, Any]]:
+    """Results for one chunk of (index, (record, error)); dedup keys it claims are added to `claimed`"""
+    from .integration_processor import process_integration_batch
+    from .webhook_queue import enqueue_webhooks
+
+    results, valid, dedup_keys = [], [], []
+    for index, (record, error) in chunk:
+        if error is not None:
+            results.append({'index': index, 'status': 'error', 'message': error})
+            continue
+        duplicate, dedup_key = claim_message(integration, record, headers=headers, suffix=f':{index}')
+        if duplicate:
+            results.append({'index': index, 'status': 'duplicate'})
+            continue
+        valid.append((index, record))
+        if dedup_key is not None:
+            dedup_keys.append(dedup_key)
+            claimed.append(dedup_key)
+    if not valid:
+        return results
+
+    try:
+        if queue:
+            run_ids = enqueue_webhooks(integration, [record for _, record in valid])
+            outcomes = [{'run_id': run_id, 'status': 'queued'} for run_id in run_ids]
+        else:
+            outcomes = process_integration_batch(integration, [record for _, record in valid])
+    except Exception as e:
+        # Report the chunk as failed and let a retry of these records through
+        for dedup_key in dedup_keys:
+            release_message(dedup_key)
+        del claimed[len(claimed) - len(dedup_keys):]
+        return results + [{'index': index, 'status': 'error', 'message': str(e)} for index, _ in valid]
+
+    for (index, _), outcome in zip(valid, outcomes):
+        result = {'index': index, 'run_id': str(outcome['run_id']), 'status': outcome['status']}
+        for key in ('message', 'mapping_errors'):
+            if outcome.get(key):
+                result[key] = outcome[key]
+        results.append(result)
+    return results
+
+
+def ingest_batch(integration: IntegrationConfiguration, stream,
+                 headers: Optional[Mapping[str, str]] = None) -> Dict[str, Any]:
+    """Process (or queue, for async integrations) every record in a batch body; returns per-record results"""
+    from .webhook_queue import is_async
+
+    max_records = getattr(settings, 'WEBHOOK_BATCH_MAX_RECORDS', 10000)
+    queue = is_async(integration)
+    results = []
+    truncated = False
+
+    def numbered():
+        nonlocal truncated
+        for index, item in enumerate(iter_records(stream)):
+            if index >= max_records:
+                truncated = True
+                return
+            yield index, item
+
+    claimed = []
+    try:
+        for chunk in _chunks(numbered(), getattr(settings, 'WEBHOOK_BATCH_CHUNK_SIZE', 500)):
+            results.extend(_ingest_chunk(integration, chunk, headers, queue, claimed))
+    except Exception:
+        for dedup_key in claimed:
+            release_message(dedup_key)
+        raise
+
+    results.sort(key=lambda result: result['index'])
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    failed = summary.get('error', 0)
+    if not results:
+        status = 'success'
+    elif failed == len(results):
+        status = 'error'
+    elif failed or truncated:
+        status = 'partial'
+    else:
+        status = 'accepted' if queue else 'success'
+
+    response = {'status': status, 'count': len(results), 'summary': summary, 'results': results}
+    if truncated:
+        response['truncated'] = True
+        response['message'] = f"Only the first {max_records} records were read"
+    return response
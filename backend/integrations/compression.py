@@ -0,0 +1,93 @@
+# compression.py
+"""
+Optional compression of outgoing request bodies.
+
+Enabled per integration with `target.compression`:
+
+    "compression": "gzip"
+    "compression": {"algorithm": "zstd", "minBytes": 2048, "level": 3}
+
+Bodies smaller than `minBytes` (COMPRESSION_MIN_BYTES by default) are sent
+as is. The body is compressed once when the request is built; retries send
+the same compressed bytes. zstd needs the `zstandard` package; without it
+gzip is used instead (logged once). A missing or false value, or "none",
+leaves compression off.
+"""
+import gzip
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_zstd_fallback_logged = False
+
+DEFAULT_LEVELS = {
+    'gzip': 6,
+    'zstd': 3,
+}
+
+
+class CompressionOptions:
+    """Parsed `target.compression` settings"""
+
+    __slots__ = ('algorithm', 'min_bytes', 'level')
+
+    def __init__(self, algorithm: str = 'gzip', min_bytes: Optional[int] = None, level: Optional[int] = None):
+        if algorithm not in DEFAULT_LEVELS:
+            raise ValueError(f"Unsupported compression: {algorithm}")
+        if algorithm == 'zstd' and zstandard is None:
+            _log_zstd_fallback()
+            algorithm, level = 'gzip', None
+        self.algorithm = algorithm
+        self.min_bytes = min_bytes if min_bytes is not None else getattr(settings, 'COMPRESSION_MIN_BYTES', 1024)
+        self.level = level if level is not None else DEFAULT_LEVELS[algorithm]
+
+    @classmethod
+    def from_config(cls, compression_config: Any) -> Optional['CompressionOptions']:
+        """Options for a `target.compression` value, or None when compression is off"""
+        if not compression_config or _is_none(compression_config):
+            return None
+        if isinstance(compression_config, str):
+            return cls(compression_config)
+        if not isinstance(compression_config, dict) or not compression_config.get('enabled', True) or \
+                _is_none(compression_config.get('algorithm')):
+            return None
+        return cls(
+            algorithm=compression_config.get('algorithm', 'gzip'),
+            min_bytes=compression_config.get('minBytes'),
+            level=compression_config.get('level'),
+        )
+
+    def compress(self, body: bytes) -> bytes:
+        if self.algorithm == 'zstd':
+            return zstandard.ZstdCompressor(level=self.level).compress(body)
+        # mtime=0 keeps the output identical for identical bodies
+        return gzip.compress(body, compresslevel=self.level, mtime=0)
+
+
+def _is_none(value: Any) -> bool:
+    return isinstance(value, str) and value.lower() == 'none'
+
+
+def _log_zstd_fallback() -> None:
+    global _zstd_fallback_logged
+    if not _zstd_fallback_logged:
+        _zstd_fallback_logged = True
+        print("Warning: zstandard not installed. zstd compression falls back to gzip.")
+
+
+def compress_body(headers: Dict[str, str], body: bytes, compression_config: Any) -> bytes:
+    """
+    Compress a request body per `target.compression`, setting Content-Encoding
+    in `headers`. Returns the body unchanged when compression is off or the
+    body is under the size threshold.
+    """
+    options = CompressionOptions.from_config(compression_config)
+    if options is None or len(body) < options.min_bytes:
+        return body
+    headers['Content-Encoding'] = options.algorithm
+    return options.compress(body)
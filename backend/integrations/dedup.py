@@ -0,0 +1,251 @@
+# dedup.py
+"""
+Duplicate suppression at ingestion.
+
+Enabled per integration with `deduplication` in its config:
+
+    "deduplication": true
+    "deduplication": {"key": "fields", "fields": ["order.id", "event"], "ttlSeconds": 3600}
+
+`key` picks what identifies a message:
+
+- "header": the Idempotency-Key request header (or `header`)
+- "messageId": the Pub/Sub message id
+- "fields": a hash of the listed payload fields (the whole payload without `fields`)
+- "auto" (default): the first of these that is available
+
+A message whose key was seen within `ttlSeconds` (DEDUP_TTL_SECONDS) is
+answered as a duplicate before it is transformed, and no run is logged.
+A hash of the whole payload cannot tell a redelivery from a legitimately
+repeated event (the same alert firing twice), so without an explicit
+`ttlSeconds` it is only remembered for DEDUP_PAYLOAD_TTL_SECONDS, which
+covers sender retries. List `fields` (or use a header or messageId) to
+deduplicate on a real event id for the full TTL.
+If processing raises, the key is released so the sender's retry goes through.
+
+Seen keys are shared through Redis (SET NX EX on REDIS_URL) and otherwise
+kept in a per-process LRU of DEDUP_LOCAL_MAX_KEYS entries; while Redis is
+unreachable the local store is used.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .field_paths import get_cached_getter
+from .models import IntegrationConfiguration
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+KEY_SOURCES = ('auto', 'header', 'messageId', 'fields')
+
+
+class DedupOptions:
+    """Parsed `deduplication` settings"""
+
+    __slots__ = ('key', 'header', 'fields', 'ttl', 'payload_ttl')
+
+    def __init__(self, key: str = 'auto', header: str = 'Idempotency-Key', fields: Optional[list] = None,
+                 ttl: Optional[int] = None):
+        if key not in KEY_SOURCES:
+            raise ValueError(f"Unsupported deduplication key: {key}")
+        self.key = key
+        self.header = header
+        self.fields = fields
+        self.ttl = int(ttl if ttl is not None else getattr(settings, 'DEDUP_TTL_SECONDS', 86400))
+        # Whole-payload hashes: only an explicit ttlSeconds keeps them for longer than sender retries take
+        self.payload_ttl = int(ttl if ttl is not None else getattr(settings, 'DEDUP_PAYLOAD_TTL_SECONDS', 300))
+
+    @classmethod
+    def from_config(cls, dedup_config: Any) -> Optional['DedupOptions']:
+        """Options for a `deduplication` value, or None when deduplication is off"""
+        if dedup_config is True:
+            return cls()
+        if not isinstance(dedup_config, dict) or not dedup_config.get('enabled', True):
+            return None
+        return cls(
+            key=dedup_config.get('key', 'auto'),
+            header=dedup_config.get('header', 'Idempotency-Key'),
+            fields=dedup_config.get('fields'),
+            ttl=dedup_config.get('ttlSeconds'),
+        )
+
+    def message_key(self, payload: Any, headers: Optional[Mapping[str, str]] = None,
+                    message_id: Optional[str] = None) -> Optional[str]:
+        """The message's identity, or None if the configured source is missing"""
+        if self.key in ('auto', 'header') and headers is not None and headers.get(self.header):
+            return f"header:{headers.get(self.header)}"
+        if self.key in ('auto', 'messageId') and message_id:
+            return f"messageId:{message_id}"
+        if self.key in ('auto', 'fields'):
+            if not self.fields:
+                return 'payload:' + json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+            values = [get_cached_getter(path)(payload) for path in self.fields]
+            return 'fields:' + json.dumps(values, sort_keys=True, separators=(',', ':'), default=str)
+        return None
+
+    def ttl_for(self, message_key: str) -> int:
+        """How long a key is remembered: shorter for whole-payload hashes"""
+        return self.payload_ttl if message_key.startswith('payload:') else self.ttl
+
+
+class LocalSeenKeys:
+    """In-process LRU of seen keys with expiry times"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._keys: 'OrderedDict[str, float]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, key: str, ttl: int) -> bool:
+        """Record a key; False if it was already there and unexpired"""
+        now = time.monotonic()
+        with self._lock:
+            expires = self._keys.get(key)
+            if expires is not None and expires > now:
+                self._keys.move_to_end(key)
+                return False
+            self._keys[key] = now + ttl
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+            return True
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._keys.pop(key, None)
+
+
+class RedisSeenKeys:
+    """Seen keys shared through Redis"""
+
+    def __init__(self, redis_url: str):
+        self.client = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+
+    def add(self, key: str, ttl: int) -> bool:
+        return bool(self.client.set(key, 1, nx=True, ex=ttl))
+
+    def discard(self, key: str) -> None:
+        self.client.delete(key)
+
+
+class DuplicateFilter:
+    """Records message keys in Redis, falling back to the local LRU when Redis fails; counts duplicates"""
+
+    def __init__(self, redis_url: Optional[str] = None, max_local_keys: int = 100000):
+        self.local = LocalSeenKeys(max_local_keys)
+        self.shared = RedisSeenKeys(redis_url) if redis_url and redis is not None else None
+        self._shared_down_until = 0.0
+        self._lock = threading.Lock()
+        self.duplicates: Dict[str, int] = {}
+
+    @property
+    def backend(self) -> str:
+        return 'redis' if self.shared is not None and time.monotonic() >= self._shared_down_until else 'local'
+
+    def _store(self):
+        return self.shared if self.backend == 'redis' else self.local
+
+    def first_seen(self, key: str, ttl: int) -> bool:
+        store = self._store()
+        try:
+            return store.add(key, ttl)
+        except Exception as e:
+            if store is self.local:
+                raise
+            print(f"Deduplication: Redis unavailable ({e}), using in-process keys")
+            self._shared_down_until = time.monotonic() + 30
+            return self.local.add(key, ttl)
+
+    def release(self, key: str) -> None:
+        try:
+            self._store().discard(key)
+        except Exception as e:
+            print(f"Deduplication: could not release key ({e})")
+
+    def record_duplicate(self, integration_id: Any) -> None:
+        with self._lock:
+            self.duplicates[str(integration_id)] = self.duplicates.get(str(integration_id), 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'backend': self.backend, 'duplicates': dict(self.duplicates)}
+
+
+_filter = None
+_filter_lock = threading.Lock()
+
+
+def get_duplicate_filter() -> DuplicateFilter:
+    """Get or create the process-wide duplicate filter"""
+    global _filter
+    if _filter is None:
+        with _filter_lock:
+            if _filter is None:
+                _filter = DuplicateFilter(
+                    redis_url=getattr(settings, 'REDIS_URL', None),
+                    max_local_keys=getattr(settings, 'DEDUP_LOCAL_MAX_KEYS', 100000),
+                )
+    return _filter
+
+
+def claim_message(integration: IntegrationConfiguration, payload: Any, headers: Optional[Mapping[str, str]] = None,
+                  message_id: Optional[str] = None, suffix: str = '') -> Tuple[bool, Optional[str]]:
+    """
+    Record a message's key for the integration. Returns (duplicate, key);
+    pass the key to release_message if processing fails. `suffix` tells
+    apart records sharing one request header (batch webhooks).
+    """
+    options = DedupOptions.from_config(integration.config_json.get('deduplication'))
+    if options is None:
+        return False, None
+    message_key = options.message_key(payload, headers, message_id)
+    if message_key is None:
+        return False, None
+    if suffix and message_key.startswith('header:'):
+        message_key += suffix
+    key = f"dedup:{integration.id}:{hashlib.sha256(message_key.encode('utf-8')).hexdigest()}"
+
+    duplicate_filter = get_duplicate_filter()
+    if duplicate_filter.first_seen(key, options.ttl_for(message_key)):
+        return False, key
+    duplicate_filter.record_duplicate(integration.id)
+    return True, key
+
+
+async def aclaim_message(integration: IntegrationConfiguration, payload: Any,
+                         headers: Optional[Mapping[str, str]] = None,
+                         message_id: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+    """claim_message for async views; only a Redis round trip is moved off the event loop"""
+    if not integration.config_json.get('deduplication') or get_duplicate_filter().backend == 'local':
+        return claim_message(integration, payload, headers, message_id)
+    return await sync_to_async(claim_message, thread_sensitive=False)(integration, payload, headers, message_id)
+
+
+def release_message(key: Optional[str]) -> None:
+    """Forget a claimed key so a retry of the message is processed"""
+    if key is not None:
+        get_duplicate_filter().release(key)
+
+
+async def arelease_message(key: Optional[str]) -> None:
+    """release_message for async views; only a Redis round trip is moved off the event loop"""
+    if key is None or get_duplicate_filter().backend == 'local':
+        release_message(key)
+    else:
+        await sync_to_async(release_message, thread_sensitive=False)(key)
+
+
+def duplicate_result() -> Dict[str, Any]:
+    return {
+        'status': 'duplicate',
+        'message': 'Duplicate message ignored'
+    }
@@ -0,0 +1,294 @@
+# delivery_engine.py
+"""
+Asyncio delivery engine for outbound HTTP requests.
+
+One event loop, running on a background thread, multiplexes all in-flight
+deliveries of the process. Requests are sent with httpx when it is
+installed; otherwise the pooled `requests` sessions run in the loop's
+thread pool. Requests first wait for their rate-limit tokens, concurrency
+is capped per integration and per target host, and each host's circuit
+breaker is checked before a request is sent. Connect and read timeouts
+adapt to each host's observed latency (see latency_tracker).
+
+Callers submit a DeliveryRequest and get a concurrent.futures.Future back,
+so any thread can fan out many deliveries and then wait for them.
+`send_delivery` is the blocking wrapper used by the synchronous views.
+Recording runs stays with the caller, on its own thread and DB connection.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlencode, urlsplit, urlunsplit
+
+import requests
+
+from django.conf import settings
+
+from .http_sessions import async_client_stats, create_async_client, get_origin, get_session, get_session_registry
+from .latency_tracker import TimeoutPolicy, record_latency
+from .rate_limiter import RateLimit, get_rate_limiter, host_rate_limit
+from .resilience import get_circuit_breaker
+from .response_capture import CHUNK_SIZE, CaptureOptions, StreamCapture
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+TIMEOUT_ERRORS = (requests.exceptions.Timeout, httpx.TimeoutException) if httpx is not None \
+    else (requests.exceptions.Timeout,)
+
+
+def url_with_params(url: str, params: Any) -> str:
+    """
+    `url` with `params` appended to its query string the way requests does it,
+    for httpx (which replaces an existing query and encodes values its own
+    way): None values are dropped, lists repeat the key and everything else
+    goes through str(), so True is sent as "True".
+    """
+    if not params:
+        return url
+    pairs = []
+    for key, values in (params.items() if isinstance(params, dict) else params):
+        if isinstance(values, (str, bytes)) or not hasattr(values, '__iter__'):
+            values = [values]
+        pairs.extend((key, value) for value in values if value is not None)
+    query = urlencode(pairs, doseq=True)
+    if not query:
+        return url
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(query=f"{parts.query}&{query}" if parts.query else query))
+
+
+class DeliveryRequest:
+    """An outbound HTTP request prepared by the processor"""
+
+    __slots__ = ('integration_id', 'method', 'url', 'headers', 'params', 'body', 'payload', 'timeout',
+                 'rate_limit', 'capture', 'target_index')
+
+    def __init__(self, integration_id: Any, method: str, url: str, headers: Dict[str, str],
+                 params: Optional[Dict[str, Any]] = None, body: Optional[bytes] = None,
+                 payload: Any = None, timeout: Optional[TimeoutPolicy] = None, rate_limit: Optional[RateLimit] = None,
+                 capture: Optional[CaptureOptions] = None, target_index: Optional[int] = None):
+        self.integration_id = str(integration_id)
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.params = params
+        self.body = body
+        self.payload = payload  # the transformed payload the body was encoded from
+        self.timeout = timeout or TimeoutPolicy()  # resolved per attempt against the origin's latency
+        self.rate_limit = rate_limit  # the integration's `target.rateLimit`
+        self.capture = capture or CaptureOptions()
+        self.target_index = target_index  # fan-out leg, which has its own rateLimit bucket
+
+
+class DeliveryResponse:
+    """The parts of a target's response that are logged on the run"""
+
+    __slots__ = ('status_code', 'headers', 'content', 'encoding', 'elapsed_ms', 'size', 'sha256', 'complete')
+
+    def __init__(self, status_code: int, headers: Dict[str, str], content: bytes,
+                 encoding: Optional[str], elapsed_ms: int, size: Optional[int] = None,
+                 sha256: Optional[str] = None, complete: bool = True):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content  # the captured prefix of the body
+        self.encoding = encoding
+        self.elapsed_ms = elapsed_ms
+        self.size = len(content) if size is None else size
+        self.sha256 = sha256
+        self.complete = complete
+
+    @classmethod
+    def from_capture(cls, status_code: int, headers: Dict[str, str], encoding: Optional[str],
+                     capture: StreamCapture) -> 'DeliveryResponse':
+        return cls(status_code, headers, bytes(capture.buffer), encoding, 0,
+                   size=capture.size, sha256=capture.sha256, complete=capture.complete)
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def truncated(self) -> bool:
+        return self.size > len(self.content)
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+
+class DeliveryEngine:
+    """Background event loop sending DeliveryRequests with per-integration and per-host limits"""
+
+    def __init__(self, per_integration: int = 10, per_host: int = 50, max_connections: int = 1000):
+        self.per_integration = per_integration
+        self.per_host = per_host
+        self.max_connections = max_connections
+        self._integration_limits: Dict[str, asyncio.Semaphore] = {}
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._client = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='delivery-engine', daemon=True)
+        self._thread.start()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def submit(self, request: DeliveryRequest) -> Future:
+        """Schedule a delivery from any thread"""
+        return asyncio.run_coroutine_threadsafe(self.send(request), self._loop)
+
+    async def send(self, request: DeliveryRequest) -> DeliveryResponse:
+        """Send one request on the engine loop, waiting for its rate budget and a free slot first"""
+        origin = get_origin(request.url)
+        await self._wait_for_rate_limits(request, origin)
+
+        integration_limit = self._integration_limits.get(request.integration_id)
+        if integration_limit is None:
+            integration_limit = self._integration_limits[request.integration_id] = asyncio.Semaphore(self.per_integration)
+        host_limit = self._host_limits.get(origin)
+        if host_limit is None:
+            host_limit = self._host_limits[origin] = asyncio.Semaphore(self.per_host)
+
+        async with integration_limit, host_limit:
+            # Fails fast with CircuitOpenError while the host is considered down
+            breaker = get_circuit_breaker(origin)
+            breaker.before_request()
+            timeouts = request.timeout.resolve(origin)
+            start = time.time()
+            try:
+                if httpx is not None:
+                    response = await self._send_httpx(request, timeouts)
+                else:
+                    response = await self._loop.run_in_executor(None, self._send_requests, request, timeouts)
+            except BaseException as e:
+                breaker.record_failure()
+                if isinstance(e, TIMEOUT_ERRORS):
+                    # Timed-out attempts count at their elapsed time so a slower target raises its p99
+                    record_latency(origin, (time.time() - start) * 1000)
+                raise
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            response.elapsed_ms = int((time.time() - start) * 1000)
+            record_latency(origin, response.elapsed_ms)
+            return response
+
+    async def _wait_for_rate_limits(self, request: DeliveryRequest, origin: str) -> None:
+        """Reserve tokens from the integration (or fan-out leg) and host buckets and sleep until they are due"""
+        buckets = []
+        if request.rate_limit is not None:
+            key = f"integration:{request.integration_id}"
+            if request.target_index is not None:
+                key += f":targets[{request.target_index}]"
+            buckets.append((key, request.rate_limit))
+        host_limit = host_rate_limit(origin)
+        if host_limit is not None:
+            buckets.append((f"host:{origin}", host_limit))
+        if not buckets:
+            return
+
+        limiter = get_rate_limiter()
+        if limiter.backend == 'redis':
+            wait = await self._loop.run_in_executor(None, limiter.reserve_all, buckets)
+        else:
+            wait = limiter.reserve_all(buckets)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _send_httpx(self, request: DeliveryRequest, timeouts: Tuple[float, float]) -> DeliveryResponse:
+        if self._client is None:
+            self._client = create_async_client(self.max_connections)
+        capture = StreamCapture(request.capture)
+        async with self._client.stream(
+            request.method, url_with_params(request.url, request.params), content=request.body,
+            headers=request.headers, timeout=httpx.Timeout(timeouts[1], connect=timeouts[0])
+        ) as response:
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                if not capture.feed(chunk):
+                    break
+            return DeliveryResponse.from_capture(response.status_code, dict(response.headers),
+                                                 response.encoding, capture)
+
+    @staticmethod
+    def _send_requests(request: DeliveryRequest, timeouts: Tuple[float, float]) -> DeliveryResponse:
+        capture = StreamCapture(request.capture)
+        response = get_session(request.url).request(
+            request.method, request.url, params=request.params, data=request.body,
+            headers=request.headers, timeout=timeouts, stream=True
+        )
+        # A fully read body releases the connection to the pool; close() drops it otherwise
+        with response:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if not capture.feed(chunk):
+                    break
+            return DeliveryResponse.from_capture(response.status_code, dict(response.headers),
+                                                 response.encoding, capture)
+
+    def close(self) -> None:
+        """Close the HTTP client and stop the loop"""
+        async def shutdown():
+            if self._client is not None:
+                await self._client.aclose()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Connection pool statistics per origin, for the transport the engine sends with"""
+        if httpx is None:
+            return get_session_registry().stats()
+        return async_client_stats(self._client) if self._client is not None else {}
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests currently waiting for or holding a slot, per integration and host"""
+        def in_use(limits: Dict[str, asyncio.Semaphore], size: int) -> Dict[str, int]:
+            return {key: size - semaphore._value for key, semaphore in list(limits.items()) if semaphore._value < size}
+
+        return {
+            'backend': 'httpx' if httpx is not None else 'requests',
+            'per_integration_limit': self.per_integration,
+            'per_host_limit': self.per_host,
+            'active_by_integration': in_use(self._integration_limits, self.per_integration),
+            'active_by_host': in_use(self._host_limits, self.per_host),
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_delivery_engine() -> DeliveryEngine:
+    """Get or start the process-wide delivery engine"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = DeliveryEngine(
+                    per_integration=getattr(settings, 'DELIVERY_MAX_CONCURRENCY_PER_INTEGRATION', 10),
+                    per_host=getattr(settings, 'DELIVERY_MAX_CONCURRENCY_PER_HOST', 50),
+                    max_connections=getattr(settings, 'DELIVERY_MAX_CONNECTIONS', 1000),
+                )
+    return _engine
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """HTTP connection pool statistics of the running engine (empty before its first delivery)"""
+    return _engine.pool_stats() if _engine is not None else {}
+
+
+def submit_delivery(request: DeliveryRequest) -> Future:
+    """Queue a delivery on the engine; the future resolves to a DeliveryResponse"""
+    return get_delivery_engine().submit(request)
+
+
+def send_delivery(request: DeliveryRequest) -> DeliveryResponse:
+    """Deliver and wait for the response (synchronous wrapper)"""
+    return submit_delivery(request).result()
@@ -0,0 +1,251 @@
+# email_digest.py
+"""
+Email digests: collect the transformed payloads of an email integration and
+send them as one email with a table of all records.
+
+Enabled with `emailConfig.digest`:
+
+    "digest": {"windowSeconds": 300, "maxCount": 50, "subject": "Order alerts"}
+
+(`"digest": true` uses the defaults, and an email fan-out target can set its
+own). Each message is logged right away as a
+'queued' IntegrationRun; when the digest is sent the runs are updated with the
+email's details, identified by `outgoing_request.digest_id`. A digest is sent
+`windowSeconds` after its first message arrived, or as soon as it holds
+`maxCount` messages.
+
+Open digests live in memory, but every message is already stored on its
+queued run, whose `next_retry_at` is when the digest is due. Runs still
+queued RETRY_SWEEP_GRACE_SECONDS after that (the process died) are put into
+a new digest by the retry sweeper (resilience), so alerts are delayed, not lost.
+"""
+import atexit
+import html
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.utils import timezone
+
+from .linger_queue import LingerQueue
+from .models import IntegrationConfiguration, IntegrationRun
+
+# Longest value shown in a plain text table cell
+TEXT_CELL_WIDTH = 40
+
+
+class DigestOptions:
+    """Parsed `emailConfig.digest` settings"""
+
+    def __init__(self, window_seconds: float = 300, max_count: int = 50, subject: Optional[str] = None):
+        self.window_seconds = window_seconds
+        self.max_count = max(1, max_count)
+        self.subject = subject
+
+    @classmethod
+    def from_config(cls, digest_config: Any) -> Optional['DigestOptions']:
+        """Options for an `emailConfig.digest` value, or None when digests are off"""
+        if digest_config is True:
+            return cls()
+        if not isinstance(digest_config, dict) or not digest_config.get('enabled', True):
+            return None
+        return cls(
+            window_seconds=float(digest_config.get('windowSeconds', 300)),
+            max_count=int(digest_config.get('maxCount', 50)),
+            subject=digest_config.get('subject'),
+        )
+
+
+class _Digest:
+    def __init__(self, integration: IntegrationConfiguration, options: DigestOptions):
+        self.integration = integration
+        self.options = options
+        self.run_ids: List[Any] = []
+        self.payloads: List[Dict[str, Any]] = []
+        self.deadline = time.monotonic() + options.window_seconds
+
+    def add(self, run_id: Any, payload: Dict[str, Any]) -> None:
+        self.run_ids.append(run_id)
+        self.payloads.append(payload)
+
+    def is_full(self) -> bool:
+        return len(self.payloads) >= self.options.max_count
+
+
+def render_table(payloads: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """Render records as a compact (plain text, HTML) table, one row per record"""
+    from .integration_processor import flatten_dict
+
+    rows = [flatten_dict(payload) if isinstance(payload, dict) else {'value': payload} for payload in payloads]
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    cells = [['' if row.get(column) is None else str(row[column]) for column in columns] for row in rows]
+
+    def clip(value: str) -> str:
+        value = ' '.join(value.split())
+        return value if len(value) <= TEXT_CELL_WIDTH else value[:TEXT_CELL_WIDTH - 1] + '…'
+
+    clipped = [[clip(value) for value in row] for row in cells]
+    widths = [max([len(column)] + [len(row[index]) for row in clipped]) for index, column in enumerate(columns)]
+    lines = [
+        ' | '.join(column.ljust(width) for column, width in zip(columns, widths)),
+        '-+-'.join('-' * width for width in widths),
+    ]
+    lines.extend(' | '.join(value.ljust(width) for value, width in zip(row, widths)) for row in clipped)
+    text = '\n'.join(line.rstrip() for line in lines)
+
+    header = ''.join(f'<th>{html.escape(column)}</th>' for column in columns)
+    body = ''.join('<tr>' + ''.join(f'<td>{html.escape(value)}</td>' for value in row) + '</tr>' for row in cells)
+    table = (
+        '<table border="1" cellpadding="4" cellspacing="0" style="border-collapse: collapse; font-size: 12px;">'
+        f'<thead><tr>{header}</tr></thead><tbody>{body}</tbody></table>'
+    )
+    return text, table
+
+
+class DigestQueue(LingerQueue):
+    """Per-integration digests, sent by a background thread when their window closes or they fill up"""
+
+    thread_name = 'email-digests'
+
+    def enqueue(self, integration: IntegrationConfiguration, options: DigestOptions,
+                incoming_payload: Dict[str, Any], transformed_payload: Dict[str, Any],
+                transformation_time: int, condition: str = None, condition_result: bool = True,
+                run_id=None, parent_run_id=None) -> Dict[str, Any]:
+        """Log a queued run for the payload (or reuse `run_id`) and add it to the integration's open digest"""
+        from .integration_processor import save_run, target_leg_info
+
+        run_id = save_run(
+            integration, run_id,
+            parent_run_id=parent_run_id,
+            incoming_payload=incoming_payload,
+            transformed_payload=transformed_payload,
+            outgoing_request={
+                'type': 'email',
+                'queued': True,
+                'digest': True,
+                'condition': condition if condition else None,
+                'condition_result': condition_result if condition else None,
+                **target_leg_info(integration)
+            },
+            outgoing_response={},
+            status='queued',
+            error_message=None,
+            transformation_time_ms=transformation_time,
+            api_call_time_ms=None,
+            # When the digest is due; the retry sweeper takes over runs still queued well after it
+            next_retry_at=timezone.now() + timedelta(seconds=options.window_seconds)
+        )
+
+        key = f"{integration.id}:{getattr(integration, 'target_index', '')}"
+        self._add(key, lambda: _Digest(integration, options),
+                  lambda digest: digest.add(run_id, transformed_payload))
+
+        return {
+            'run_id': run_id,
+            'status': 'queued',
+            'message': 'Payload queued for the next email digest'
+        }
+
+    def _flush(self, digests: List[_Digest]) -> None:
+        for digest in digests:
+            send_digest(digest)
+
+
+def send_digest(digest: _Digest) -> None:
+    """Send one digest email and update its queued runs with the outcome"""
+    from .integration_processor import send_email_body, target_leg_info
+
+    condition = digest.integration.config_json.get('condition')
+    email_config = digest.integration.config_json.get('target', {}).get('emailConfig', {})
+    count = len(digest.run_ids)
+    subject = digest.options.subject or email_config.get('subject', 'Integration Notification')
+    subject = f"{subject} ({count} message{'s' if count != 1 else ''})"
+    text_table, html_table = render_table(digest.payloads)
+
+    outgoing_request = {
+        'type': 'email',
+        'digest_id': str(uuid.uuid4()),
+        'digest_size': count,
+        'smtp_server': email_config.get('smtpServer'),
+        'from': email_config.get('fromEmail'),
+        'subject': subject,
+        'condition': condition if condition else None,
+        'condition_result': True if condition else None,
+        **target_leg_info(digest.integration)
+    }
+    try:
+        sent = send_email_body(email_config, subject, text_table,
+                               f'<p>{count} message(s)</p>{html_table}')
+    except Exception as e:
+        IntegrationRun.objects.filter(id__in=digest.run_ids).update(
+            next_retry_at=None,
+            status='error',
+            error_message=str(e),
+            outgoing_request=outgoing_request,
+            outgoing_response={'error': str(e)},
+            api_call_time_ms=0
+        )
+        refresh_parent_runs(digest)
+        return
+
+    outgoing_request['to'] = sent['to']
+    IntegrationRun.objects.filter(id__in=digest.run_ids).update(
+        next_retry_at=None,
+        status='success',
+        error_message=None,
+        outgoing_request=outgoing_request,
+        outgoing_response={
+            'status': 'sent',
+            'recipients': sent['to'],
+            'message': f'Digest email sent with {count} message(s)'
+        },
+        api_call_time_ms=sent['email_time']
+    )
+    refresh_parent_runs(digest)
+
+
+def refresh_parent_runs(digest: _Digest) -> None:
+    """Digested fan-out legs: bring their parent runs' status up to date"""
+    from .integration_processor import refresh_fanout_run
+
+    if getattr(digest.integration, 'target_index', None) is None:
+        return
+    parent_run_ids = IntegrationRun.objects.filter(id__in=digest.run_ids, parent_run__isnull=False) \
+        .values_list('parent_run_id', flat=True).distinct()
+    for parent_run_id in parent_run_ids:
+        refresh_fanout_run(parent_run_id)
+
+
+def requeue_run(run: IntegrationRun) -> None:
+    """Add a queued digest run abandoned by another process to this process's next digest"""
+    from .integration_processor import integration_target
+
+    integration = run.integration
+    target_index = run.outgoing_request.get('target_index')
+    if target_index is not None:
+        integration = integration_target(integration, target_index)
+    options = DigestOptions.from_config(integration.config_json.get('target', {}).get('emailConfig', {}).get('digest'))
+    if options is None:
+        raise ValueError('Digests are no longer enabled for this target')
+    get_digest_queue().enqueue(integration, options, run.incoming_payload, run.transformed_payload,
+                               run.transformation_time_ms or 0, run.outgoing_request.get('condition'),
+                               run.outgoing_request.get('condition_result') is not False, run_id=run.id,
+                               parent_run_id=run.parent_run_id)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_digest_queue() -> DigestQueue:
+    """Get or start the process-wide digest queue"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = DigestQueue()
+                _queue.start()
+                atexit.register(_queue.flush_all)
+    return _queue
@@ -0,0 +1,717 @@
+# expression_engine.py
+"""
+Native evaluator for the common JavaScript subset used in conditions and
+`jsCode` mappings, e.g.
+
+    return fields['status'] === 'paid' && fields['amount'] > 100;
+
+Code is tokenized and parsed once into a small AST, which is compiled into
+nested Python closures. Anything outside the subset (statements, assignments,
+functions, unknown identifiers or methods) raises ExpressionSyntaxError so the
+caller can fall back to the full JavaScript engine.
+"""
+import math
+import re
+from typing import Any, Callable, List, Tuple
+
+
+class ExpressionSyntaxError(ValueError):
+    """Raised when code is not valid or falls outside the supported subset"""
+
+
+class _Undefined:
+    """JavaScript `undefined`"""
+
+    def __repr__(self):
+        return 'undefined'
+
+    def __bool__(self):
+        return False
+
+
+UNDEFINED = _Undefined()
+
+
+# ---------------------------------------------------------------------------
+# JavaScript value semantics
+# ---------------------------------------------------------------------------
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def to_boolean(value: Any) -> bool:
+    """JavaScript truthiness ([] and {} are truthy, NaN is not)"""
+    if value is None or value is UNDEFINED:
+        return False
+    if isinstance(value, bool):
+        return value
+    if _is_number(value):
+        return value != 0 and value == value
+    if isinstance(value, str):
+        return value != ''
+    return True
+
+
+def to_number(value: Any) -> Any:
+    """JavaScript ToNumber"""
+    if isinstance(value, bool):
+        return 1 if value else 0
+    if _is_number(value):
+        return value
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        text = value.strip()
+        if text == '':
+            return 0
+        try:
+            if text.lower().startswith(('0x', '-0x', '+0x')):
+                return int(text, 16)
+            number = float(text)
+            return int(number) if number.is_integer() and 'e' not in text.lower() and '.' not in text else number
+        except ValueError:
+            return math.nan
+    if isinstance(value, list):
+        return to_number(to_js_string(value))
+    return math.nan
+
+
+def to_js_string(value: Any) -> str:
+    """JavaScript ToString"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if value is None:
+        return 'null'
+    if value is UNDEFINED:
+        return 'undefined'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if math.isinf(value):
+            return 'Infinity' if value > 0 else '-Infinity'
+        if value.is_integer() and abs(value) < 1e21:
+            return str(int(value))
+        return repr(value)
+    if isinstance(value, list):
+        return ','.join('' if item is None or item is UNDEFINED else to_js_string(item) for item in value)
+    return '[object Object]'
+
+
+def typeof(value: Any) -> str:
+    if value is UNDEFINED:
+        return 'undefined'
+    if isinstance(value, bool):
+        return 'boolean'
+    if _is_number(value):
+        return 'number'
+    if isinstance(value, str):
+        return 'string'
+    return 'object'
+
+
+def strict_equals(left: Any, right: Any) -> bool:
+    if _is_number(left) and _is_number(right):
+        return left == right
+    if isinstance(left, (str, bool)) or isinstance(right, (str, bool)):
+        return type(left) is type(right) and left == right
+    if left is None or left is UNDEFINED or right is None or right is UNDEFINED:
+        return left is right
+    return left is right
+
+
+def loose_equals(left: Any, right: Any) -> bool:
+    left_nullish = left is None or left is UNDEFINED
+    right_nullish = right is None or right is UNDEFINED
+    if left_nullish or right_nullish:
+        return left_nullish and right_nullish
+    if isinstance(left, bool):
+        return loose_equals(to_number(left), right)
+    if isinstance(right, bool):
+        return loose_equals(left, to_number(right))
+    if _is_number(left) and isinstance(right, str):
+        return left == to_number(right)
+    if isinstance(left, str) and _is_number(right):
+        return to_number(left) == right
+    if isinstance(left, (list, dict)) and not isinstance(right, (list, dict)):
+        return loose_equals(to_js_string(left), right)
+    if isinstance(right, (list, dict)) and not isinstance(left, (list, dict)):
+        return loose_equals(left, to_js_string(right))
+    return strict_equals(left, right)
+
+
+def _compare(left: Any, right: Any, op: Callable[[Any, Any], bool]) -> bool:
+    if isinstance(left, str) and isinstance(right, str):
+        return op(left, right)
+    left, right = to_number(left), to_number(right)
+    if left != left or right != right:
+        return False
+    return op(left, right)
+
+
+def _add(left: Any, right: Any) -> Any:
+    if isinstance(left, (str, list, dict)) or isinstance(right, (str, list, dict)):
+        return to_js_string(left) + to_js_string(right)
+    return to_number(left) + to_number(right)
+
+
+def _divide(left: Any, right: Any) -> Any:
+    left, right = to_number(left), to_number(right)
+    if right == 0:
+        if left == 0 or left != left:
+            return math.nan
+        return math.copysign(math.inf, left) * math.copysign(1, right)
+    return left / right
+
+
+def _remainder(left: Any, right: Any) -> Any:
+    left, right = to_number(left), to_number(right)
+    if right == 0 or math.isinf(left):
+        return math.nan
+    result = math.fmod(left, right)
+    return int(result) if isinstance(left, int) and isinstance(right, int) else result
+
+
+def _get_member(obj: Any, key: Any) -> Any:
+    if obj is None or obj is UNDEFINED:
+        raise TypeError(f"Cannot read properties of {to_js_string(obj)} (reading '{to_js_string(key)}')")
+    if isinstance(obj, (list, str)):
+        if key == 'length':
+            return len(obj)
+        if _is_number(key) and not math.isinf(key) and key == key and key == int(key):
+            index = int(key)
+        elif isinstance(key, str) and key.isdigit():
+            index = int(key)
+        else:
+            return UNDEFINED
+        return obj[index] if 0 <= index < len(obj) else UNDEFINED
+    key = to_js_string(key)
+    try:
+        return obj[key]
+    except (KeyError, TypeError):
+        return UNDEFINED
+
+
+def to_python_value(value: Any) -> Any:
+    """Convert an evaluation result to plain Python / JSON values"""
+    if value is UNDEFINED:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, list):
+        return [to_python_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_python_value(item) for key, item in value.items()}
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Built-in functions and methods
+# ---------------------------------------------------------------------------
+
+def _slice_bounds(length: int, start: Any, end: Any) -> Tuple[int, int]:
+    def clamp(position, default):
+        if position is UNDEFINED:
+            return default
+        position = int(to_number(position)) if to_number(position) == to_number(position) else 0
+        if position < 0:
+            position += length
+        return max(0, min(position, length))
+    return clamp(start, 0), clamp(end, length)
+
+
+def _substring(text: str, start: Any, end: Any = UNDEFINED) -> str:
+    def clamp(position, default):
+        if position is UNDEFINED:
+            return default
+        number = to_number(position)
+        return max(0, min(int(number) if number == number else 0, len(text)))
+    start, end = clamp(start, 0), clamp(end, len(text))
+    if start > end:
+        start, end = end, start
+    return text[start:end]
+
+
+def _index_of(container: Any, search: Any) -> int:
+    if isinstance(container, str):
+        return container.find(to_js_string(search))
+    for index, item in enumerate(container):
+        if strict_equals(item, search):
+            return index
+    return -1
+
+
+def _split(text: str, separator: Any) -> List[str]:
+    if separator is UNDEFINED:
+        return [text]
+    separator = to_js_string(separator)
+    return list(text) if separator == '' else text.split(separator)
+
+
+def _arg(args: List[Any], index: int) -> Any:
+    return args[index] if index < len(args) else UNDEFINED
+
+
+_STRING_METHODS = {
+    'toUpperCase': lambda s, args: s.upper(),
+    'toLowerCase': lambda s, args: s.lower(),
+    'trim': lambda s, args: s.strip(),
+    'toString': lambda s, args: s,
+    'includes': lambda s, args: to_js_string(_arg(args, 0)) in s,
+    'startsWith': lambda s, args: s.startswith(to_js_string(_arg(args, 0))),
+    'endsWith': lambda s, args: s.endswith(to_js_string(_arg(args, 0))),
+    'indexOf': lambda s, args: _index_of(s, _arg(args, 0)),
+    'substring': lambda s, args: _substring(s, _arg(args, 0), _arg(args, 1)),
+    'slice': lambda s, args: s[slice(*_slice_bounds(len(s), _arg(args, 0), _arg(args, 1)))],
+    'split': lambda s, args: _split(s, _arg(args, 0)),
+    'replace': lambda s, args: s.replace(to_js_string(_arg(args, 0)), to_js_string(_arg(args, 1)), 1),
+    'replaceAll': lambda s, args: s.replace(to_js_string(_arg(args, 0)), to_js_string(_arg(args, 1))),
+    'concat': lambda s, args: s + ''.join(to_js_string(arg) for arg in args),
+}
+
+_ARRAY_METHODS = {
+    'includes': lambda a, args: any(
+        strict_equals(item, _arg(args, 0)) or (item != item and _arg(args, 0) != _arg(args, 0)) for item in a),
+    'indexOf': lambda a, args: _index_of(a, _arg(args, 0)),
+    'join': lambda a, args: (',' if _arg(args, 0) is UNDEFINED else to_js_string(_arg(args, 0))).join(
+        '' if item is None or item is UNDEFINED else to_js_string(item) for item in a),
+    'slice': lambda a, args: a[slice(*_slice_bounds(len(a), _arg(args, 0), _arg(args, 1)))],
+    'concat': lambda a, args: a + [item for arg in args for item in (arg if isinstance(arg, list) else [arg])],
+    'toString': lambda a, args: to_js_string(a),
+}
+
+_NUMBER_METHODS = {
+    'toString': lambda n, args: to_js_string(n),
+    'toFixed': lambda n, args: f"{n:.{int(to_number(_arg(args, 0)) if _arg(args, 0) is not UNDEFINED else 0)}f}",
+}
+
+_METHOD_NAMES = set(_STRING_METHODS) | set(_ARRAY_METHODS) | set(_NUMBER_METHODS)
+
+
+def _call_method(obj: Any, name: str, args: List[Any]) -> Any:
+    if isinstance(obj, str):
+        methods = _STRING_METHODS
+    elif isinstance(obj, list):
+        methods = _ARRAY_METHODS
+    elif _is_number(obj):
+        methods = _NUMBER_METHODS
+    else:
+        methods = {}
+    if name not in methods:
+        raise TypeError(f"{to_js_string(obj)}.{name} is not a function")
+    return methods[name](obj, args)
+
+
+def _parse_int(value: Any, radix: Any = UNDEFINED) -> Any:
+    text = to_js_string(value).strip()
+    base = 10 if radix is UNDEFINED else int(to_number(radix))
+    match = re.match(r'[+-]?(0[xX])?[0-9a-zA-Z]+', text)
+    if not match:
+        return math.nan
+    digits = match.group(0)
+    if match.group(1) and radix is UNDEFINED:
+        base = 16
+    sign = -1 if digits.startswith('-') else 1
+    digits = digits.lstrip('+-')
+    if base == 16 and digits[:2].lower() == '0x':
+        digits = digits[2:]
+    valid = ''
+    for char in digits:
+        if char.isdigit() and int(char) < base or char.isalpha() and ord(char.lower()) - 87 < base:
+            valid += char
+        else:
+            break
+    return sign * int(valid, base) if valid else math.nan
+
+
+def _parse_float(value: Any) -> Any:
+    match = re.match(r'\s*[+-]?(\d+\.?\d*([eE][+-]?\d+)?|\.\d+([eE][+-]?\d+)?|Infinity)', to_js_string(value))
+    if not match:
+        return math.nan
+    return float(match.group(0).replace('Infinity', 'inf'))
+
+
+def _js_integral(rounding, value: Any) -> Any:
+    number = to_number(value)
+    if number != number or math.isinf(number):
+        return number
+    return rounding(number)
+
+
+def _js_round(value: Any) -> Any:
+    return _js_integral(lambda number: math.floor(number + 0.5), value)
+
+
+def _min_max(pick, args: List[Any], empty: float) -> Any:
+    numbers = [to_number(arg) for arg in args]
+    if any(number != number for number in numbers):
+        return math.nan
+    return pick(numbers) if numbers else empty
+
+
+_GLOBAL_FUNCTIONS = {
+    'String': lambda args: to_js_string(_arg(args, 0)) if args else '',
+    'Number': lambda args: to_number(_arg(args, 0)) if args else 0,
+    'Boolean': lambda args: to_boolean(_arg(args, 0)),
+    'parseInt': lambda args: _parse_int(_arg(args, 0), _arg(args, 1)),
+    'parseFloat': lambda args: _parse_float(_arg(args, 0)),
+    'isNaN': lambda args: to_number(_arg(args, 0)) != to_number(_arg(args, 0)),
+}
+
+_MATH_FUNCTIONS = {
+    'round': lambda args: _js_round(_arg(args, 0)),
+    'floor': lambda args: _js_integral(math.floor, _arg(args, 0)),
+    'ceil': lambda args: _js_integral(math.ceil, _arg(args, 0)),
+    'abs': lambda args: abs(to_number(_arg(args, 0))),
+    'min': lambda args: _min_max(min, args, math.inf),
+    'max': lambda args: _min_max(max, args, -math.inf),
+}
+
+_CONSTANTS = {
+    'true': True,
+    'false': False,
+    'null': None,
+    'undefined': UNDEFINED,
+    'NaN': math.nan,
+    'Infinity': math.inf,
+}
+
+
+# ---------------------------------------------------------------------------
+# Tokenizer
+# ---------------------------------------------------------------------------
+
+_TOKEN_RE = re.compile(r'''
+    (?P<space>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<string>'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*")
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<op>===|!==|==|!=|<=|>=|&&|\|\||\?\?|[<>+\-*/%!?:.,()\[\]{};])
+''', re.VERBOSE | re.DOTALL)
+
+_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0'}
+
+
+def _unescape(body: str) -> str:
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] == 'u':
+            return chr(int(escape[1:], 16))
+        if escape[0] == 'x':
+            return chr(int(escape[1:], 16))
+        return _ESCAPES.get(escape, escape)
+    return re.sub(r'\\(u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|.)', replace, body, flags=re.DOTALL)
+
+
+def tokenize(code: str) -> List[Tuple[str, Any]]:
+    tokens = []
+    position = 0
+    while position < len(code):
+        match = _TOKEN_RE.match(code, position)
+        if not match:
+            raise ExpressionSyntaxError(f"Unsupported character {code[position]!r} at {position}")
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'space':
+            continue
+        if kind == 'number':
+            number = float(text)
+            tokens.append(('number', int(number) if number.is_integer() and abs(number) < 2 ** 53 else number))
+        elif kind == 'string':
+            tokens.append(('string', _unescape(text[1:-1])))
+        else:
+            tokens.append((kind, text))
+    tokens.append(('end', None))
+    return tokens
+
+
+# ---------------------------------------------------------------------------
+# Parser: tokens -> AST (nested tuples)
+# ---------------------------------------------------------------------------
+
+_BINARY_PRECEDENCE = [
+    ('??',),
+    ('||',),
+    ('&&',),
+    ('===', '!==', '==', '!='),
+    ('<', '<=', '>', '>='),
+    ('+', '-'),
+    ('*', '/', '%'),
+]
+
+
+class _Parser:
+    def __init__(self, tokens: List[Tuple[str, Any]]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self, offset: int = 0) -> Tuple[str, Any]:
+        return self.tokens[self.position + offset]
+
+    def next(self) -> Tuple[str, Any]:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def accept(self, value: str) -> bool:
+        kind, text = self.peek()
+        if kind in ('op', 'name') and text == value:
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, value: str) -> None:
+        if not self.accept(value):
+            raise ExpressionSyntaxError(f"Expected {value!r}, got {self.peek()[1]!r}")
+
+    def parse_program(self):
+        # Without `return` the function body evaluates to undefined in
+        # JavaScript; leave such code to the full engine
+        self.expect('return')
+        node = self.parse_expression()
+        while self.accept(';'):
+            pass
+        if self.peek()[0] != 'end':
+            raise ExpressionSyntaxError(f"Unexpected token {self.peek()[1]!r}")
+        return node
+
+    def parse_expression(self):
+        test = self.parse_binary(0)
+        if self.accept('?'):
+            consequent = self.parse_expression()
+            self.expect(':')
+            alternate = self.parse_expression()
+            return ('conditional', test, consequent, alternate)
+        return test
+
+    def parse_binary(self, level: int):
+        if level == len(_BINARY_PRECEDENCE):
+            return self.parse_unary()
+        left = self.parse_binary(level + 1)
+        operators = _BINARY_PRECEDENCE[level]
+        while self.peek()[0] == 'op' and self.peek()[1] in operators:
+            operator = self.next()[1]
+            right = self.parse_binary(level + 1)
+            kind = 'logical' if operator in ('&&', '||', '??') else 'binary'
+            left = (kind, operator, left, right)
+        return left
+
+    def parse_unary(self):
+        kind, text = self.peek()
+        if (kind == 'op' and text in ('!', '-', '+')) or (kind == 'name' and text == 'typeof'):
+            self.next()
+            return ('unary', text, self.parse_unary())
+        return self.parse_postfix()
+
+    def parse_postfix(self):
+        node = self.parse_primary()
+        while True:
+            if self.accept('.'):
+                kind, name = self.next()
+                if kind != 'name':
+                    raise ExpressionSyntaxError(f"Expected property name, got {name!r}")
+                node = ('member', node, ('literal', name))
+            elif self.accept('['):
+                key = self.parse_expression()
+                self.expect(']')
+                node = ('member', node, key)
+            elif self.peek() == ('op', '('):
+                node = self.parse_call(node)
+            else:
+                return node
+
+    def parse_call(self, callee):
+        self.expect('(')
+        args = []
+        if not self.accept(')'):
+            args.append(self.parse_expression())
+            while self.accept(','):
+                args.append(self.parse_expression())
+            self.expect(')')
+
+        if callee[0] == 'global' and callee[1] in _GLOBAL_FUNCTIONS:
+            return ('call_global', callee[1], args)
+        if callee[0] == 'member' and callee[2][0] == 'literal':
+            name = callee[2][1]
+            if callee[1] == ('global', 'Math') and name in _MATH_FUNCTIONS:
+                return ('call_math', name, args)
+            if name in _METHOD_NAMES:
+                return ('call_method', callee[1], name, args)
+        raise ExpressionSyntaxError("Unsupported function call")
+
+    def parse_primary(self):
+        kind, value = self.next()
+        if kind == 'number' or kind == 'string':
+            return ('literal', value)
+        if kind == 'name':
+            if value in _CONSTANTS:
+                return ('literal', _CONSTANTS[value])
+            if value == 'fields':
+                return ('fields',)
+            if value in _GLOBAL_FUNCTIONS or value == 'Math':
+                return ('global', value)
+            raise ExpressionSyntaxError(f"Unsupported identifier {value!r}")
+        if kind == 'op':
+            if value == '(':
+                node = self.parse_expression()
+                self.expect(')')
+                return node
+            if value == '[':
+                items = []
+                if not self.accept(']'):
+                    items.append(self.parse_expression())
+                    while self.accept(','):
+                        items.append(self.parse_expression())
+                    self.expect(']')
+                return ('array', items)
+            if value == '{':
+                return self.parse_object()
+        raise ExpressionSyntaxError(f"Unexpected token {value!r}")
+
+    def parse_object(self):
+        entries = []
+        if self.accept('}'):
+            return ('object', entries)
+        while True:
+            kind, key = self.next()
+            if kind not in ('name', 'string', 'number'):
+                raise ExpressionSyntaxError(f"Unsupported object key {key!r}")
+            self.expect(':')
+            entries.append((to_js_string(key), self.parse_expression()))
+            if self.accept('}'):
+                return ('object', entries)
+            self.expect(',')
+            if self.accept('}'):
+                return ('object', entries)
+
+
+def parse(code: str):
+    """Parse code into an AST, raising ExpressionSyntaxError outside the subset"""
+    return _Parser(tokenize(code)).parse_program()
+
+
+# ---------------------------------------------------------------------------
+# Compiler: AST -> closures taking `fields`
+# ---------------------------------------------------------------------------
+
+_BINARY_OPERATORS = {
+    '===': strict_equals,
+    '!==': lambda a, b: not strict_equals(a, b),
+    '==': loose_equals,
+    '!=': lambda a, b: not loose_equals(a, b),
+    '<': lambda a, b: _compare(a, b, lambda x, y: x < y),
+    '<=': lambda a, b: _compare(a, b, lambda x, y: x <= y),
+    '>': lambda a, b: _compare(a, b, lambda x, y: x > y),
+    '>=': lambda a, b: _compare(a, b, lambda x, y: x >= y),
+    '+': _add,
+    '-': lambda a, b: to_number(a) - to_number(b),
+    '*': lambda a, b: to_number(a) * to_number(b),
+    '/': _divide,
+    '%': _remainder,
+}
+
+_UNARY_OPERATORS = {
+    '!': lambda value: not to_boolean(value),
+    '-': lambda value: -to_number(value),
+    '+': to_number,
+    'typeof': typeof,
+}
+
+
+def _compile_node(node) -> Callable[[Any], Any]:
+    kind = node[0]
+
+    if kind == 'literal':
+        value = node[1]
+        return lambda fields: value
+
+    if kind == 'fields':
+        return lambda fields: fields
+
+    if kind == 'member':
+        if node[1] == ('fields',) and node[2][0] == 'literal':
+            key = to_js_string(node[2][1])
+
+            def get_field(fields):
+                try:
+                    return fields[key]
+                except KeyError:
+                    return UNDEFINED
+            return get_field
+
+        get_object = _compile_node(node[1])
+        if node[2][0] == 'literal':
+            key = node[2][1]
+            return lambda fields: _get_member(get_object(fields), key)
+        get_key = _compile_node(node[2])
+        return lambda fields: _get_member(get_object(fields), get_key(fields))
+
+    if kind == 'unary':
+        operator = _UNARY_OPERATORS[node[1]]
+        operand = _compile_node(node[2])
+        return lambda fields: operator(operand(fields))
+
+    if kind == 'binary':
+        operator = _BINARY_OPERATORS[node[1]]
+        left, right = _compile_node(node[2]), _compile_node(node[3])
+        return lambda fields: operator(left(fields), right(fields))
+
+    if kind == 'logical':
+        left, right = _compile_node(node[2]), _compile_node(node[3])
+        if node[1] == '&&':
+            def logical_and(fields):
+                value = left(fields)
+                return right(fields) if to_boolean(value) else value
+            return logical_and
+        if node[1] == '||':
+            def logical_or(fields):
+                value = left(fields)
+                return value if to_boolean(value) else right(fields)
+            return logical_or
+
+        def nullish(fields):
+            value = left(fields)
+            return right(fields) if value is None or value is UNDEFINED else value
+        return nullish
+
+    if kind == 'conditional':
+        test, consequent, alternate = (_compile_node(part) for part in node[1:])
+        return lambda fields: consequent(fields) if to_boolean(test(fields)) else alternate(fields)
+
+    if kind == 'array':
+        items = [_compile_node(item) for item in node[1]]
+        return lambda fields: [item(fields) for item in items]
+
+    if kind == 'object':
+        entries = [(key, _compile_node(value)) for key, value in node[1]]
+        return lambda fields: {key: value(fields) for key, value in entries}
+
+    if kind in ('call_global', 'call_math'):
+        function = (_GLOBAL_FUNCTIONS if kind == 'call_global' else _MATH_FUNCTIONS)[node[1]]
+        args = [_compile_node(arg) for arg in node[2]]
+        return lambda fields: function([arg(fields) for arg in args])
+
+    if kind == 'call_method':
+        get_object = _compile_node(node[1])
+        name = node[2]
+        args = [_compile_node(arg) for arg in node[3]]
+        return lambda fields: _call_method(get_object(fields), name, [arg(fields) for arg in args])
+
+    raise ExpressionSyntaxError(f"Unsupported expression {kind!r}")
+
+
+def compile_expression(code: str) -> Callable[[Any], Any]:
+    """
+    Compile code in the supported subset into a function of `fields`.
+    Results are plain Python values (undefined becomes None).
+    """
+    evaluate = _compile_node(parse(code))
+
+    def call(fields):
+        return to_python_value(evaluate(fields))
+    return call
@@ -0,0 +1,139 @@
+# field_access.py
+import re
+from typing import Any, Dict, Optional, Tuple
+
+
+def flatten_fields(obj: Any, fields: Dict, prefix: str = '') -> None:
+    """Flatten nested object into fields dictionary with dot notation"""
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            new_key = f"{prefix}.{key}" if prefix else key
+            if isinstance(value, (dict, list)):
+                flatten_fields(value, fields, new_key)
+            fields[new_key] = value
+    elif isinstance(obj, list):
+        fields[prefix] = obj
+    else:
+        if prefix:
+            fields[prefix] = obj
+
+
+def lookup_flat_field(source_data: Any, key: str) -> Tuple[bool, Any]:
+    """
+    Resolve a single dotted key the way flatten_fields would have produced it,
+    without flattening the rest of the payload. Returns (found, value).
+    """
+    if not isinstance(source_data, dict):
+        if isinstance(source_data, list) and key == '':
+            return True, source_data
+        return False, None
+    if key in source_data:
+        return True, source_data[key]
+    return _lookup_segments(source_data, key.split('.'), 0)
+
+
+def _lookup_segments(obj: Dict, segments: list, start: int) -> Tuple[bool, Any]:
+    # Keys may themselves contain dots, so try every split of the remaining segments
+    for end in range(start + 1, len(segments) + 1):
+        part = '.'.join(segments[start:end])
+        if part not in obj:
+            continue
+        value = obj[part]
+        if end == len(segments):
+            return True, value
+        if isinstance(value, dict):
+            found, nested = _lookup_segments(value, segments, end)
+            if found:
+                return True, nested
+    return False, None
+
+
+class LazyFields:
+    """Read-only `fields` proxy that resolves dotted keys on first access"""
+
+    __slots__ = ('_source', '_resolved')
+
+    def __init__(self, source_data: Any):
+        object.__setattr__(self, '_source', source_data)
+        object.__setattr__(self, '_resolved', {})
+
+    def _resolve(self, key: str) -> Tuple[bool, Any]:
+        resolved = object.__getattribute__(self, '_resolved')
+        if key not in resolved:
+            resolved[key] = lookup_flat_field(object.__getattribute__(self, '_source'), key)
+        return resolved[key]
+
+    def __getitem__(self, key):
+        found, value = self._resolve(str(key))
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._resolve(str(key))[0]
+
+
+# `fields` not preceded by a member access, with whatever follows it
+_FIELDS_REFERENCE = re.compile(r'(?<![\w$.])fields(?![\w$])\s*')
+_STATIC_SUBSCRIPT = re.compile(r'''\[\s*(?:'([^'\\\n]*)'|"([^"\\\n]*)")\s*\]''')
+_STATIC_MEMBER = re.compile(r'\.\s*([A-Za-z_$][\w$]*)')
+
+
+class FieldAccess:
+    """
+    What a script reads from `fields`, found by static analysis of its source.
+
+    mode is one of:
+      - 'static': only literal keys (`fields['a.b']`, `fields.name`) are read,
+        so just those keys are extracted from the payload
+      - 'lazy': keys are computed at runtime (`fields[key]`), so a LazyFields
+        proxy resolves them on demand
+      - 'full': `fields` is used as a whole object, so the payload is flattened
+    """
+
+    def __init__(self, mode: str, keys: Optional[Tuple[str, ...]] = None):
+        self.mode = mode
+        self.keys = keys or ()
+
+    def build(self, source_data: Any) -> Any:
+        """Build the `fields` argument for one payload"""
+        if self.mode == 'static':
+            fields = {}
+            for key in self.keys:
+                found, value = lookup_flat_field(source_data, key)
+                if found:
+                    fields[key] = value
+            return fields
+        elif self.mode == 'lazy':
+            return LazyFields(source_data)
+
+        fields = {}
+        flatten_fields(source_data, fields)
+        return fields
+
+
+def analyze_field_access(code: str) -> FieldAccess:
+    """Statically analyze which `fields` keys a condition or transform reads"""
+    keys = []
+    dynamic = False
+
+    for match in _FIELDS_REFERENCE.finditer(code):
+        rest = code[match.end():]
+        subscript = _STATIC_SUBSCRIPT.match(rest)
+        if subscript:
+            key = subscript.group(1) if subscript.group(1) is not None else subscript.group(2)
+            keys.append(key)
+            continue
+        member = _STATIC_MEMBER.match(rest)
+        if member:
+            keys.append(member.group(1))
+            continue
+        if rest.startswith('['):
+            dynamic = True
+            continue
+        # Bare `fields` (passed around, iterated, reassigned): needs everything
+        return FieldAccess('full')
+
+    if dynamic:
+        return FieldAccess('lazy')
+    return FieldAccess('static', tuple(dict.fromkeys(keys)))
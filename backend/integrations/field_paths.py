@@ -0,0 +1,303 @@
+# field_paths.py
+"""
+Selector syntax for mapping sources and targets, compiled into accessor functions.
+
+    customer.name              plain dot path
+    items.0.sku / items[0].sku list index (negative indexes count from the end)
+    items[*].sku               every element of a list
+    items[?(@.qty > 1)].sku    elements matching a filter (JavaScript-style expression on `@`)
+    ['key.with.dots'].value    quoted key
+    $.customer.name            optional JSONPath-style root (`$` followed by `.`, `[` or nothing)
+
+Getters return a single value for plain paths (None when missing) and a list
+for paths containing a wildcard or filter. Setters create missing dicts and
+lists; a `[*]` in a target path writes each element of a list value into the
+matching array element.
+"""
+import re
+from functools import lru_cache
+from typing import Any, Callable, List, Tuple
+
+# Step kinds
+KEY = 'key'            # dict key from bracket syntax
+MEMBER = 'member'      # dot segment: dict key, or list index when numeric and applied to a list
+INDEX = 'index'        # [n]
+WILDCARD = 'wildcard'  # [*]
+FILTER = 'filter'      # [?(...)]
+
+
+class PathSyntaxError(ValueError):
+    """Raised for malformed selectors"""
+
+
+_FILTER_STRING_OR_AT = re.compile(r'''('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|@''')
+
+
+def _compile_filter(expression: str) -> Callable[[Any], bool]:
+    from .expression_engine import ExpressionSyntaxError, compile_expression, to_boolean
+
+    # `@` is the current element; the expression engine calls it `fields`
+    code = 'return (' + _FILTER_STRING_OR_AT.sub(lambda m: m.group(1) or 'fields', expression) + ');'
+    try:
+        evaluate = compile_expression(code)
+    except ExpressionSyntaxError as e:
+        raise PathSyntaxError(f"Invalid filter {expression!r}: {e}")
+
+    def matches(element):
+        try:
+            return to_boolean(evaluate(element))
+        except Exception:
+            return False
+    return matches
+
+
+def _find_filter_end(path: str, start: int) -> int:
+    """Index of the ')' closing a filter opened at `start` (just after '?(')"""
+    depth = 1
+    position = start
+    quote = None
+    while position < len(path):
+        char = path[position]
+        if quote:
+            if char == '\\':
+                position += 1
+            elif char == quote:
+                quote = None
+        elif char in ('"', "'"):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return position
+        position += 1
+    raise PathSyntaxError(f"Unterminated filter in {path!r}")
+
+
+@lru_cache(maxsize=2048)
+def parse_path(path: str) -> Tuple[Tuple[str, Any], ...]:
+    """Parse a selector into a tuple of (kind, argument) steps"""
+    steps = []
+    position = 0
+    # `$distinct_id` is an ordinary key; only `$`, `$.x` and `$[...]` are the root
+    if path.startswith('$') and path[1:2] in ('', '.', '['):
+        position = 1
+        if path[1:2] == '.':
+            position = 2
+
+    while position < len(path):
+        char = path[position]
+        if char == '[':
+            close = path.find(']', position)
+            inner = path[position + 1:close] if close != -1 else ''
+            if inner == '*':
+                steps.append((WILDCARD, None))
+            elif path.startswith('[?(', position):
+                end = _find_filter_end(path, position + 3)
+                if path[end + 1:end + 2] != ']':
+                    raise PathSyntaxError(f"Expected ']' after filter in {path!r}")
+                expression = path[position + 3:end]
+                steps.append((FILTER, (expression, _compile_filter(expression))))
+                close = end + 1
+            elif inner[:1] in ('"', "'") and len(inner) >= 2 and inner[-1] == inner[0]:
+                steps.append((KEY, inner[1:-1]))
+            elif re.fullmatch(r'-?\d+', inner):
+                steps.append((INDEX, int(inner)))
+            else:
+                raise PathSyntaxError(f"Invalid selector [{inner}] in {path!r}")
+            position = close + 1
+            if path[position:position + 1] == '.':
+                position += 1
+                if position == len(path):
+                    raise PathSyntaxError(f"Trailing '.' in {path!r}")
+        else:
+            end = position
+            while end < len(path) and path[end] not in '.[':
+                end += 1
+            steps.append((MEMBER, path[position:end]))
+            position = end
+            if path[position:position + 1] == '.':
+                position += 1
+                if position == len(path):
+                    steps.append((MEMBER, ''))
+
+    if not steps:
+        steps.append((MEMBER, ''))
+    return tuple(steps)
+
+
+def literal_path(path: str) -> Tuple[Tuple[str, Any], ...]:
+    """Steps reading `path` as dict keys split on dots, for paths that are not valid selectors"""
+    return tuple((KEY, key) for key in path.split('.'))
+
+
+def is_plain_path(path: str) -> bool:
+    """True for plain dot paths, which keep the original dict-only semantics"""
+    return all(kind == MEMBER for kind, _ in parse_path(path))
+
+
+def is_multi_path(path: str) -> bool:
+    """True if the selector can match several values (wildcards or filters)"""
+    return any(kind in (WILDCARD, FILTER) for kind, _ in parse_path(path))
+
+
+def _step_value(obj: Any, kind: str, arg: Any) -> Any:
+    """Apply a single non-multi step; None when it does not match"""
+    if kind == MEMBER:
+        if isinstance(obj, dict):
+            return obj.get(arg)
+        if isinstance(obj, list) and arg.isdigit():
+            index = int(arg)
+            return obj[index] if index < len(obj) else None
+        return None
+    if kind == KEY:
+        return obj.get(arg) if isinstance(obj, dict) else None
+    if kind == INDEX:
+        if isinstance(obj, list) and -len(obj) <= arg < len(obj):
+            return obj[arg]
+        return None
+    return None
+
+
+def _elements(obj: Any) -> List[Any]:
+    if isinstance(obj, list):
+        return obj
+    if isinstance(obj, dict):
+        return list(obj.values())
+    return []
+
+
+def compile_getter(path: str, literal: bool = False) -> Callable[[Any], Any]:
+    """Compile a selector (or, with `literal`, a plain dotted key) into a function that reads it from a payload"""
+    steps = literal_path(path) if literal else parse_path(path)
+
+    if all(kind == MEMBER for kind, _ in steps) and not any(arg.isdigit() for _, arg in steps):
+        keys = [arg for _, arg in steps]
+        if len(keys) == 1:
+            key = keys[0]
+
+            def get_single(obj):
+                return obj.get(key) if isinstance(obj, dict) else None
+            return get_single
+
+        def get_keys(obj):
+            for key in keys:
+                if isinstance(obj, dict):
+                    obj = obj.get(key)
+                else:
+                    return None
+                if obj is None:
+                    return None
+            return obj
+        return get_keys
+
+    if not any(kind in (WILDCARD, FILTER) for kind, _ in steps):
+        def get_path(obj):
+            for kind, arg in steps:
+                obj = _step_value(obj, kind, arg)
+                if obj is None:
+                    return None
+            return obj
+        return get_path
+
+    def get_many(obj):
+        values = [obj]
+        for kind, arg in steps:
+            if kind == WILDCARD:
+                values = [element for value in values for element in _elements(value)]
+            elif kind == FILTER:
+                matches = arg[1]
+                values = [element for value in values for element in _elements(value) if matches(element)]
+            else:
+                # Missing values stay as None so results line up with their elements
+                values = [_step_value(value, kind, arg) if value is not None else None for value in values]
+        return values
+    return get_many
+
+
+def _container_for(step: Tuple[str, Any]) -> Any:
+    return [] if step[0] in (INDEX, WILDCARD) else {}
+
+
+def _child(node: Any, kind: str, arg: Any, next_step: Tuple[str, Any]) -> Any:
+    """Get the child of `node` addressed by a step, creating it when missing"""
+    if isinstance(node, list):
+        index = int(arg)
+        if index < 0:
+            index += len(node)
+        while len(node) <= index:
+            node.append(None)
+        if node[index] is None:
+            node[index] = _container_for(next_step)
+        return node[index]
+    if arg not in node:
+        node[arg] = _container_for(next_step)
+    return node[arg]
+
+
+def _assign(node: Any, steps: Tuple[Tuple[str, Any], ...], position: int, value: Any) -> None:
+    kind, arg = steps[position]
+    last = position == len(steps) - 1
+
+    if kind == WILDCARD:
+        if not isinstance(node, list):
+            raise TypeError(f"Cannot apply [*] to {type(node).__name__}")
+        if isinstance(value, list):
+            while len(node) < len(value):
+                node.append(None)
+            pairs = enumerate(value)
+        else:
+            # A single value is written into every existing element
+            pairs = ((index, value) for index in range(len(node)))
+        for index, element_value in pairs:
+            if last:
+                node[index] = element_value
+            else:
+                _assign(_child(node, INDEX, index, steps[position + 1]), steps, position + 1, element_value)
+        return
+
+    if kind == MEMBER and isinstance(node, list):
+        kind, arg = INDEX, int(arg)
+    if kind == INDEX and not isinstance(node, list):
+        raise TypeError(f"Cannot index {type(node).__name__} with [{arg}]")
+
+    if last:
+        if kind == INDEX:
+            index = arg + len(node) if arg < 0 else arg
+            while len(node) <= index:
+                node.append(None)
+            node[index] = value
+        else:
+            node[arg] = value
+        return
+
+    _assign(_child(node, kind, arg, steps[position + 1]), steps, position + 1, value)
+
+
+def compile_setter(path: str, literal: bool = False) -> Callable[[Any, Any], None]:
+    """Compile a target selector (or, with `literal`, a plain dotted key) into a function `set(output, value)`"""
+    steps = literal_path(path) if literal else parse_path(path)
+    if any(kind == FILTER for kind, _ in steps):
+        raise PathSyntaxError(f"Filters are not supported in target paths: {path!r}")
+
+    if all(kind == MEMBER for kind, _ in steps):
+        keys = [arg for _, arg in steps]
+        parents, leaf = keys[:-1], keys[-1]
+
+        # Same semantics as set_nested_value: missing parents become dicts
+        def set_keys(obj, value):
+            for key in parents:
+                if key not in obj:
+                    obj[key] = {}
+                obj = obj[key]
+            obj[leaf] = value
+        return set_keys
+
+    def set_path(obj, value):
+        _assign(obj, steps, 0, value)
+    return set_path
+
+
+get_cached_getter = lru_cache(maxsize=2048)(compile_getter)
+get_cached_setter = lru_cache(maxsize=2048)(compile_setter)
@@ -0,0 +1,158 @@
+# http_sessions.py
+"""
+Process-wide registry of keep-alive HTTP sessions, one per target origin.
+
+Each origin (scheme://host:port) gets a `requests.Session` with its own
+HTTPAdapter connection pool, so consecutive deliveries to the same target
+reuse open TCP/TLS connections (and with them the negotiated TLS session)
+instead of handshaking every time.
+
+When httpx is installed the delivery engine sends through one
+httpx.AsyncClient instead (create_async_client), whose pool is keyed by
+origin the same way; async_client_stats reports it in the same shape.
+
+Neither transport stores cookies: targets are shared between integrations
+and a cookie set for one of them must not leak into another's requests.
+"""
+import http.cookiejar
+import threading
+from typing import Any, Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class _RejectAllCookies(http.cookiejar.DefaultCookiePolicy):
+    def set_ok(self, cookie, request):
+        return False
+
+
+def cookieless_jar() -> http.cookiejar.CookieJar:
+    """A cookie jar that never stores cookies"""
+    return http.cookiejar.CookieJar(policy=_RejectAllCookies())
+
+
+def get_origin(url: str) -> str:
+    """scheme://host:port of a URL, with default ports made explicit"""
+    parts = urlsplit(url)
+    scheme = (parts.scheme or 'http').lower()
+    port = parts.port or (443 if scheme == 'https' else 80)
+    return f"{scheme}://{(parts.hostname or '').lower()}:{port}"
+
+
+class SessionRegistry:
+    """Thread-safe map of origin -> pooled requests.Session"""
+
+    def __init__(self, pool_maxsize: int = 10, pool_block: bool = False, keep_alive: bool = True):
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def get_session(self, url: str) -> requests.Session:
+        origin = get_origin(url)
+        session = self._sessions.get(origin)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = self._create_session()
+                self._sessions[origin] = session
+        return session
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        session.cookies.set_policy(_RejectAllCookies())
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+
+        # One pool per session: the session only ever talks to its own origin
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Connection pool statistics per origin"""
+        with self._lock:
+            sessions = list(self._sessions.items())
+
+        stats = {}
+        for origin, session in sessions:
+            adapter = session.get_adapter(origin)
+            pools = list(adapter.poolmanager.pools._container.values())
+            stats[origin] = {
+                'pool_maxsize': self.pool_maxsize,
+                'connections_opened': sum(pool.num_connections for pool in pools),
+                'requests': sum(pool.num_requests for pool in pools),
+                'idle_connections': sum(
+                    sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+                    for pool in pools
+                ),
+            }
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            session.close()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_session_registry() -> SessionRegistry:
+    """Get or create the process-wide session registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = SessionRegistry(
+                    pool_maxsize=getattr(settings, 'HTTP_POOL_MAXSIZE', 10),
+                    pool_block=getattr(settings, 'HTTP_POOL_BLOCK', False),
+                    keep_alive=getattr(settings, 'HTTP_KEEP_ALIVE', True),
+                )
+    return _registry
+
+
+def get_session(url: str) -> requests.Session:
+    """Pooled session for the origin of `url`"""
+    return get_session_registry().get_session(url)
+
+
+def create_async_client(max_connections: int) -> 'httpx.AsyncClient':
+    """An httpx client with the keep-alive and redirect behaviour of the requests sessions"""
+    keep_alive = getattr(settings, 'HTTP_KEEP_ALIVE', True)
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=getattr(settings, 'HTTP_POOL_MAXSIZE', 10) * 10
+                            if keep_alive else 0),
+        cookies=httpx.Cookies(cookieless_jar()),
+        follow_redirects=True,
+    )
+
+
+def async_client_stats(client: 'httpx.AsyncClient') -> Dict[str, Dict[str, Any]]:
+    """Connection statistics per origin of an httpx client's pool"""
+    stats = {}
+    for connection in list(client._transport._pool.connections):
+        origin = connection._origin
+        key = f"{origin.scheme.decode()}://{origin.host.decode().lower()}:{origin.port}"
+        entry = stats.setdefault(key, {'pool_maxsize': getattr(settings, 'HTTP_POOL_MAXSIZE', 10),
+                                       'open_connections': 0, 'idle_connections': 0})
+        entry['open_connections'] += 1
+        entry['idle_connections'] += int(connection.is_idle())
+    return stats
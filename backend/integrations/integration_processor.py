@@ -1,20 +1,46 @@
 # integration_processor.py
-import requests
+import asyncio
+import copy
+import threading
 import time
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
 from .models import IntegrationConfiguration, IntegrationRun
-
-
-def process_integration(integration: IntegrationConfiguration, incoming_payload: Dict[str, Any]) -> Dict[str, Any]:
+from .batch_delivery import get_batch_options, get_batch_queue
+from .compression import compress_body
+from .delivery_engine import DeliveryRequest, DeliveryResponse, submit_delivery
+from .email_digest import DigestOptions, get_digest_queue
+from .field_access import flatten_fields
+from .field_paths import get_cached_getter, get_cached_setter
+from .http_sessions import get_origin
+from .js_engine import compile_script
+from .js_sandbox import SandboxTimeout
+from .mapping_compiler import MappingPlan, compile_mappings, get_mapping_plan
+from .latency_tracker import TimeoutPolicy
+from .rate_limiter import RateLimit
+from .response_capture import CaptureOptions, response_log
+from .resilience import RetryJob, get_circuit_breaker, get_retry_policy, get_retry_scheduler
+from .serialization import dumps_pretty, encode_payload
+from .smtp_pool import get_smtp_pool
+from .transforms import bind_transform
+
+
+def process_integration(integration: IntegrationConfiguration, incoming_payload: Dict[str, Any],
+                        run_id=None) -> Dict[str, Any]:
     """
-    Process an integration: transform data and send to target API or email
+    Process an integration: transform data and send to target API or email.
+    With `run_id`, the outcome is logged on that (queued) run instead of a new one.
     """
     start_time = time.time()
 
     try:
         # Load configuration
         config = integration.config_json
-        mappings = config.get('mappings', [])
         condition = config.get('condition')
 
         # Evaluate condition if present
@@ -26,219 +52,591 @@ def process_integration(integration: IntegrationConfiguration, incoming_payload:
             if not condition_result:
                 # Log the run as skipped
                 print("Condition not true")
-                run = IntegrationRun.objects.create(
-                    integration=integration,
-                    incoming_payload=incoming_payload,
-                    transformed_payload={},
-                    outgoing_request={
-                        'skipped': True,
-                        'reason': 'Condition evaluated to false',
-                        'condition': condition,
-                        'condition_result': False
-                    },
-                    outgoing_response={'skipped': True},
-                    status='skipped',
-                    error_message='Condition not met - execution skipped',
-                    transformation_time_ms=0,
-                    api_call_time_ms=0
-                )
-                return {
-                    'run_id': run.id,
-                    'status': 'skipped',
-                    'message': 'Condition evaluated to false'
-                }
+                return log_skipped_run(integration, incoming_payload, condition, run_id=run_id)
 
         print("Condition is true")
         # Transform data
         transform_start = time.time()
-        transformed_payload = transform_data(incoming_payload, mappings)
+        transformed_payload = transform_data(incoming_payload, get_mapping_plan(integration))
         transformation_time = int((time.time() - transform_start) * 1000)
 
-        # Check if target type is email or SMS
-        target_config = config.get('target', {})
-        target_type = target_config.get('type', 'http')
-
-        if target_type == 'email':
-            return process_email_integration(integration, incoming_payload, transformed_payload, transformation_time, condition, condition_result)
-
-        # Prepare API request
-        target_config = config.get('target', {})
-        headers = target_config.get('headers', {})
-        auth_config = target_config.get('auth', {})
-        
-        # Add authentication
-        headers = add_authentication(headers, target_config.get('authType'), auth_config)
-        
-        # Make API call
-        api_start = time.time()
-        if target_config.get('method') == 'GET':
-            response = requests.get(
-                integration.target_url,
-                params=flatten_dict(transformed_payload),
-                headers=headers,
-                timeout=30
-            )
-        else:  # POST
-            headers['Content-Type'] = 'application/json'
-            response = requests.post(
-                integration.target_url,
-                json=transformed_payload,
-                headers=headers,
-                timeout=30
-            )
-        
-        api_call_time = int((time.time() - api_start) * 1000)
-        
-        # Parse response
-        try:
-            response_data = response.json()
-        except:
-            response_data = {'body': response.text}
-        
-        # Log the run
-        run = IntegrationRun.objects.create(
-            integration=integration,
-            incoming_payload=incoming_payload,
-            transformed_payload=transformed_payload,
-            outgoing_request={
-                'url': integration.target_url,
-                'method': target_config.get('method'),
-                'headers': {k: v for k, v in headers.items() if k.lower() != 'authorization'},
-                'body': transformed_payload,
-                'condition': condition if condition else None,
-                'condition_result': condition_result if condition else None
-            },
-            outgoing_response={
-                'status_code': response.status_code,
-                'headers': dict(response.headers),
-                'body': response_data
-            },
-            status='success' if response.ok else 'error',
-            error_message=None if response.ok else f"HTTP {response.status_code}",
-            transformation_time_ms=transformation_time,
-            api_call_time_ms=api_call_time
-        )
-        
-        return {
-            'run_id': run.id,
-            'status': 'success' if response.ok else 'error',
-            'response': response_data
-        }
-    
+        return deliver_payload(integration, incoming_payload, transformed_payload, transformation_time,
+                               condition, condition_result, run_id=run_id)
+
     except Exception as e:
         # Log failed run
-        run = IntegrationRun.objects.create(
-            integration=integration,
-            incoming_payload=incoming_payload,
-            transformed_payload={},
-            outgoing_request={'error': 'Failed before request'},
-            outgoing_response={'error': str(e)},
-            status='error',
-            error_message=str(e),
-            transformation_time_ms=0,
-            api_call_time_ms=0
-        )
-        
+        log_failed_run(integration, incoming_payload, e, run_id=run_id)
         raise
 
 
-def transform_data(source_data: Dict[str, Any], mappings: list) -> Dict[str, Any]:
-    """Transform source data using mappings"""
-    output = {}
+def process_integration_batch(integration: IntegrationConfiguration, incoming_payloads) -> List[Dict[str, Any]]:
+    """
+    Process many payloads for one integration.
+    Conditions are evaluated per payload, the payloads that pass are transformed
+    in one batch, and their deliveries are sent concurrently through the
+    delivery engine. Each payload is logged as its own run.
+    Failures are returned per payload instead of raised.
+    """
+    incoming_payloads = list(incoming_payloads)
+    config = integration.config_json
+    condition = config.get('condition')
 
-    for mapping in mappings:
-        target = mapping.get('target')
-        if not target:
-            continue
+    results = [None] * len(incoming_payloads)
+    pending = []
+    for index, incoming_payload in enumerate(incoming_payloads):
+        try:
+            if condition and not evaluate_condition(condition, incoming_payload):
+                results[index] = log_skipped_run(integration, incoming_payload, condition)
+            else:
+                pending.append(index)
+        except Exception as e:
+            results[index] = log_failed_run(integration, incoming_payload, e)
 
+    # Transform everything that passed the condition in one go
+    transform_start = time.time()
+    try:
+        transformed_payloads, mapping_errors = transform_batch(
+            [incoming_payloads[index] for index in pending], get_mapping_plan(integration)
+        )
+    except Exception as e:
+        for index in pending:
+            results[index] = log_failed_run(integration, incoming_payloads[index], e)
+        return results
+    # Report the amortized per-payload transformation time
+    transformation_time = int((time.time() - transform_start) * 1000 / max(len(pending), 1))
+
+    # Hand every HTTP delivery to the engine first so they are in flight concurrently
+    deliveries = {}
+    if is_direct_http(integration):
+        for index, transformed_payload in zip(pending, transformed_payloads):
+            try:
+                request = build_delivery_request(integration, transformed_payload)
+                deliveries[index] = (request, submit_delivery(request))
+            except Exception as e:
+                deliveries[index] = e
+
+    for index, transformed_payload, errors in zip(pending, transformed_payloads, mapping_errors):
         try:
-            if mapping.get('transform') == 'javascript':
-                # JavaScript transformation
-                js_code = mapping.get('jsCode')
-                source_fields = mapping.get('sourceFields', [])
+            delivery = deliveries.get(index)
+            if isinstance(delivery, Exception):
+                raise delivery
+            if delivery is not None:
+                request, future = delivery
+                results[index] = finish_delivery(integration, incoming_payloads[index], request, future,
+                                                 transformation_time, condition, True)
+            else:
+                results[index] = deliver_payload(integration, incoming_payloads[index], transformed_payload,
+                                                 transformation_time, condition, True)
+        except Exception as e:
+            results[index] = log_failed_run(integration, incoming_payloads[index], e)
+        if errors:
+            results[index]['mapping_errors'] = errors
 
-                if not js_code:
-                    continue
+    return results
 
-                # Build fields object for JavaScript
-                fields = {}
-                for field_path in source_fields:
-                    fields[field_path] = get_nested_value(source_data, field_path)
 
-                # Execute JavaScript transformation
-                value = execute_javascript_transform(js_code, fields)
-            else:
-                source = mapping.get('source')
-                if not source:
-                    continue
+def is_direct_http(integration: IntegrationConfiguration) -> bool:
+    """Whether payloads go straight to one HTTP target (no email, bulk batching or fan-out)"""
+    return integration.config_json.get('target', {}).get('type', 'http') != 'email' and \
+        get_batch_options(integration) is None and get_fanout_targets(integration) is None
 
-                value = get_nested_value(source_data, source)
 
-                # Apply transformation
-                transform = mapping.get('transform')
-                params = mapping.get('params', [])
-                value = apply_transformation(value, transform, params)
+async def process_integration_async(integration: IntegrationConfiguration,
+                                    incoming_payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Async variant of process_integration for ASGI views. Condition, transform
+    and database writes run on a worker thread; the request waits for the
+    delivery engine without holding one. Targets other than a single HTTP
+    target are processed by process_integration on a thread.
+    """
+    if not is_direct_http(integration):
+        return await sync_to_async(process_integration)(integration, incoming_payload)
 
-            set_nested_value(output, target, value)
+    def prepare():
+        condition = integration.config_json.get('condition')
+        if condition and not evaluate_condition(condition, incoming_payload):
+            return log_skipped_run(integration, incoming_payload, condition), None
+        transform_start = time.time()
+        transformed_payload = transform_data(incoming_payload, get_mapping_plan(integration))
+        transformation_time = int((time.time() - transform_start) * 1000)
+        return None, (build_delivery_request(integration, transformed_payload), transformation_time, condition)
 
+    def finish(request, future, transformation_time, condition):
+        try:
+            return finish_delivery(integration, incoming_payload, request, future, transformation_time,
+                                   condition, True)
+        except Exception as e:
+            log_failed_run(integration, incoming_payload, e)
+            raise
+
+    def finish_detached(request, future, transformation_time, condition):
+        # The client disconnected: nobody awaits the outcome, so failures are reported here
+        try:
+            finish(request, future, transformation_time, condition)
         except Exception as e:
-            print(f"Error in mapping {target}: {e}")
+            print(f"Delivery for {integration.name} failed after the client disconnected: {e}")
+        finally:
+            connections.close_all()
+
+    try:
+        skipped, prepared = await sync_to_async(prepare)()
+    except Exception as e:
+        await sync_to_async(log_failed_run)(integration, incoming_payload, e)
+        raise
+    if skipped is not None:
+        return skipped
+
+    request, transformation_time, condition = prepared
+    future = submit_delivery(request)
+    try:
+        # Shielded: a client that disconnects does not cancel the delivery
+        await asyncio.shield(asyncio.wrap_future(future))
+    except asyncio.CancelledError:
+        future.add_done_callback(lambda _: threading.Thread(
+            target=finish_detached, args=(request, future, transformation_time, condition), daemon=True
+        ).start())
+        raise
+    except Exception:
+        pass  # finish_delivery logs it (and re-raises it without a retry policy)
+    return await sync_to_async(finish)(request, future, transformation_time, condition)
+
+
+def deliver_payload(integration: IntegrationConfiguration, incoming_payload: Dict[str, Any],
+                    transformed_payload: Dict[str, Any], transformation_time: int,
+                    condition: str = None, condition_result: bool = True, run_id=None) -> Dict[str, Any]:
+    """
+    Send a transformed payload to the integration's target and log the run
+    (on the queued run `run_id` when given)
+    """
+    config = integration.config_json
+
+    # Fan-out: the shared payload goes to every target in `targets`
+    if get_fanout_targets(integration) is not None:
+        return deliver_fanout(integration, incoming_payload, transformed_payload, transformation_time,
+                              condition, condition_result, run_id=run_id)
+
+    # Check if target type is email or SMS
+    target_config = config.get('target', {})
+    target_type = target_config.get('type', 'http')
+
+    if target_type == 'email':
+        return process_email_integration(integration, incoming_payload, transformed_payload, transformation_time,
+                                         condition, condition_result, run_id=run_id)
+
+    # Bulk targets: the payload joins the integration's next batch request
+    batch_options = get_batch_options(integration)
+    if batch_options is not None:
+        return get_batch_queue().enqueue(integration, batch_options, incoming_payload, transformed_payload,
+                                         transformation_time, run_id=run_id)
+
+    request = build_delivery_request(integration, transformed_payload)
+    return finish_delivery(integration, incoming_payload, request, submit_delivery(request), transformation_time,
+                           condition, condition_result, run_id=run_id)
+
+
+def get_fanout_targets(integration: IntegrationConfiguration) -> Optional[List[Dict[str, Any]]]:
+    """The integration's `targets` list, or None for single-target integrations"""
+    targets = integration.config_json.get('targets')
+    return targets if isinstance(targets, list) and targets else None
+
+
+def integration_target(integration: IntegrationConfiguration, index: int) -> IntegrationConfiguration:
+    """
+    An unsaved copy of the integration that delivers to `targets[index]`:
+    the target's config and URL replace the integration's own.
+    """
+    target_config = integration.config_json['targets'][index]
+    leg = copy.copy(integration)
+    leg.config_json = {key: value for key, value in integration.config_json.items() if key != 'targets'}
+    leg.config_json['target'] = target_config
+    leg.target_url = target_config.get('url') or integration.target_url
+    leg.target_index = index
+    return leg
+
+
+def target_leg_info(integration: IntegrationConfiguration) -> Dict[str, Any]:
+    """Fan-out target index and name to log on a leg's run (empty for plain integrations)"""
+    index = getattr(integration, 'target_index', None)
+    if index is None:
+        return {}
+    return {'target_index': index, 'target_name': integration.config_json['target'].get('name')}
+
+
+def target_payload(integration: IntegrationConfiguration, index: int, incoming_payload: Dict[str, Any],
+                   transformed_payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The shared transformed payload with the target's `mappings` overlay merged in"""
+    if not integration.config_json['targets'][index].get('mappings'):
+        return transformed_payload
+    overlay = get_mapping_plan(integration, index).apply(incoming_payload)
+    return merge_payload(transformed_payload, overlay)
+
+
+def merge_payload(base: Dict[str, Any], overlay: Dict[str, Any]) -> Dict[str, Any]:
+    """Deep-merge `overlay` into a copy of `base`; overlay values win"""
+    merged = dict(base)
+    for key, value in overlay.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_payload(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def deliver_fanout(integration: IntegrationConfiguration, incoming_payload: Dict[str, Any],
+                   transformed_payload: Dict[str, Any], transformation_time: int,
+                   condition: str = None, condition_result: bool = True, run_id=None) -> Dict[str, Any]:
+    """
+    Deliver a transformed payload to every target in `targets` concurrently.
+    The message is logged as a parent run and each target leg as its own run
+    under it. HTTP legs go through the delivery engine (with their own retry,
+    rate limit, timeout and batch settings); email legs are sent on a thread pool,
+    or join their target's digest when it has `emailConfig.digest`.
+    """
+    targets = get_fanout_targets(integration)
+    parent_run_id = save_run(
+        integration, run_id,
+        incoming_payload=incoming_payload,
+        transformed_payload=transformed_payload,
+        outgoing_request={
+            'fanout': True,
+            'targets': [
+                {'index': index, 'name': target.get('name'), 'type': target.get('type', 'http'),
+                 'url': target.get('url')}
+                for index, target in enumerate(targets)
+            ],
+            'condition': condition if condition else None,
+            'condition_result': condition_result if condition else None
+        },
+        outgoing_response={},
+        status='queued',
+        error_message=None,
+        transformation_time_ms=transformation_time,
+        api_call_time_ms=None
+    )
+
+    # Start every leg before waiting on any of them
+    delivery_start = time.time()
+    legs = []
+    for index in range(len(targets)):
+        leg = integration_target(integration, index)
+        try:
+            payload = target_payload(integration, index, incoming_payload, transformed_payload)
+            leg_target = leg.config_json['target']
+            if leg_target.get('type', 'http') == 'email':
+                email_config = leg_target.get('emailConfig', {})
+                digest_options = DigestOptions.from_config(email_config.get('digest'))
+                if digest_options is not None:
+                    # Joins the target's next digest email, which updates this run when it is sent
+                    queued = get_digest_queue().enqueue(leg, digest_options, {}, payload, 0, condition,
+                                                        condition_result, parent_run_id=parent_run_id)
+                    legs.append((leg, payload, None, None, queued))
+                else:
+                    future = get_fanout_executor().submit(send_email, email_config, payload)
+                    legs.append((leg, payload, None, future, None))
+            elif get_batch_options(leg) is not None:
+                # Joins the target's next batch request, which updates this run when it is sent
+                queued = get_batch_queue().enqueue(leg, get_batch_options(leg), {}, payload, 0,
+                                                   parent_run_id=parent_run_id)
+                legs.append((leg, payload, None, None, queued))
+            else:
+                request = build_delivery_request(leg, payload)
+                legs.append((leg, payload, request, submit_delivery(request), None))
+        except Exception as e:
+            legs.append((leg, None, None, None, e))
+
+    results = []
+    # outcome: the exception that stopped a leg from starting, or the result of a batched or digested leg
+    for leg, payload, request, future, outcome in legs:
+        if isinstance(outcome, Exception):
+            results.append(log_failed_run(leg, {}, outcome, parent_run_id=parent_run_id))
+            continue
+        if outcome is not None:
+            results.append(outcome)
             continue
+        result = error = None
+        try:
+            result = future.result()
+        except Exception as e:
+            error = e
+        if request is None:
+            results.append(record_email_run(leg, {}, payload, 0, condition, condition_result,
+                                            sent=result, error=error, parent_run_id=parent_run_id))
+        else:
+            results.append(record_delivery(leg, {}, request, result, 0, condition, condition_result,
+                                           error=error, parent_run_id=parent_run_id))
+
+    status = refresh_fanout_run(parent_run_id, api_call_time=int((time.time() - delivery_start) * 1000))
+    return {
+        'run_id': parent_run_id,
+        'status': status,
+        'targets': results
+    }
+
+
+def fanout_status(statuses: List[str]) -> str:
+    """Parent run status from its legs: 'partial' when only some legs failed"""
+    if 'retrying' in statuses:
+        return 'retrying'
+    if 'queued' in statuses:
+        return 'queued'
+    if all(status == 'success' for status in statuses):
+        return 'success'
+    if all(status == 'error' for status in statuses):
+        return 'error'
+    return 'partial'
+
+
+def refresh_fanout_run(parent_run_id, api_call_time: int = None) -> str:
+    """Recompute a fan-out run's status and leg summary from its leg runs"""
+    legs = list(IntegrationRun.objects.filter(parent_run_id=parent_run_id).values_list('id', 'status'))
+    statuses = [status for _, status in legs]
+    failed = statuses.count('error')
+    status = fanout_status(statuses)
+    fields = {
+        'status': status,
+        'error_message': f"{failed} of {len(statuses)} targets failed" if failed else None,
+        'outgoing_response': {'legs': [{'run_id': str(run_id), 'status': leg_status} for run_id, leg_status in legs]},
+    }
+    if api_call_time is not None:
+        fields['api_call_time_ms'] = api_call_time
+    IntegrationRun.objects.filter(id=parent_run_id).update(**fields)
+    return status
+
+
+_fanout_executor = None
+_fanout_executor_lock = threading.Lock()
+
+
+def get_fanout_executor() -> ThreadPoolExecutor:
+    """Thread pool sending the email legs of fan-out deliveries"""
+    global _fanout_executor
+    if _fanout_executor is None:
+        with _fanout_executor_lock:
+            if _fanout_executor is None:
+                _fanout_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'FANOUT_EMAIL_WORKERS', 8), thread_name_prefix='fanout-email'
+                )
+    return _fanout_executor
+
+
+def build_delivery_request(integration: IntegrationConfiguration, transformed_payload: Dict[str, Any]) -> DeliveryRequest:
+    """Prepare the HTTP request for a transformed payload"""
+    target_config = integration.config_json.get('target', {})
+    headers = dict(target_config.get('headers', {}))
+    auth_config = target_config.get('auth', {})
+
+    # Add authentication
+    headers = add_authentication(headers, target_config.get('authType'), auth_config)
 
-    return output
+    rate_limit = RateLimit.from_config(target_config.get('rateLimit'))
+    capture = CaptureOptions.from_config(target_config.get('responseCapture'))
+    timeout = TimeoutPolicy.from_config(target_config.get('timeout'))
+    target_index = getattr(integration, 'target_index', None)
+
+    if target_config.get('method') == 'GET':
+        return DeliveryRequest(integration.id, 'GET', integration.target_url, headers,
+                               params=flatten_dict(transformed_payload), payload=transformed_payload,
+                               timeout=timeout, rate_limit=rate_limit, capture=capture, target_index=target_index)
+
+    # POST: encode (and compress) once; retries resend the same bytes
+    headers['Content-Type'] = 'application/json'
+    payload = encode_payload(transformed_payload)
+    body = compress_body(headers, payload.encoded, target_config.get('compression'))
+    return DeliveryRequest(integration.id, 'POST', integration.target_url, headers,
+                           body=body, payload=payload, timeout=timeout, rate_limit=rate_limit,
+                           capture=capture, target_index=target_index)
+
+
+def finish_delivery(integration: IntegrationConfiguration, incoming_payload: Dict[str, Any],
+                    request: DeliveryRequest, future, transformation_time: int,
+                    condition: str = None, condition_result: bool = True,
+                    attempt: int = 1, run_id=None) -> Dict[str, Any]:
+    """
+    Wait for a submitted delivery and log its run (`run_id`: the queued or
+    retried run to update). Without a retry policy, a first attempt that
+    raises (connection error, timeout, open circuit) is logged, then re-raised as before.
+    """
+    try:
+        response, error = future.result(), None
+    except Exception as e:
+        if attempt == 1 and get_retry_policy(integration) is None:
+            # Logged here with the request that was sent; log_failed_run leaves the run alone
+            e.logged_run_id = record_delivery(integration, incoming_payload, request, None, transformation_time,
+                                              condition, condition_result, error=e, run_id=run_id)['run_id']
+            raise
+        response, error = None, e
+    return record_delivery(integration, incoming_payload, request, response, transformation_time,
+                           condition, condition_result, error=error, attempt=attempt, run_id=run_id)
+
+
+def record_delivery(integration: IntegrationConfiguration, incoming_payload: Dict[str, Any],
+                    request: DeliveryRequest, response: DeliveryResponse, transformation_time: int,
+                    condition: str = None, condition_result: bool = True, error: Exception = None,
+                    attempt: int = 1, run_id=None, parent_run_id=None) -> Dict[str, Any]:
+    """
+    Log the run of a delivery attempt. Failed attempts covered by the
+    integration's retry policy are marked 'retrying' and rescheduled; later
+    attempts update the same run.
+    """
+    target_config = integration.config_json.get('target', {})
+
+    if response is not None:
+        outgoing_response, response_data = response_log(response, request.capture)
+        status = 'success' if response.ok else 'error'
+        error_message = None if response.ok else f"HTTP {response.status_code}"
+    else:
+        response_data = None
+        outgoing_response = {'error': str(error)}
+        status = 'error'
+        error_message = str(error)
+
+    retry_delay = None
+    policy = get_retry_policy(integration)
+    if status == 'error' and policy is not None and \
+            policy.should_retry(attempt, response.status_code if response is not None else None):
+        retry_delay = policy.delay(attempt)
+        status = 'retrying'
+
+    fields = {
+        'transformed_payload': request.payload,
+        'outgoing_request': {
+            'url': request.url,
+            'method': target_config.get('method'),
+            'headers': {k: v for k, v in request.headers.items() if k.lower() != 'authorization'},
+            'body': request.payload,
+            'condition': condition if condition else None,
+            'condition_result': condition_result if condition else None,
+            **target_leg_info(integration)
+        },
+        'outgoing_response': outgoing_response,
+        'status': status,
+        'error_message': error_message,
+        'api_call_time_ms': response.elapsed_ms if response is not None else 0,
+        'attempt_count': attempt,
+        'next_retry_at': timezone.now() + timedelta(seconds=retry_delay) if retry_delay is not None else None,
+        'circuit_state': get_circuit_breaker(get_origin(request.url)).state,
+    }
+
+    # Log the run
+    if attempt == 1:
+        run_id = save_run(integration, run_id, parent_run_id=parent_run_id, incoming_payload=incoming_payload,
+                          transformation_time_ms=transformation_time, **fields)
+    else:
+        IntegrationRun.objects.filter(id=run_id).update(**fields)
+        # A retried fan-out leg: bring its parent run's status up to date
+        if getattr(integration, 'target_index', None) is not None:
+            parent_run_id = IntegrationRun.objects.filter(id=run_id).values_list('parent_run_id', flat=True).first()
+            if parent_run_id is not None:
+                refresh_fanout_run(parent_run_id)
+
+    if retry_delay is not None:
+        get_retry_scheduler().schedule(
+            retry_delay, RetryJob(integration.id, run_id, request, attempt + 1, condition, condition_result,
+                                  target_index=getattr(integration, 'target_index', None))
+        )
+
+    result = {
+        'run_id': run_id,
+        'status': status,
+        'response': response_data
+    }
+    if response is None:
+        result['message'] = error_message
+    return result
+
+
+def save_run(integration: IntegrationConfiguration, run_id=None, **fields) -> Any:
+    """Create a run, or fill in the queued run `run_id` created when the message was accepted"""
+    if run_id is not None:
+        IntegrationRun.objects.filter(id=run_id).update(**fields)
+        return run_id
+    return IntegrationRun.objects.create(integration=integration, **fields).id
+
+
+def log_skipped_run(integration: IntegrationConfiguration, incoming_payload: Dict[str, Any],
+                    condition: str, run_id=None) -> Dict[str, Any]:
+    """Log a run whose condition evaluated to false"""
+    run_id = save_run(
+        integration, run_id,
+        incoming_payload=incoming_payload,
+        transformed_payload={},
+        outgoing_request={
+            'skipped': True,
+            'reason': 'Condition evaluated to false',
+            'condition': condition,
+            'condition_result': False
+        },
+        outgoing_response={'skipped': True},
+        status='skipped',
+        error_message='Condition not met - execution skipped',
+        transformation_time_ms=0,
+        api_call_time_ms=0
+    )
+    return {
+        'run_id': run_id,
+        'status': 'skipped',
+        'message': 'Condition evaluated to false'
+    }
+
+
+def log_failed_run(integration: IntegrationConfiguration, incoming_payload: Dict[str, Any],
+                   error: Exception, parent_run_id=None, run_id=None) -> Dict[str, Any]:
+    """Log a run that failed before a request was made (errors already logged by finish_delivery are not)"""
+    if getattr(error, 'logged_run_id', None) is not None:
+        return {
+            'run_id': error.logged_run_id,
+            'status': 'error',
+            'message': str(error)
+        }
+    run_id = save_run(
+        integration, run_id,
+        parent_run_id=parent_run_id,
+        incoming_payload=incoming_payload,
+        transformed_payload={},
+        outgoing_request={'error': 'Failed before request', **target_leg_info(integration)},
+        outgoing_response={'error': str(error)},
+        status='error',
+        error_message=str(error),
+        transformation_time_ms=0,
+        api_call_time_ms=0
+    )
+    return {
+        'run_id': run_id,
+        'status': 'error',
+        'message': str(error)
+    }
+
+
+def transform_data(source_data: Dict[str, Any], mappings) -> Dict[str, Any]:
+    """Transform source data using mappings (a raw mappings list or a compiled MappingPlan)"""
+    plan = mappings if isinstance(mappings, MappingPlan) else compile_mappings(mappings)
+    return plan.apply(source_data)
+
+
+def transform_batch(source_records, mappings) -> Tuple[List[Dict[str, Any]], List[List[Dict[str, str]]]]:
+    """
+    Transform a list (or iterator) of payloads with one mapping set.
+    Each mapping is applied across the whole batch; JavaScript mappings are
+    invoked once per batch. Returns the transformed payloads and, aligned with
+    them, the mapping errors of each record.
+    """
+    plan = mappings if isinstance(mappings, MappingPlan) else compile_mappings(mappings)
+    return plan.apply_batch(source_records)
 
 
 def get_nested_value(obj: Dict, path: str) -> Any:
-    """Get nested value from dictionary using dot notation"""
-    keys = path.split('.')
-    for key in keys:
-        if isinstance(obj, dict):
-            obj = obj.get(key)
-        else:
-            return None
-        if obj is None:
-            return None
-    return obj
+    """Get nested value using dot notation or selectors (`items[0].sku`, `items[*].sku`)"""
+    return get_cached_getter(path)(obj)
 
 
 def set_nested_value(obj: Dict, path: str, value: Any):
-    """Set nested value in dictionary using dot notation"""
-    keys = path.split('.')
-    for key in keys[:-1]:
-        if key not in obj:
-            obj[key] = {}
-        obj = obj[key]
-    obj[keys[-1]] = value
+    """Set nested value using dot notation or selectors (`lines[*].code`)"""
+    get_cached_setter(path)(obj, value)
 
 
 def apply_transformation(value: Any, transform: str, params: list) -> Any:
     """Apply transformation to value"""
-    if transform == 'uppercase':
-        return str(value).upper() if value is not None else None
-    elif transform == 'lowercase':
-        return str(value).lower() if value is not None else None
-    elif transform == 'trim':
-        return str(value).strip() if value is not None else None
-    elif transform == 'number':
-        return float(value) if value is not None else None
-    elif transform == 'string':
-        return str(value) if value is not None else None
-    elif transform == 'boolean':
-        return bool(value) if value is not None else None
-    elif transform == 'concat':
-        return str(value) + str(params[0] if params else '') if value is not None else None
-    elif transform == 'replace':
-        search = params[0] if len(params) > 0 else ''
-        replace = params[1] if len(params) > 1 else ''
-        return str(value).replace(search, replace) if value is not None else None
-    elif transform == 'split':
-        delim = params[0] if params else ','
-        return str(value).split(delim) if value is not None else None
-    elif transform == 'join':
-        delim = params[0] if params else ','
-        return delim.join(value) if isinstance(value, list) else value
-    else:
-        return value
+    return bind_transform(transform, params)(value)
 
 
 def add_authentication(headers: Dict, auth_type: str, auth_config: Dict) -> Dict:
@@ -274,49 +672,13 @@ def flatten_dict(d: Dict, parent_key: str = '', sep: str = '.') -> Dict:
 def evaluate_condition(condition_code: str, source_data: Dict[str, Any]) -> bool:
     """
     Evaluate a JavaScript condition.
-    Tries Js2Py first, then falls back to Python evaluation.
+    The condition is compiled once (Js2Py, or Python evaluation as a fallback)
+    and called with only the fields it references, or a lazy proxy when the
+    keys it reads are computed at runtime.
     """
-    # Build fields dictionary
-    fields = {}
-    flatten_fields(source_data, fields)
-
-    # Try using Js2Py for JavaScript evaluation
     try:
-        import js2py
-        import json
-
-        # Create JavaScript context with fields
-        fields_json = json.dumps(fields)
-
-        js_code = f"""
-        var fields = {fields_json};
-        (function() {{
-            {condition_code}
-        }})();
-        """
-
-        # Evaluate JavaScript
-        result = js2py.eval_js(js_code)
-        return bool(result)
-
-    except ImportError:
-        # Fallback: Simple Python-based evaluation
-        print("Warning: Js2Py not installed. Using Python-based condition evaluation.")
-        print("Install with: pip install Js2Py")
-
-        # Simple Python eval (SECURITY WARNING: Only for trusted conditions)
-        # Replace JavaScript syntax with Python equivalents
-        python_condition = condition_code.replace('===', '==').replace('!==', '!=').replace('&&', ' and ').replace('||', ' or ')
-
-        try:
-            # Evaluate in restricted namespace
-            namespace = {'fields': fields, 'True': True, 'False': False, 'None': None}
-            result = eval(python_condition, {"__builtins__": {}}, namespace)
-            return bool(result)
-        except Exception as e:
-            print(f"Error evaluating condition: {e}")
-            return True  # Default to true if evaluation fails
-
+        condition = compile_script(condition_code, kind='condition')
+        return bool(condition(condition.build_fields(source_data)))
     except Exception as e:
         print(f"Error in condition evaluation: {e}")
         return True  # Default to true if evaluation fails
@@ -324,178 +686,158 @@ def evaluate_condition(condition_code: str, source_data: Dict[str, Any]) -> bool
 
 def execute_javascript_transform(js_code: str, fields: Dict[str, Any]) -> Any:
     """
-    Execute JavaScript transformation code using Js2Py.
-    Falls back to Python evaluation if Js2Py is not available.
+    Execute JavaScript transformation code.
+    The code is compiled once (Js2Py, or Python evaluation as a fallback)
+    and called with the given fields. Sandbox timeouts are raised so they are
+    reported as mapping errors.
     """
-    # Try using Js2Py for JavaScript evaluation
     try:
-        import js2py
-        import json
-
-        # Prepare fields as JSON
-        fields_json = json.dumps(fields)
-
-        # Create JavaScript context with fields
-        js_full_code = f"""
-        var fields = {fields_json};
-        (function() {{
-            {js_code}
-        }})();
-        """
-
-        # Evaluate JavaScript and return result
-        result = js2py.eval_js(js_full_code)
-
-        # Convert Js2Py objects to Python native types
-        if hasattr(result, 'to_dict'):
-            return result.to_dict()
-        elif hasattr(result, 'to_list'):
-            return result.to_list()
-        else:
-            return result
-
-    except ImportError:
-        # Fallback: Simple Python-based evaluation
-        print("Warning: Js2Py not installed. JavaScript transformations may not work correctly.")
-        print("Install with: pip install Js2Py")
-
-        # Simple Python eval (SECURITY WARNING: Only for trusted code)
-        # Replace JavaScript syntax with Python equivalents
-        python_code = js_code.replace('===', '==').replace('!==', '!=').replace('&&', ' and ').replace('||', ' or ')
-
-        try:
-            # Evaluate in restricted namespace
-            namespace = {'fields': fields, 'True': True, 'False': False, 'None': None}
-            result = eval(python_code, {"__builtins__": {}}, namespace)
-            return result
-        except Exception as e:
-            print(f"Error evaluating JavaScript transform: {e}")
-            return None
-
+        transform = compile_script(js_code, kind='transform')
+        return transform(fields)
+    except SandboxTimeout:
+        raise
     except Exception as e:
         print(f"Error in JavaScript transformation: {e}")
         return None
 
 
-def flatten_fields(obj: Any, fields: Dict, prefix: str = '') -> None:
-    """Flatten nested object into fields dictionary with dot notation"""
-    if isinstance(obj, dict):
-        for key, value in obj.items():
-            new_key = f"{prefix}.{key}" if prefix else key
-            if isinstance(value, (dict, list)):
-                flatten_fields(value, fields, new_key)
-            fields[new_key] = value
-    elif isinstance(obj, list):
-        fields[prefix] = obj
-    else:
-        if prefix:
-            fields[prefix] = obj
+def execute_javascript_transform_batch(js_code: str, fields_list: List[Dict[str, Any]]) -> Tuple[List[Any], Dict[int, str]]:
+    """
+    Execute JavaScript transformation code over many field sets in one call.
+    Returns the results and a dict of failures (index -> error message).
+    """
+    try:
+        transform = compile_script(js_code, kind='transform')
+        return transform.call_batch(fields_list)
+    except Exception as e:
+        print(f"Error in JavaScript transformation: {e}")
+        return [None] * len(fields_list), {index: str(e) for index in range(len(fields_list))}
 
 
 def process_email_integration(integration: IntegrationConfiguration, incoming_payload: Dict[str, Any],
                               transformed_payload: Dict[str, Any], transformation_time: int,
-                              condition: str = None, condition_result: bool = True) -> Dict[str, Any]:
+                              condition: str = None, condition_result: bool = True, run_id=None) -> Dict[str, Any]:
     """
     Process email integration: send transformed data as email
     """
-    import smtplib
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
-    import json
+    email_config = integration.config_json.get('target', {}).get('emailConfig', {})
 
-    config = integration.config_json
-    target_config = config.get('target', {})
-    email_config = target_config.get('emailConfig', {})
+    # Digest mode: the payload joins the integration's next digest email
+    digest_options = DigestOptions.from_config(email_config.get('digest'))
+    if digest_options is not None:
+        return get_digest_queue().enqueue(integration, digest_options, incoming_payload, transformed_payload,
+                                          transformation_time, condition, condition_result, run_id=run_id)
 
     try:
-        # Extract email configuration
-        smtp_server = email_config.get('smtpServer')
-        smtp_port = email_config.get('smtpPort', 587)
-        smtp_username = email_config.get('smtpUsername')
-        smtp_password = email_config.get('smtpPassword')
-        from_email = email_config.get('fromEmail')
-        to_email = email_config.get('toEmail', '')
-        subject = email_config.get('subject', 'Integration Notification')
-        use_tls = email_config.get('useTLS', True)
-
-        # Parse recipient emails (comma-separated)
-        to_emails = [email.strip() for email in to_email.split(',') if email.strip()]
-
-        # Create email
-        msg = MIMEMultipart('alternative')
-        msg['From'] = from_email
-        msg['To'] = ', '.join(to_emails)
-        msg['Subject'] = subject
-
-        # Create email body with transformed data
-        email_body = json.dumps(transformed_payload, indent=2)
-        text_part = MIMEText(email_body, 'plain')
-        msg.attach(text_part)
-
-        # Send email
-        email_start = time.time()
-
-        if use_tls:
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            server.starttls()
-        else:
-            server = smtplib.SMTP(smtp_server, smtp_port)
+        sent = send_email(email_config, transformed_payload)
+    except Exception as e:
+        record_email_run(integration, incoming_payload, transformed_payload, transformation_time,
+                         condition, condition_result, error=e, run_id=run_id)
+        raise
+    return record_email_run(integration, incoming_payload, transformed_payload, transformation_time,
+                            condition, condition_result, sent=sent, run_id=run_id)
 
-        server.login(smtp_username, smtp_password)
-        server.sendmail(from_email, to_emails, msg.as_string())
-        server.quit()
 
-        email_time = int((time.time() - email_start) * 1000)
+def send_email(email_config: Dict[str, Any], transformed_payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Send the transformed data as an email; returns what was sent and how long it took"""
+    # Create email body with transformed data
+    email_body = dumps_pretty(transformed_payload)
+    return send_email_body(email_config, email_config.get('subject', 'Integration Notification'), email_body)
 
-        # Log the run
-        run = IntegrationRun.objects.create(
-            integration=integration,
-            incoming_payload=incoming_payload,
-            transformed_payload=transformed_payload,
-            outgoing_request={
-                'type': 'email',
-                'smtp_server': smtp_server,
-                'from': from_email,
-                'to': to_emails,
-                'subject': subject,
-                'body': transformed_payload,
-                'condition': condition if condition else None,
-                'condition_result': condition_result if condition else None
-            },
-            outgoing_response={
-                'status': 'sent',
-                'recipients': to_emails,
-                'message': 'Email sent successfully'
-            },
-            status='success',
-            error_message=None,
-            transformation_time_ms=transformation_time,
-            api_call_time_ms=email_time
-        )
 
-        return {
-            'run_id': run.id,
-            'status': 'success',
-            'message': f'Email sent to {len(to_emails)} recipient(s)'
-        }
+def send_email_body(email_config: Dict[str, Any], subject: str, text_body: str,
+                    html_body: str = None) -> Dict[str, Any]:
+    """Send an email with a plain text (and optional HTML) body to the configured recipients"""
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
 
-    except Exception as e:
-        # Log failed run
-        run = IntegrationRun.objects.create(
-            integration=integration,
+    # Extract email configuration
+    smtp_server = email_config.get('smtpServer')
+    from_email = email_config.get('fromEmail')
+    to_email = email_config.get('toEmail', '')
+
+    # Parse recipient emails (comma-separated)
+    to_emails = [email.strip() for email in to_email.split(',') if email.strip()]
+
+    # Create email
+    msg = MIMEMultipart('alternative')
+    msg['From'] = from_email
+    msg['To'] = ', '.join(to_emails)
+    msg['Subject'] = subject
+    msg.attach(MIMEText(text_body, 'plain'))
+    if html_body is not None:
+        msg.attach(MIMEText(html_body, 'html'))
+
+    # Send email on a pooled, already authenticated connection
+    email_start = time.time()
+    get_smtp_pool().send(email_config, from_email, to_emails, msg.as_string())
+
+    return {
+        'smtp_server': smtp_server,
+        'from': from_email,
+        'to': to_emails,
+        'subject': subject,
+        'email_time': int((time.time() - email_start) * 1000),
+    }
+
+
+def record_email_run(integration: IntegrationConfiguration, incoming_payload: Dict[str, Any],
+                     transformed_payload: Dict[str, Any], transformation_time: int,
+                     condition: str = None, condition_result: bool = True,
+                     sent: Dict[str, Any] = None, error: Exception = None, parent_run_id=None,
+                     run_id=None) -> Dict[str, Any]:
+    """Log the run of an email delivery (`sent` on success, `error` on failure)"""
+    if error is not None:
+        run_id = save_run(
+            integration, run_id,
+            parent_run_id=parent_run_id,
             incoming_payload=incoming_payload,
             transformed_payload=transformed_payload,
-            outgoing_request={
+            outgoing_request=dict({
                 'type': 'email',
                 'error': 'Failed to send email'
-            },
-            outgoing_response={'error': str(e)},
+            }, **target_leg_info(integration)),
+            outgoing_response={'error': str(error)},
             status='error',
-            error_message=str(e),
+            error_message=str(error),
             transformation_time_ms=transformation_time,
             api_call_time_ms=0
         )
+        return {
+            'run_id': run_id,
+            'status': 'error',
+            'message': str(error)
+        }
 
-        raise
-
-
+    # Log the run
+    run_id = save_run(
+        integration, run_id,
+        parent_run_id=parent_run_id,
+        incoming_payload=incoming_payload,
+        transformed_payload=transformed_payload,
+        outgoing_request=dict({
+            'type': 'email',
+            'smtp_server': sent['smtp_server'],
+            'from': sent['from'],
+            'to': sent['to'],
+            'subject': sent['subject'],
+            'body': transformed_payload,
+            'condition': condition if condition else None,
+            'condition_result': condition_result if condition else None
+        }, **target_leg_info(integration)),
+        outgoing_response={
+            'status': 'sent',
+            'recipients': sent['to'],
+            'message': 'Email sent successfully'
+        },
+        status='success',
+        error_message=None,
+        transformation_time_ms=transformation_time,
+        api_call_time_ms=sent['email_time']
+    )
+
+    return {
+        'run_id': run_id,
+        'status': 'success',
+        'message': f"Email sent to {len(sent['to'])} recipient(s)"
+    }
@@ -0,0 +1,265 @@
+# js_engine.py
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from django.conf import settings
+
+from .expression_engine import ExpressionSyntaxError, compile_expression
+from .field_access import FieldAccess, LazyFields, analyze_field_access
+from .js_sandbox import SandboxError, SandboxTimeout, get_sandbox_pool, sandbox_enabled
+
+# Result of a batch entry whose sandbox worker timed out (single calls raise SandboxTimeout instead)
+TIMED_OUT = object()
+
+
+class LRUCache:
+    """Small thread-safe LRU cache"""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Compiled scripts keyed by (kind, sha256 of the source)
+_compiled_cache = LRUCache(getattr(settings, 'JS_COMPILE_CACHE_SIZE', 512))
+
+
+def source_hash(code: str) -> str:
+    """Stable cache key for a piece of JavaScript source"""
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+
+def to_python(result: Any) -> Any:
+    """Convert Js2Py objects to Python native types"""
+    if hasattr(result, 'to_dict'):
+        return result.to_dict()
+    elif hasattr(result, 'to_list'):
+        return result.to_list()
+    return result
+
+
+_js_lazy_fields_class = None
+
+
+def _js_lazy_fields(fields: LazyFields) -> Any:
+    """Expose LazyFields to Js2Py as a JavaScript object whose properties resolve on first read"""
+    global _js_lazy_fields_class
+    if _js_lazy_fields_class is None:
+        from js2py.base import Js, ObjectPrototype, PyJsObject
+
+        class JsLazyFields(PyJsObject):
+            def __init__(self, lazy):
+                PyJsObject.__init__(self, {}, ObjectPrototype)
+                self.lazy = lazy
+
+            def get_own_property(self, prop):
+                if prop not in self.own:
+                    try:
+                        value = self.lazy[prop]
+                    except KeyError:
+                        return None
+                    self.own[prop] = {'value': Js(to_js_value(value)), 'writable': True,
+                                      'enumerable': True, 'configurable': True}
+                return self.own[prop]
+
+        _js_lazy_fields_class = JsLazyFields
+    return _js_lazy_fields_class(fields)
+
+
+def to_js_value(value: Any) -> Any:
+    """
+    Prepare Python values for Js2Py. Js2Py maps None to `undefined`, while
+    payload nulls must stay `null` in JavaScript.
+    """
+    if value is None:
+        from js2py.base import null
+        return null
+    if isinstance(value, dict):
+        return {key: to_js_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_js_value(item) for item in value]
+    if isinstance(value, LazyFields):
+        return _js_lazy_fields(value)
+    return value
+
+
+class CompiledScript:
+    """A compiled `jsCode` mapping or condition, cached with its field access analysis"""
+
+    def __init__(self, code: str, function: Optional[Callable[[Any], Any]], access: FieldAccess, engine: str,
+                 sandboxed: bool = False):
+        self.code = code
+        self.function = function
+        self.access = access
+        self.engine = engine  # 'native', 'js2py' or 'python'
+        self.sandboxed = sandboxed  # run in the warm worker pool instead of in-process
+        self.batch_function = None
+
+    def __call__(self, fields: Any) -> Any:
+        if self.sandboxed:
+            ok, value = get_sandbox_pool().run(self.code, [fields])[0]
+            if ok is None:
+                raise SandboxTimeout(value)
+            if not ok:
+                raise SandboxError(value)
+            return value
+        return self.function(fields)
+
+    def build_fields(self, source_data: Any) -> Any:
+        """Extract only the fields this script reads from a payload"""
+        return self.access.build(source_data)
+
+    def call_batch(self, fields_list: List[Any]) -> Tuple[List[Any], Dict[int, str]]:
+        """
+        Run the script over many field sets. Js2Py scripts are invoked once
+        with the whole array, or as one job in a sandbox worker. Returns the
+        results and a dict of failures (index -> error message); failed entries
+        yield None and timed out entries TIMED_OUT.
+        """
+        if self.sandboxed:
+            try:
+                outcomes = get_sandbox_pool().run(self.code, fields_list)
+            except SandboxTimeout as e:
+                outcomes = [(None, str(e))] * len(fields_list)
+        elif self.engine == 'js2py':
+            if self.batch_function is None:
+                self.batch_function = _compile_js2py_batch(self.code)
+            outcomes = self.batch_function(fields_list)
+        else:
+            outcomes = []
+            for fields in fields_list:
+                try:
+                    outcomes.append((True, self.function(fields)))
+                except Exception as e:
+                    outcomes.append((False, str(e)))
+
+        results, failures = [], {}
+        for index, (ok, value) in enumerate(outcomes):
+            if ok:
+                results.append(value)
+            else:
+                results.append(TIMED_OUT if ok is None else None)
+                failures[index] = value
+        return results, failures
+
+
+def _compile_js2py(code: str) -> Callable[[Dict[str, Any]], Any]:
+    """Translate a function body into a reusable Js2Py function taking `fields`"""
+    import js2py
+
+    js_function = js2py.eval_js(f"""
+    (function(fields) {{
+        {code}
+    }})
+    """)
+
+    def call(fields):
+        return to_python(js_function(to_js_value(fields)))
+    return call
+
+
+def _compile_js2py_batch(code: str) -> Callable[[List[Any]], List[Tuple[bool, Any]]]:
+    """Translate a function body into a Js2Py function mapped over an array of field sets"""
+    import js2py
+
+    js_function = js2py.eval_js(f"""
+    (function(batch) {{
+        var transform = function(fields) {{
+            {code}
+        }};
+        var results = [];
+        for (var i = 0; i < batch.length; i++) {{
+            try {{
+                results.push([true, transform(batch[i])]);
+            }} catch (e) {{
+                results.push([false, String(e)]);
+            }}
+        }}
+        return results;
+    }})
+    """)
+
+    def call(fields_list):
+        return js_function(to_js_value(fields_list)).to_list()
+    return call
+
+
+def _compile_python_fallback(code: str) -> Callable[[Dict[str, Any]], Any]:
+    """
+    Compile the JavaScript-ish code as a Python expression.
+    SECURITY WARNING: Only for trusted code.
+    """
+    python_code = code.replace('===', '==').replace('!==', '!=').replace('&&', ' and ').replace('||', ' or ')
+    compiled = compile(python_code, '<javascript>', 'eval')
+
+    def call(fields):
+        namespace = {'fields': fields, 'True': True, 'False': False, 'None': None}
+        return eval(compiled, {"__builtins__": {}}, namespace)
+    return call
+
+
+def compile_script(code: str, kind: str = 'transform') -> CompiledScript:
+    """
+    Get a compiled function for a `jsCode` mapping or condition.
+    Code in the native expression subset is compiled to Python closures,
+    anything else is translated by Js2Py. Either way the source is compiled
+    once and looked up by hash afterwards; the returned script takes the
+    `fields` object as its only argument. With JS_SANDBOX_ENABLED, non-native
+    scripts are compiled and run in the sandbox worker pool instead.
+    """
+    key = (kind, source_hash(code))
+    compiled = _compiled_cache.get(key)
+    if compiled is not None:
+        return compiled
+
+    function = None
+    if getattr(settings, 'NATIVE_EXPRESSIONS_ENABLED', True):
+        try:
+            function, engine = compile_expression(code), 'native'
+        except ExpressionSyntaxError:
+            function = None
+
+    sandboxed = False
+    if function is None and sandbox_enabled():
+        # Compiled lazily inside each worker
+        engine, sandboxed = 'js2py', True
+    elif function is None:
+        try:
+            function, engine = _compile_js2py(code), 'js2py'
+        except ImportError:
+            print("Warning: Js2Py not installed. Using Python-based evaluation.")
+            print("Install with: pip install Js2Py")
+            function, engine = _compile_python_fallback(code), 'python'
+
+    compiled = CompiledScript(code, function, analyze_field_access(code), engine, sandboxed=sandboxed)
+    _compiled_cache.set(key, compiled)
+    return compiled
+
+
+def clear_compiled_scripts() -> None:
+    """Drop all compiled scripts"""
+    _compiled_cache.clear()
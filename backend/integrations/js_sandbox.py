@@ -0,0 +1,227 @@
+# js_sandbox.py
+"""
+Pool of warm worker processes for running Js2Py scripts out of process.
+
+Each worker keeps its own cache of compiled scripts and runs every call
+under a CPU-time limit (SIGPROF interval timer) and an address-space limit
+(RLIMIT_AS). The parent additionally enforces a wall-clock limit: a worker
+that does not answer in time is killed and replaced, so a runaway script
+never blocks a request thread for longer than the configured timeout.
+
+Workers import Js2Py and run a trivial script as soon as they start, and
+report ready before they are given a job, so that start-up cost is bounded
+by JS_SANDBOX_START_TIMEOUT rather than eating into the first call's limit.
+
+The pool belongs to the process, so a server with N worker processes runs
+N * JS_SANDBOX_WORKERS sandbox processes; the default is kept small for
+that reason. 0 sizes the pool to the CPU count (single-process servers).
+"""
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+from typing import Any, List, Optional, Tuple
+
+from django.conf import settings
+
+
+class SandboxError(Exception):
+    """A sandboxed script could not be run (worker died, pool shut down, ...)"""
+
+
+class SandboxTimeout(SandboxError):
+    """A sandboxed script exceeded its time limit"""
+
+
+class _CpuTimeExceeded(BaseException):
+    # BaseException so generic `except Exception` handlers inside Js2Py don't swallow it
+    pass
+
+
+def _raise_cpu_timeout(signum, frame):
+    raise _CpuTimeExceeded()
+
+
+def _worker_main(connection, memory_limit_mb: int) -> None:
+    """Worker loop: warm up and report ready, then receive (code, fields_list, cpu_timeout), send back per-item outcomes"""
+    import signal
+
+    if memory_limit_mb:
+        try:
+            import resource
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            print(f"JS sandbox: could not set memory limit: {e}")
+    signal.signal(signal.SIGPROF, _raise_cpu_timeout)
+
+    from .js_engine import LRUCache, _compile_js2py, _compile_python_fallback, source_hash
+
+    compiled = LRUCache(getattr(settings, 'JS_COMPILE_CACHE_SIZE', 512))
+
+    # Warm up: importing Js2Py and its first translation take far longer than a typical call
+    try:
+        _compile_js2py('return fields;')({})
+    except ImportError:
+        pass
+    connection.send('ready')
+
+    while True:
+        try:
+            job = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if job is None:
+            return
+
+        code, fields_list, cpu_timeout = job
+        key = source_hash(code)
+        function = compiled.get(key)
+        outcomes = []
+        try:
+            if function is None:
+                try:
+                    function = _compile_js2py(code)
+                except ImportError:
+                    function = _compile_python_fallback(code)
+                compiled.set(key, function)
+        except Exception as e:
+            connection.send([(False, str(e))] * len(fields_list))
+            continue
+
+        for fields in fields_list:
+            try:
+                signal.setitimer(signal.ITIMER_PROF, cpu_timeout)
+                try:
+                    outcomes.append((True, function(fields)))
+                finally:
+                    signal.setitimer(signal.ITIMER_PROF, 0)
+            except _CpuTimeExceeded:
+                outcomes.append((None, f"Script exceeded CPU time limit of {cpu_timeout}s"))
+            except MemoryError:
+                outcomes.append((False, f"Script exceeded memory limit of {memory_limit_mb}MB"))
+            except Exception as e:
+                outcomes.append((False, str(e)))
+
+        try:
+            connection.send(outcomes)
+        except Exception as e:
+            # Unpicklable result: report every item as failed rather than dying
+            connection.send([(False, f"Unserializable result: {e}")] * len(fields_list))
+
+
+class _Worker:
+    def __init__(self, context, memory_limit_mb: int):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_connection, memory_limit_mb), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.ready = False
+
+    def wait_ready(self, timeout: float) -> None:
+        """Wait for the worker's warm-up to finish; raises SandboxError if it does not in time"""
+        if self.ready:
+            return
+        try:
+            if not self.connection.poll(timeout) or self.connection.recv() != 'ready':
+                raise SandboxError(f"JS sandbox worker did not start within {timeout:g}s")
+        except (EOFError, OSError) as e:
+            raise SandboxError(f"JS sandbox worker died while starting: {e}")
+        self.ready = True
+
+    def stop(self) -> None:
+        try:
+            self.connection.send(None)
+        except Exception:
+            pass
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+        self.connection.close()
+
+
+class SandboxPool:
+    """Fixed-size pool of warm JavaScript workers"""
+
+    def __init__(self, size: int, cpu_timeout: float, memory_limit_mb: int, start_timeout: float = 30.0):
+        self.size = size
+        self.cpu_timeout = cpu_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.start_timeout = start_timeout
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(_Worker(self._context, memory_limit_mb))
+
+    def run(self, code: str, fields_list: List[Any]) -> List[Tuple[bool, Any]]:
+        """
+        Run a script over field sets in one worker. Returns (ok, value) per field
+        set: ok is True on success, False on a script error and None when the
+        item hit the CPU limit, with the error message as value. Raises
+        SandboxTimeout when the worker has to be killed.
+        """
+        if self._closed:
+            raise SandboxError("JS sandbox pool is shut down")
+
+        worker = self._idle.get()
+        # CPU limits apply per item; the wall-clock limit leaves headroom for IPC and I/O waits
+        wall_timeout = self.cpu_timeout * max(len(fields_list), 1) * 2 + 1
+        try:
+            worker.wait_ready(self.start_timeout)
+            worker.connection.send((code, fields_list, self.cpu_timeout))
+            if not worker.connection.poll(wall_timeout):
+                raise SandboxTimeout(f"Script did not finish within {wall_timeout:g}s")
+            outcomes = worker.connection.recv()
+        except SandboxError:
+            # Timed out or never started
+            worker = self._replace(worker)
+            raise
+        except (EOFError, OSError) as e:
+            worker = self._replace(worker)
+            raise SandboxError(f"JS sandbox worker died: {e}")
+        finally:
+            self._idle.put(worker)
+
+        return outcomes
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        return _Worker(self._context, self.memory_limit_mb)
+
+    def shutdown(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                return
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def sandbox_enabled() -> bool:
+    return getattr(settings, 'JS_SANDBOX_ENABLED', False)
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """Get or start the process-wide sandbox pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SandboxPool(
+                    getattr(settings, 'JS_SANDBOX_WORKERS', 2) or os.cpu_count() or 1,
+                    getattr(settings, 'JS_SANDBOX_CPU_TIMEOUT', 2.0),
+                    getattr(settings, 'JS_SANDBOX_MEMORY_MB', 256),
+                    getattr(settings, 'JS_SANDBOX_START_TIMEOUT', 30.0)
+                )
+                atexit.register(_pool.shutdown)
+    return _pool
+
@@ -0,0 +1,169 @@
+# latency_tracker.py
+"""
+Adaptive delivery timeouts driven by observed latency.
+
+Every delivery's call time (the same measurement stored as
+`api_call_time_ms`) is added to a rolling histogram for its target origin.
+Once an origin has enough samples, its connect and read timeouts become
+DELIVERY_TIMEOUT_MULTIPLIER x its p99 latency, clamped to the connect and
+read floor/ceiling settings; before that the ceilings are used. Deliveries
+that time out are recorded at their elapsed time, so a target that slows
+down raises its own p99 (and timeouts) instead of timing out forever.
+
+Integrations can override this in `target.timeout`, either with fixed
+values (seconds):
+
+    "timeout": {"connect": 2, "read": 10}      or      "timeout": 10
+
+or by tuning the adaptive policy:
+
+    "timeout": {"multiplier": 3, "minSeconds": 0.5, "maxSeconds": 15}
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+# Bucket upper bounds in ms: 1ms to ~2.5min, growing by 25% per bucket
+BUCKET_BOUNDS = [1.25 ** i for i in range(54)]
+
+
+class RollingHistogram:
+    """Log-bucketed latency histogram over a sliding window of `slots` sub-windows"""
+
+    def __init__(self, window_seconds: float = 300, slots: int = 5):
+        self.slot_seconds = window_seconds / slots
+        self.max_slots = slots
+        self._slots: List[Tuple[int, List[int]]] = []  # (slot number, bucket counts)
+        self._lock = threading.Lock()
+
+    def _current_counts(self, now: float) -> List[int]:
+        slot = int(now // self.slot_seconds)
+        if not self._slots or self._slots[-1][0] != slot:
+            self._slots.append((slot, [0] * (len(BUCKET_BOUNDS) + 1)))
+            self._slots = [entry for entry in self._slots if entry[0] > slot - self.max_slots]
+        return self._slots[-1][1]
+
+    def record(self, latency_ms: float) -> None:
+        with self._lock:
+            counts = self._current_counts(time.monotonic())
+            counts[bisect.bisect_left(BUCKET_BOUNDS, latency_ms)] += 1
+
+    def _merged(self) -> List[int]:
+        oldest = int(time.monotonic() // self.slot_seconds) - self.max_slots
+        merged = [0] * (len(BUCKET_BOUNDS) + 1)
+        with self._lock:
+            for slot, counts in self._slots:
+                if slot > oldest:
+                    for index, count in enumerate(counts):
+                        merged[index] += count
+        return merged
+
+    def count(self) -> int:
+        return sum(self._merged())
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound (ms) of the bucket holding the q-th percentile, or None without samples"""
+        merged = self._merged()
+        total = sum(merged)
+        if not total:
+            return None
+        rank = math.ceil(total * q / 100)
+        seen = 0
+        for index, count in enumerate(merged):
+            seen += count
+            if seen >= rank:
+                return BUCKET_BOUNDS[min(index, len(BUCKET_BOUNDS) - 1)]
+        return BUCKET_BOUNDS[-1]
+
+
+_histograms: Dict[str, RollingHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def get_histogram(origin: str) -> RollingHistogram:
+    """Process-wide latency histogram for a target origin"""
+    histogram = _histograms.get(origin)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.get(origin)
+            if histogram is None:
+                histogram = _histograms[origin] = RollingHistogram(
+                    window_seconds=getattr(settings, 'DELIVERY_LATENCY_WINDOW_SECONDS', 300)
+                )
+    return histogram
+
+
+def record_latency(origin: str, latency_ms: float) -> None:
+    get_histogram(origin).record(latency_ms)
+
+
+class TimeoutPolicy:
+    """Connect/read timeouts for a delivery: fixed, or derived from the origin's p99 latency"""
+
+    __slots__ = ('connect', 'read', 'multiplier', 'min_seconds', 'max_seconds')
+
+    def __init__(self, connect: Optional[float] = None, read: Optional[float] = None,
+                 multiplier: Optional[float] = None, min_seconds: Optional[float] = None,
+                 max_seconds: Optional[float] = None):
+        self.connect = connect
+        self.read = read
+        self.multiplier = multiplier if multiplier is not None else \
+            getattr(settings, 'DELIVERY_TIMEOUT_MULTIPLIER', 4)
+        self.min_seconds = min_seconds  # overrides both floors
+        self.max_seconds = max_seconds  # overrides both ceilings
+
+    @classmethod
+    def from_config(cls, timeout_config: Any) -> 'TimeoutPolicy':
+        """Policy for a `target.timeout` value (adaptive when unset)"""
+        if isinstance(timeout_config, (int, float)) and not isinstance(timeout_config, bool):
+            return cls(connect=float(timeout_config), read=float(timeout_config))
+        if not isinstance(timeout_config, dict):
+            return cls()
+        return cls(
+            connect=timeout_config.get('connect'),
+            read=timeout_config.get('read'),
+            multiplier=timeout_config.get('multiplier'),
+            min_seconds=timeout_config.get('minSeconds'),
+            max_seconds=timeout_config.get('maxSeconds'),
+        )
+
+    def _bound(self, p99: Optional[float], floor: float, ceiling: float) -> float:
+        floor = self.min_seconds if self.min_seconds is not None else floor
+        ceiling = self.max_seconds if self.max_seconds is not None else ceiling
+        if p99 is None:
+            return ceiling
+        return min(ceiling, max(floor, p99 / 1000.0 * self.multiplier))
+
+    def resolve(self, origin: str) -> Tuple[float, float]:
+        """(connect, read) timeouts in seconds for a request to `origin`"""
+        p99 = None
+        if self.connect is None or self.read is None:
+            histogram = get_histogram(origin)
+            if histogram.count() >= getattr(settings, 'DELIVERY_TIMEOUT_MIN_SAMPLES', 20):
+                p99 = histogram.percentile(99)
+
+        connect = self.connect if self.connect is not None else self._bound(
+            p99, getattr(settings, 'DELIVERY_CONNECT_TIMEOUT_MIN', 1), getattr(settings, 'DELIVERY_CONNECT_TIMEOUT_MAX', 10))
+        read = self.read if self.read is not None else self._bound(
+            p99, getattr(settings, 'DELIVERY_READ_TIMEOUT_MIN', 1), getattr(settings, 'DELIVERY_READ_TIMEOUT_MAX', 30))
+        return float(connect), float(read)
+
+
+def latency_stats() -> Dict[str, Dict[str, Any]]:
+    """Sample count, p50/p99 latency and the adaptive timeouts per origin"""
+    policy = TimeoutPolicy()
+    stats = {}
+    for origin, histogram in list(_histograms.items()):
+        connect, read = policy.resolve(origin)
+        stats[origin] = {
+            'samples': histogram.count(),
+            'p50_ms': histogram.percentile(50),
+            'p99_ms': histogram.percentile(99),
+            'connect_timeout': connect,
+            'read_timeout': read,
+        }
+    return stats
@@ -0,0 +1,84 @@
+# linger_queue.py
+"""
+Per-key buffers that are flushed by a background thread when they fill up or
+their linger time runs out. Shared by bulk delivery (batch_delivery) and
+email digests (email_digest).
+
+A buffer is any object with a `deadline` (time.monotonic() value) and an
+`is_full()` method; subclasses decide what goes into it and implement
+`_flush`, which receives the buffers due for sending.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from django.db import close_old_connections
+
+
+class LingerQueue:
+    """Open buffers per key, handed to `_flush` by one background thread when full or due"""
+
+    thread_name = 'linger-queue'
+
+    def __init__(self):
+        self._open: Dict[str, Any] = {}
+        self._ready: List[Any] = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name=self.thread_name, daemon=True)
+            self._thread.start()
+
+    def _add(self, key: str, new_buffer: Callable[[], Any], add: Callable[[Any], None],
+             close_first: Callable[[Any], bool] = None) -> None:
+        """
+        Add to the open buffer of `key` (created with `new_buffer`) through `add`.
+        `close_first` may close the open buffer before the item goes in.
+        """
+        with self._condition:
+            buffer = self._open.get(key)
+            if buffer is not None and close_first is not None and close_first(buffer):
+                self._ready.append(self._open.pop(key))
+                buffer = None
+            if buffer is None:
+                buffer = self._open[key] = new_buffer()
+            add(buffer)
+            if buffer.is_full():
+                self._ready.append(self._open.pop(key))
+            self._condition.notify()
+
+    def _take_due(self, force: bool = False) -> List[Any]:
+        """Move expired (or, with force, all) open buffers to ready and take everything ready"""
+        now = time.monotonic()
+        for key, buffer in list(self._open.items()):
+            if force or buffer.deadline <= now:
+                self._ready.append(self._open.pop(key))
+        ready, self._ready = self._ready, []
+        return ready
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._condition:
+                buffers = self._take_due()
+                if not buffers:
+                    deadlines = [buffer.deadline for buffer in self._open.values()]
+                    timeout = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+                    self._condition.wait(timeout)
+                    continue
+            try:
+                self._flush(buffers)
+            except Exception as e:
+                print(f"Error flushing {self.thread_name} buffers: {e}")
+            finally:
+                close_old_connections()
+
+    def flush_all(self) -> None:
+        """Flush every buffer now, in the calling thread"""
+        with self._condition:
+            buffers = self._take_due(force=True)
+        self._flush(buffers)
+
+    def _flush(self, buffers: List[Any]) -> None:
+        raise NotImplementedError
@@ -0,0 +1,72 @@
+# management/commands/run_webhook_workers.py
+# Django management command to process webhooks accepted by async integrations
+
+import os
+import signal
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from integrations.resilience import get_retry_scheduler
+from integrations.webhook_queue import drain
+
+
+class Command(BaseCommand):
+    help = 'Process queued webhook jobs of async integrations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Worker threads')
+        parser.add_argument('--batch-size', type=int, default=10, help='Jobs claimed per poll')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help='Seconds to wait when the queue is empty (default: WEBHOOK_QUEUE_POLL_SECONDS)')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        poll_interval = options['poll_interval']
+        if poll_interval is None:
+            poll_interval = getattr(settings, 'WEBHOOK_QUEUE_POLL_SECONDS', 1)
+        stop = threading.Event()
+        processed = [0] * options['workers']
+
+        def work(index):
+            worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+            try:
+                while not stop.is_set():
+                    close_old_connections()
+                    try:
+                        claimed = drain(worker_id, options['batch_size'])
+                    except Exception as e:
+                        self.stdout.write(self.style.ERROR(f"Worker {worker_id} failed to claim jobs: {e}"))
+                        claimed = 0
+                    processed[index] += claimed
+                    if not claimed:
+                        if options['once']:
+                            break
+                        stop.wait(poll_interval)
+            finally:
+                connection.close()
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        if not options['once']:
+            # Also runs the retries of this process and sweeps up those of dead ones
+            get_retry_scheduler()
+
+        self.stdout.write(f"Starting {options['workers']} webhook worker(s)")
+        threads = [threading.Thread(target=work, args=(index,), name=f'webhook-worker-{index}', daemon=True)
+                   for index in range(options['workers'])]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS(f"Webhook workers stopped after {sum(processed)} job(s)"))
@@ -0,0 +1,324 @@
+# mapping_compiler.py
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .js_engine import TIMED_OUT
+from .field_paths import PathSyntaxError, compile_getter, compile_setter, is_multi_path, is_plain_path, parse_path
+from .transforms import resolve_transform
+
+
+# Placeholder written into the output skeleton for targets that have not been set yet
+_UNSET = object()
+
+
+class CompiledMapping:
+    """A single mapping with its paths pre-split and its transform resolved"""
+
+    __slots__ = ('target', 'target_keys', 'slot', 'leaf', 'setter', 'getter', 'transform',
+                 'batch_transform', 'js_code', 'field_getters')
+
+    def __init__(self, target: str, literal: bool = False):
+        self.target = target
+        # Plain dot targets are laid out in the skeleton; selector targets are always set dynamically
+        self.target_keys = tuple(target.split('.')) if literal else \
+            tuple(arg for _, arg in parse_path(target)) if is_plain_path(target) else None
+        self.slot = None          # index of the parent container in the output skeleton
+        self.leaf = self.target_keys[-1] if self.target_keys else None
+        self.setter = compile_setter(target, literal=literal)
+        self.getter = None
+        self.transform = None
+        self.batch_transform = None
+        self.js_code = None
+        self.field_getters = None  # [(field_path, getter)] for JavaScript mappings
+
+    def evaluate(self, source_data: Dict[str, Any]) -> Any:
+        """Compute the output value of this mapping for one source payload"""
+        if self.js_code is not None:
+            from .integration_processor import execute_javascript_transform
+
+            fields = {path: getter(source_data) for path, getter in self.field_getters}
+            return execute_javascript_transform(self.js_code, fields)
+
+        return self.transform(self.getter(source_data))
+
+    def evaluate_batch(self, records: List[Dict[str, Any]]) -> Tuple[List[Any], Dict[int, str]]:
+        """
+        Compute this mapping for a whole batch of payloads.
+        Returns the values and a dict of failures (record index -> error message).
+        """
+        if self.js_code is not None:
+            from .integration_processor import execute_javascript_transform_batch
+
+            fields_list = [{path: getter(record) for path, getter in self.field_getters} for record in records]
+            return execute_javascript_transform_batch(self.js_code, fields_list)
+
+        getter, transform = self.getter, self.transform
+        column = [getter(record) for record in records]
+        try:
+            if self.batch_transform is not None:
+                return self.batch_transform(column), {}
+            return [transform(value) for value in column], {}
+        except Exception:
+            pass
+
+        # Some record failed: redo the column one value at a time to isolate it
+        values, failures = [], {}
+        for index, value in enumerate(column):
+            try:
+                values.append(transform(value))
+            except Exception as e:
+                values.append(None)
+                failures[index] = str(e)
+        return values, failures
+
+
+class MappingPlan:
+    """
+    Precompiled form of an integration's mappings.
+
+    Holds the compiled mappings in declaration order together with an output
+    skeleton: the intermediate containers and target keys are laid out once at
+    compile time, so applying the plan only assigns leaf values.
+    """
+
+    def __init__(self, steps: List[CompiledMapping], skeleton: List[Tuple[int, str, bool]]):
+        self.steps = steps
+        # (parent slot, key, is_container) in creation order; slot 0 is the root
+        self.skeleton = skeleton
+
+    def new_output(self) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Instantiate the output skeleton, returning the root and every container slot"""
+        slots = [{}]
+        for parent, key, is_container in self.skeleton:
+            if is_container:
+                container = {}
+                slots[parent][key] = container
+                slots.append(container)
+            else:
+                slots[parent][key] = _UNSET
+        return slots[0], slots
+
+    def apply(self, source_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Transform a single source payload"""
+        output, slots = self.new_output()
+        failed = False
+
+        for step in self.steps:
+            try:
+                value = step.evaluate(source_data)
+                if step.slot is None:
+                    step.setter(output, value)
+                else:
+                    slots[step.slot][step.leaf] = value
+            except Exception as e:
+                print(f"Error in mapping {step.target}: {e}")
+                failed = True
+
+        if failed:
+            self._prune(slots)
+        return output
+
+    def apply_batch(self, records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[List[Dict[str, str]]]]:
+        """
+        Transform many payloads, applying each mapping across the whole batch.
+        Returns the outputs and, aligned with them, a list of mapping errors per record.
+        """
+        records = list(records)
+        outputs, slot_lists = [], []
+        for _ in records:
+            output, slots = self.new_output()
+            outputs.append(output)
+            slot_lists.append(slots)
+        errors = [[] for _ in records]
+        failed = set()
+
+        for step in self.steps:
+            values, failures = step.evaluate_batch(records)
+            for index, value in enumerate(values):
+                if failures and index in failures:
+                    print(f"Error in mapping {step.target}: {failures[index]}")
+                    errors[index].append({'target': step.target, 'error': failures[index]})
+                    # JavaScript failures still yield null, as in execute_javascript_transform;
+                    # timeouts drop the target like the exception they raise in apply()
+                    if step.js_code is None or value is TIMED_OUT:
+                        failed.add(index)
+                        continue
+                try:
+                    if step.slot is None:
+                        step.setter(outputs[index], value)
+                    else:
+                        slot_lists[index][step.slot][step.leaf] = value
+                except Exception as e:
+                    print(f"Error in mapping {step.target}: {e}")
+                    errors[index].append({'target': step.target, 'error': str(e)})
+                    failed.add(index)
+
+        for index in failed:
+            self._prune(slot_lists[index])
+        return outputs, errors
+
+    def _prune(self, slots: List[Dict[str, Any]]) -> None:
+        """Drop skeleton entries left unset by failed mappings"""
+        for container in slots:
+            for key in [k for k, v in container.items() if v is _UNSET]:
+                del container[key]
+
+        # Remove containers that ended up empty, deepest first
+        index = len(slots) - 1
+        for parent, key, is_container in reversed(self.skeleton):
+            if not is_container:
+                continue
+            container = slots[index]
+            index -= 1
+            if not container and slots[parent].get(key) is container:
+                del slots[parent][key]
+
+
+def compile_mappings(mappings: list) -> MappingPlan:
+    """Compile a raw `config_json['mappings']` list into a MappingPlan"""
+    steps = []
+
+    for mapping in mappings or []:
+        target = mapping.get('target')
+        if not target:
+            continue
+
+        try:
+            step = CompiledMapping(target)
+        except PathSyntaxError as e:
+            print(f"Warning: {e}; writing {target!r} as a dotted key")
+            step = CompiledMapping(target, literal=True)
+
+        if mapping.get('transform') == 'javascript':
+            js_code = mapping.get('jsCode')
+            if not js_code:
+                continue
+            step.js_code = js_code
+            step.field_getters = [
+                (field_path, _compile_source(field_path))
+                for field_path in mapping.get('sourceFields', [])
+            ]
+        else:
+            source = mapping.get('source')
+            if not source:
+                continue
+            step.getter = _compile_source(source)
+            bound = resolve_transform(mapping.get('transform'), mapping.get('params', []))
+            if step.target_keys is None and _is_multi(source) and is_multi_path(target):
+                # items[*].sku -> lines[*].code: the transform applies to each element
+                step.transform = _elementwise(bound)
+            else:
+                step.transform = bound.scalar
+                step.batch_transform = bound.batch
+
+        steps.append(step)
+
+    return MappingPlan(steps, _build_skeleton(steps))
+
+
+def _compile_source(path: str) -> Callable[[Any], Any]:
+    """Getter for a source path; one that is not a valid selector is read as a dotted key"""
+    try:
+        return compile_getter(path)
+    except PathSyntaxError as e:
+        print(f"Warning: {e}; reading {path!r} as a dotted key")
+        return compile_getter(path, literal=True)
+
+
+def _is_multi(path: str) -> bool:
+    try:
+        return is_multi_path(path)
+    except PathSyntaxError:
+        return False
+
+
+def _elementwise(bound) -> Callable[[Any], Any]:
+    """Apply a bound transform to every element of a matched list"""
+    scalar, batch = bound.scalar, bound.batch
+
+    def transform(values):
+        if not isinstance(values, list):
+            return scalar(values)
+        if batch is not None:
+            return batch(values)
+        return [scalar(value) for value in values]
+    return transform
+
+
+def _build_skeleton(steps: List[CompiledMapping]) -> List[Tuple[int, str, bool]]:
+    """
+    Lay out containers and leaf keys in mapping order and assign each step its slot.
+    Targets that are both a leaf and a container of another target keep the
+    path-walking setter so their original overwrite semantics are preserved,
+    as do selector targets such as `lines[*].code`.
+    """
+    steps = [step for step in steps if step.target_keys is not None]
+    leaf_paths = {step.target_keys for step in steps}
+    container_paths = {step.target_keys[:i] for step in steps for i in range(1, len(step.target_keys))}
+    conflicts = leaf_paths & container_paths
+
+    skeleton = []
+    slot_for_path = {(): 0}
+    leaves_seen = set()
+
+    for step in steps:
+        keys = step.target_keys
+        if any(keys[:i] in conflicts for i in range(1, len(keys) + 1)):
+            continue
+
+        for i in range(1, len(keys)):
+            path = keys[:i]
+            if path not in slot_for_path:
+                skeleton.append((slot_for_path[keys[:i - 1]], keys[i - 1], True))
+                slot_for_path[path] = len(slot_for_path)
+
+        step.slot = slot_for_path[keys[:-1]]
+        if keys not in leaves_seen:
+            skeleton.append((step.slot, step.leaf, False))
+            leaves_seen.add(keys)
+
+    return skeleton
+
+
+# In-process plan cache: integration id -> (updated_at, plan), least recently used first.
+# Entries of deleted integrations are dropped by the post_delete receiver in routing_cache.py.
+_plan_cache: 'OrderedDict[str, Tuple[Any, MappingPlan]]' = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+
+def get_mapping_plan(integration, target_index: Optional[int] = None) -> MappingPlan:
+    """
+    Get the compiled mapping plan for an integration, or with `target_index`
+    the plan of that fan-out target's `mappings` overlay.
+    Plans are cached per integration and recompiled when `updated_at` changes.
+    """
+    key = str(integration.id) if target_index is None else f"{integration.id}:targets[{target_index}]"
+    cached = _plan_cache.get(key)
+    if cached is not None and cached[0] == integration.updated_at:
+        with _plan_cache_lock:
+            if key in _plan_cache:
+                _plan_cache.move_to_end(key)
+        return cached[1]
+
+    if target_index is None:
+        mappings = integration.config_json.get('mappings', [])
+    else:
+        mappings = integration.config_json['targets'][target_index].get('mappings', [])
+    plan = compile_mappings(mappings)
+    with _plan_cache_lock:
+        _plan_cache[key] = (integration.updated_at, plan)
+        _plan_cache.move_to_end(key)
+        while len(_plan_cache) > getattr(settings, 'MAPPING_PLAN_CACHE_SIZE', 1024):
+            _plan_cache.popitem(last=False)
+    return plan
+
+
+def invalidate_mapping_plan(integration_id) -> None:
+    """Drop the cached plans for an integration (including its target overlays)"""
+    prefix = f"{integration_id}:"
+    with _plan_cache_lock:
+        for key in [key for key in _plan_cache if key == str(integration_id) or key.startswith(prefix)]:
+            del _plan_cache[key]
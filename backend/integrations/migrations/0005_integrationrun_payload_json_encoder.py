@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:01
+
+import integrations.serialization
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0004_integrationconfiguration_pubsub_pull_interval_seconds_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='integrationrun',
+            name='incoming_payload',
+            field=models.JSONField(encoder=integrations.serialization.PayloadJSONEncoder, help_text='Payload received from source'),
+        ),
+        migrations.AlterField(
+            model_name='integrationrun',
+            name='outgoing_request',
+            field=models.JSONField(encoder=integrations.serialization.PayloadJSONEncoder, help_text='Complete request sent to target API'),
+        ),
+        migrations.AlterField(
+            model_name='integrationrun',
+            name='outgoing_response',
+            field=models.JSONField(encoder=integrations.serialization.PayloadJSONEncoder, help_text='Response from target API'),
+        ),
+        migrations.AlterField(
+            model_name='integrationrun',
+            name='transformed_payload',
+            field=models.JSONField(encoder=integrations.serialization.PayloadJSONEncoder, help_text='Payload after transformation'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0005_integrationrun_payload_json_encoder'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='integrationrun',
+            name='status',
+            field=models.CharField(choices=[('success', 'Success'), ('skipped', 'Skipped'), ('error', 'Error'), ('partial', 'Partial Success'), ('queued', 'Queued')], db_index=True, max_length=20),
+        ),
+    ]
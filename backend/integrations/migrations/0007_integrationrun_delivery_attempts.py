@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0006_alter_integrationrun_status_queued'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='integrationrun',
+            name='attempt_count',
+            field=models.IntegerField(default=1, help_text='Delivery attempts made so far'),
+        ),
+        migrations.AddField(
+            model_name='integrationrun',
+            name='circuit_state',
+            field=models.CharField(blank=True, help_text='Target host circuit breaker state after the last attempt', max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='integrationrun',
+            name='next_retry_at',
+            field=models.DateTimeField(blank=True, help_text='When the next retry is due', null=True),
+        ),
+        migrations.AlterField(
+            model_name='integrationrun',
+            name='status',
+            field=models.CharField(choices=[('success', 'Success'), ('skipped', 'Skipped'), ('error', 'Error'), ('partial', 'Partial Success'), ('queued', 'Queued'), ('retrying', 'Retrying')], db_index=True, max_length=20),
+        ),
+    ]
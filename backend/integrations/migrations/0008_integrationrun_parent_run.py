@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0007_integrationrun_delivery_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='integrationrun',
+            name='parent_run',
+            field=models.ForeignKey(blank=True, help_text='Fan-out run this target leg belongs to', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='leg_runs', to='integrations.integrationrun'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:20
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0008_integrationrun_parent_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0, help_text='Times a worker has claimed this job')),
+                ('locked_by', models.CharField(blank=True, max_length=255, null=True)),
+                ('locked_until', models.DateTimeField(blank=True, help_text='When an unfinished claim expires', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('integration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='webhook_jobs', to='integrations.integrationconfiguration')),
+                ('run', models.OneToOneField(help_text='Queued run the worker fills in', on_delete=django.db.models.deletion.CASCADE, related_name='webhook_job', to='integrations.integrationrun')),
+            ],
+            options={
+                'verbose_name': 'Webhook Job',
+                'verbose_name_plural': 'Webhook Jobs',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='integration_status_f6171d_idx')],
+            },
+        ),
+    ]
@@ -4,6 +4,8 @@ from django.utils import timezone
 import json
 import uuid
 
+from .serialization import PayloadJSONEncoder
+
 
 class IntegrationConfiguration(models.Model):
     """Stores JSON integration definitions"""
@@ -82,6 +84,8 @@ class IntegrationRun(models.Model):
         ('skipped', 'Skipped'),
         ('error', 'Error'),
         ('partial', 'Partial Success'),
+        ('queued', 'Queued'),
+        ('retrying', 'Retrying'),
     ]
     
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -92,15 +96,35 @@ class IntegrationRun(models.Model):
     )
     
     # Request/Response data
-    incoming_payload = models.JSONField(help_text="Payload received from source")
-    transformed_payload = models.JSONField(help_text="Payload after transformation")
-    outgoing_request = models.JSONField(help_text="Complete request sent to target API")
-    outgoing_response = models.JSONField(help_text="Response from target API")
+    incoming_payload = models.JSONField(encoder=PayloadJSONEncoder, help_text="Payload received from source")
+    transformed_payload = models.JSONField(encoder=PayloadJSONEncoder, help_text="Payload after transformation")
+    outgoing_request = models.JSONField(encoder=PayloadJSONEncoder, help_text="Complete request sent to target API")
+    outgoing_response = models.JSONField(encoder=PayloadJSONEncoder, help_text="Response from target API")
     
     # Status
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, db_index=True)
     error_message = models.TextField(null=True, blank=True)
     
+    # Delivery attempts
+    attempt_count = models.IntegerField(default=1, help_text="Delivery attempts made so far")
+    next_retry_at = models.DateTimeField(null=True, blank=True, help_text="When the next retry is due")
+    circuit_state = models.CharField(
+        max_length=10,
+        null=True,
+        blank=True,
+        help_text="Target host circuit breaker state after the last attempt"
+    )
+    
+    # Fan-out: each target leg is logged as its own run under the message's run
+    parent_run = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='leg_runs',
+        help_text="Fan-out run this target leg belongs to"
+    )
+
     # Performance metrics
     transformation_time_ms = models.IntegerField(null=True, help_text="Time to transform data")
     api_call_time_ms = models.IntegerField(null=True, help_text="Time for API call")
@@ -119,3 +143,44 @@ class IntegrationRun(models.Model):
     
     def __str__(self):
         return f"{self.integration.name} - {self.created_at.strftime('%Y-%m-%d %H:%M:%S')} - {self.status}"
+
+
+class WebhookJob(models.Model):
+    """A webhook message accepted with 202, waiting for a worker (see webhook_queue.py)"""
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    integration = models.ForeignKey(
+        IntegrationConfiguration,
+        on_delete=models.CASCADE,
+        related_name='webhook_jobs'
+    )
+    # The payload is stored once, as the queued run's incoming_payload
+    run = models.OneToOneField(
+        IntegrationRun,
+        on_delete=models.CASCADE,
+        related_name='webhook_job',
+        help_text="Queued run the worker fills in"
+    )
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0, help_text="Times a worker has claimed this job")
+    locked_by = models.CharField(max_length=255, null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True, help_text="When an unfinished claim expires")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = "Webhook Job"
+        verbose_name_plural = "Webhook Jobs"
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.integration.name} - {self.status} ({self.attempts} attempt(s))"
@@ -1,9 +1,9 @@
 # pubsub_manager.py
-import json
 import base64
 from google.cloud import pubsub_v1
 from google.oauth2 import service_account
 from django.conf import settings
+from .serialization import dumps, loads
 
 
 def get_pubsub_credentials(credentials_json):
@@ -11,7 +11,7 @@ def get_pubsub_credentials(credentials_json):
     Parse service account credentials from JSON string
     """
     try:
-        credentials_dict = json.loads(credentials_json)
+        credentials_dict = loads(credentials_json)
         credentials = service_account.Credentials.from_service_account_info(credentials_dict)
         return credentials
     except Exception as e:
@@ -123,9 +123,8 @@ def publish_test_message(project_id, topic_id, message_data, credentials_json):
     publisher = pubsub_v1.PublisherClient(credentials=credentials)
     topic_path = publisher.topic_path(project_id, topic_id)
 
-    # Convert message data to JSON string and encode
-    message_json = json.dumps(message_data)
-    message_bytes = message_json.encode('utf-8')
+    # Encode message data as JSON
+    message_bytes = dumps(message_data)
 
     # Publish message
     future = publisher.publish(topic_path, message_bytes)
@@ -216,8 +215,8 @@ def pull_messages(project_id, subscription_id, credentials_json, max_messages=10
 
             # Parse JSON if message contains JSON
             try:
-                data_json = json.loads(message_data)
-            except json.JSONDecodeError:
+                data_json = loads(message_data)
+            except ValueError:
                 data_json = message_data
 
             messages.append({
@@ -276,8 +275,8 @@ def handle_pubsub_push(request_body):
 
         # Parse JSON if message contains JSON
         try:
-            data_json = json.loads(message_data)
-        except json.JSONDecodeError:
+            data_json = loads(message_data)
+        except ValueError:
             data_json = message_data
 
         return {
@@ -1,8 +1,10 @@
 # pubsub_scheduler.py
 import threading
 import time
+from django.conf import settings
 from .pubsub_manager import pull_messages
-from .integration_processor import process_integration
+from .dedup import claim_message, release_message
+from .integration_processor import process_integration_batch
 
 
 class PubSubPullScheduler:
@@ -90,16 +92,30 @@ class PubSubPullScheduler:
                     project_id=integration.pubsub_project_id,
                     subscription_id=integration.pubsub_subscription,
                     credentials_json=credentials_json,
-                    max_messages=10
+                    max_messages=getattr(settings, 'PUBSUB_PULL_MAX_MESSAGES', 10)
                 )
 
-                # Process each message through the integration
-                for message in messages:
+                # Redelivered messages are dropped before the batch is transformed
+                fresh, dedup_keys = [], []
+                for message in messages or []:
+                    duplicate, dedup_key = claim_message(integration, message['data'],
+                                                         message_id=message['message_id'])
+                    if duplicate:
+                        print(f"Skipped duplicate message {message['message_id']}")
+                    else:
+                        fresh.append(message)
+                        dedup_keys.append(dedup_key)
+
+                # Process the pulled messages through the integration as one batch
+                if fresh:
                     try:
-                        result = process_integration(integration, message['data'])
+                        results = process_integration_batch(integration, [message['data'] for message in fresh])
+                    except Exception:
+                        for dedup_key in dedup_keys:
+                            release_message(dedup_key)
+                        raise
+                    for message, result in zip(fresh, results):
                         print(f"Processed message {message['message_id']}: {result['status']}")
-                    except Exception as e:
-                        print(f"Error processing message {message['message_id']}: {e}")
 
             except Exception as e:
                 print(f"Error in pull loop for {integration.name}: {e}")
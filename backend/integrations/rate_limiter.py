@@ -0,0 +1,216 @@
+# rate_limiter.py
+"""
+Token-bucket rate limiting for outbound deliveries.
+
+Buckets are kept in Redis (REDIS_URL) so every gunicorn worker and puller
+thread draws from the same budget; without Redis, or while it is
+unreachable, each process falls back to its own in-memory buckets.
+
+Acquiring a token reserves it immediately and returns how long the caller
+has to wait before using it, so callers queue up fairly. A reservation
+that would wait longer than `max_wait` is refused instead, and the
+delivery fails with RateLimitExceeded (and is retried if the integration
+has a retry policy). When a request draws from several buckets, tokens
+already reserved are given back if a later bucket refuses.
+
+Limits are configured per integration in `target.rateLimit`:
+
+    "rateLimit": {"requestsPerSecond": 5, "burst": 10}
+
+and per target host with the TARGET_RATE_LIMITS setting:
+
+    {"api.example.com": {"requestsPerSecond": 20, "burst": 20}}
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class RateLimitExceeded(Exception):
+    """The target's budget would not allow this request within the maximum wait"""
+
+
+class RateLimit:
+    """A refill rate (tokens per second) and bucket capacity"""
+
+    __slots__ = ('rate', 'burst')
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+
+    @classmethod
+    def from_config(cls, config) -> Optional['RateLimit']:
+        """Parse a `{"requestsPerSecond": ..., "burst": ...}` dict"""
+        if not isinstance(config, dict) or not config.get('requestsPerSecond'):
+            return None
+        return cls(config['requestsPerSecond'], config.get('burst'))
+
+
+# KEYS[1] bucket; ARGV rate, burst, max_wait. Returns {granted, wait} as strings (Lua numbers are truncated).
+_RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = math.max(0, (1 - tokens) / rate)
+if wait > max_wait then
+  return {'0', tostring(wait)}
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst / rate + wait) * 1000) + 1000)
+return {'1', tostring(wait)}
+"""
+
+# KEYS[1] bucket; ARGV burst. Returns a reserved token to the bucket.
+_RELEASE_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+  redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(tonumber(ARGV[1]), tokens + 1)))
+end
+return 1
+"""
+
+
+class LocalTokenBuckets:
+    """In-process token buckets"""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key: str, limit: RateLimit, max_wait: float) -> Tuple[bool, float]:
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + max(0.0, now - last) * limit.rate)
+            wait = max(0.0, (1 - tokens) / limit.rate)
+            if wait > max_wait:
+                return False, wait
+            self._buckets[key] = (tokens - 1, now)
+            return True, wait
+
+    def release(self, key: str, limit: RateLimit) -> None:
+        with self._lock:
+            if key in self._buckets:
+                tokens, last = self._buckets[key]
+                self._buckets[key] = (min(limit.burst, tokens + 1), last)
+
+
+class RedisTokenBuckets:
+    """Token buckets shared through Redis"""
+
+    def __init__(self, url: str, prefix: str = 'integrations:ratelimit:'):
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self._script = self._client.register_script(_RESERVE_SCRIPT)
+        self._release_script = self._client.register_script(_RELEASE_SCRIPT)
+
+    def reserve(self, key: str, limit: RateLimit, max_wait: float) -> Tuple[bool, float]:
+        granted, wait = self._script(keys=[self.prefix + key], args=[limit.rate, limit.burst, max_wait])
+        return granted in (b'1', '1'), float(wait)
+
+    def release(self, key: str, limit: RateLimit) -> None:
+        self._release_script(keys=[self.prefix + key], args=[limit.burst])
+
+
+class RateLimiter:
+    """Reserves tokens from Redis buckets, falling back to local buckets when Redis fails"""
+
+    def __init__(self, redis_url: Optional[str] = None, max_wait: float = 30.0):
+        self.max_wait = max_wait
+        self.local = LocalTokenBuckets()
+        self.shared = None
+        self._shared_down_until = 0.0
+        if redis_url and redis is not None:
+            self.shared = RedisTokenBuckets(redis_url)
+        elif redis_url:
+            print("Warning: redis package not installed, rate limits are per process")
+
+    @property
+    def backend(self) -> str:
+        return 'redis' if self.shared is not None and time.monotonic() >= self._shared_down_until else 'local'
+
+    def reserve(self, key: str, limit: RateLimit) -> float:
+        """
+        Reserve one token and return the seconds to wait before sending.
+        Raises RateLimitExceeded when that wait would exceed max_wait.
+        """
+        granted, wait = None, 0.0
+        if self.shared is not None and time.monotonic() >= self._shared_down_until:
+            try:
+                granted, wait = self.shared.reserve(key, limit, self.max_wait)
+            except Exception as e:
+                # Use local buckets for a while rather than failing deliveries
+                print(f"Rate limiter: Redis unavailable ({e}), using in-process buckets")
+                self._shared_down_until = time.monotonic() + 30
+        if granted is None:
+            granted, wait = self.local.reserve(key, limit, self.max_wait)
+        if not granted:
+            raise RateLimitExceeded(f"Rate limit for {key} exceeded (next slot in {wait:.1f}s)")
+        return wait
+
+    def release(self, key: str, limit: RateLimit) -> None:
+        """Give back a token reserved with reserve()"""
+        if self.shared is not None and time.monotonic() >= self._shared_down_until:
+            try:
+                self.shared.release(key, limit)
+                return
+            except Exception as e:
+                print(f"Rate limiter: Redis unavailable ({e}), using in-process buckets")
+                self._shared_down_until = time.monotonic() + 30
+        self.local.release(key, limit)
+
+    def reserve_all(self, buckets: List[Tuple[str, RateLimit]]) -> float:
+        """
+        Reserve one token from each bucket and return the longest wait. If a
+        bucket refuses, the tokens already reserved are released before
+        RateLimitExceeded is raised.
+        """
+        reserved = []
+        wait = 0.0
+        try:
+            for key, limit in buckets:
+                wait = max(wait, self.reserve(key, limit))
+                reserved.append((key, limit))
+        except RateLimitExceeded:
+            for key, limit in reserved:
+                self.release(key, limit)
+            raise
+        return wait
+
+
+def host_rate_limit(origin: str) -> Optional[RateLimit]:
+    """Configured limit for a target origin (matched by host name or full origin)"""
+    limits = getattr(settings, 'TARGET_RATE_LIMITS', {}) or {}
+    host = origin.split('://', 1)[-1].rsplit(':', 1)[0]
+    return RateLimit.from_config(limits.get(origin) or limits.get(host))
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get or create the process-wide rate limiter"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(
+                    redis_url=getattr(settings, 'REDIS_URL', None),
+                    max_wait=getattr(settings, 'RATE_LIMIT_MAX_WAIT_SECONDS', 30),
+                )
+    return _limiter
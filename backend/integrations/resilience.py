@@ -0,0 +1,335 @@
+# resilience.py
+"""
+Retries and circuit breaking for HTTP deliveries.
+
+Retry policy, per integration in `target.retry`:
+
+    "retry": {"maxAttempts": 5, "backoffMs": 1000, "maxBackoffMs": 60000, "retryOn": [429, 502, 503, 504]}
+
+Failed attempts (a retryable status code, a connection error or timeout, or
+an open circuit) are rescheduled with exponential backoff and jitter. The
+RetryScheduler keeps pending retries on a heap and one background thread
+submits them to the delivery engine when due, so no thread sleeps on a
+backoff or waits on a response.
+
+The heap only lives in the process that scheduled the retry; the run itself
+says 'retrying' with its `next_retry_at`. When the scheduler starts and every
+RETRY_SWEEP_SECONDS it re-schedules retrying runs that are overdue by more
+than RETRY_SWEEP_GRACE_SECONDS, so retries of a process that died (or was
+redeployed) are picked up by another one; batched runs (queued or retrying)
+go into a new batch and queued digest runs into a new digest. A run is claimed by moving its
+`next_retry_at`, so only one process takes it.
+
+Circuit breakers are kept per target origin. After `CIRCUIT_FAILURE_THRESHOLD`
+consecutive failures (connection errors, timeouts or 5xx responses) the
+circuit opens and deliveries fail fast with CircuitOpenError. After
+`CIRCUIT_RESET_SECONDS` a single half-open probe is let through; it closes
+the circuit on success and reopens it on failure.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+DEFAULT_RETRY_ON = (408, 429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+    """Parsed `target.retry` settings"""
+
+    def __init__(self, max_attempts: int = 3, backoff_ms: int = 1000, max_backoff_ms: int = 60000,
+                 retry_on=DEFAULT_RETRY_ON):
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff_ms / 1000.0
+        self.max_backoff = max_backoff_ms / 1000.0
+        self.retry_on = frozenset(retry_on)
+
+    @classmethod
+    def from_config(cls, retry_config: Any) -> Optional['RetryPolicy']:
+        """Policy for a `target.retry` value, or None when retries are off"""
+        if retry_config is True:
+            return cls()
+        if not isinstance(retry_config, dict) or not retry_config.get('enabled', True):
+            return None
+        return cls(
+            max_attempts=int(retry_config.get('maxAttempts', 3)),
+            backoff_ms=int(retry_config.get('backoffMs', 1000)),
+            max_backoff_ms=int(retry_config.get('maxBackoffMs', 60000)),
+            retry_on=retry_config.get('retryOn', DEFAULT_RETRY_ON),
+        )
+
+    def should_retry(self, attempt: int, status_code: Optional[int]) -> bool:
+        """Whether a failed attempt is retried (status_code is None for exceptions)"""
+        if attempt >= self.max_attempts:
+            return False
+        return status_code is None or status_code in self.retry_on
+
+    def delay(self, attempt: int) -> float:
+        """Backoff before the next attempt: exponential, capped, with equal jitter"""
+        ceiling = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+def get_retry_policy(integration) -> Optional[RetryPolicy]:
+    return RetryPolicy.from_config(integration.config_json.get('target', {}).get('retry'))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the target's circuit is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one target origin"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, origin: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.origin = origin
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_request(self) -> None:
+        """Raise CircuitOpenError unless a request may be sent now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            raise CircuitOpenError(f"Circuit open for {self.origin}")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {'state': self.state, 'consecutive_failures': self._failures}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(origin: str) -> CircuitBreaker:
+    """Process-wide circuit breaker for a target origin"""
+    breaker = _breakers.get(origin)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(origin)
+            if breaker is None:
+                breaker = _breakers[origin] = CircuitBreaker(
+                    origin,
+                    failure_threshold=getattr(settings, 'CIRCUIT_FAILURE_THRESHOLD', 5),
+                    reset_timeout=getattr(settings, 'CIRCUIT_RESET_SECONDS', 30),
+                )
+    return breaker
+
+
+def circuit_stats() -> Dict[str, Dict[str, Any]]:
+    return {origin: breaker.stats() for origin, breaker in list(_breakers.items())}
+
+
+class RetryJob:
+    """A delivery attempt waiting for its backoff to expire"""
+
+    __slots__ = ('integration_id', 'run_id', 'request', 'attempt', 'condition', 'condition_result', 'target_index',
+                 'batch')
+
+    def __init__(self, integration_id: Any, run_id: Any, request, attempt: int,
+                 condition: Optional[str] = None, condition_result: bool = True,
+                 target_index: Optional[int] = None, batch=None):
+        self.integration_id = integration_id
+        self.run_id = run_id
+        self.request = request
+        self.attempt = attempt
+        self.condition = condition
+        self.condition_result = condition_result
+        self.target_index = target_index  # fan-out leg being retried
+        self.batch = batch  # batch_delivery batch whose shared request is retried
+
+
+class RetryScheduler:
+    """Heap of pending retries, submitted to the delivery engine by one background thread"""
+
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()
+        self._completed = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='delivery-retries', daemon=True)
+            self._thread.start()
+
+    def schedule(self, delay: float, job: RetryJob) -> None:
+        with self._condition:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), job))
+            self._condition.notify()
+
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._heap)
+
+    def _run(self) -> None:
+        from .delivery_engine import submit_delivery
+
+        next_sweep = time.monotonic()
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[2])
+                completed, self._completed = self._completed, []
+                sweep = now >= next_sweep
+                if not due and not completed and not sweep:
+                    wake = min(self._heap[0][0], next_sweep) if self._heap else next_sweep
+                    self._condition.wait(wake - now)
+                    continue
+
+            if sweep:
+                next_sweep = now + getattr(settings, 'RETRY_SWEEP_SECONDS', 60)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Error re-scheduling overdue retries: {e}")
+                finally:
+                    close_old_connections()
+
+            for job in due:
+                future = submit_delivery(job.request)
+                future.add_done_callback(lambda future, job=job: self._on_done(job, future))
+
+            for job, future in completed:
+                try:
+                    self._finish(job, future)
+                except Exception as e:
+                    print(f"Error recording retry of run {job.run_id}: {e}")
+                finally:
+                    close_old_connections()
+
+    def sweep(self) -> int:
+        """
+        Schedule the overdue retrying runs left behind by other processes, and
+        put their overdue batched and digest runs into a new batch or digest;
+        returns how many were taken
+        """
+        from .batch_delivery import requeue_run
+        from .email_digest import requeue_run as requeue_digest_run
+        from .integration_processor import build_delivery_request, integration_target
+        from .models import IntegrationRun
+
+        now = timezone.now()
+        overdue = IntegrationRun.objects.filter(
+            Q(status='retrying') | Q(status='queued', outgoing_request__has_key='batch_format') |
+            Q(status='queued', outgoing_request__has_key='digest'),
+            next_retry_at__lt=now - timedelta(seconds=getattr(settings, 'RETRY_SWEEP_GRACE_SECONDS', 300))
+        ).select_related('integration').order_by('next_retry_at')[:100]
+
+        taken = 0
+        for run in overdue:
+            # Claim the run; if this process dies too, it is overdue again after the grace period
+            if not IntegrationRun.objects.filter(id=run.id, status=run.status,
+                                                 next_retry_at=run.next_retry_at).update(next_retry_at=now):
+                continue
+            outgoing_request = run.outgoing_request or {}
+            target_index = outgoing_request.get('target_index')
+            try:
+                if 'batch_format' in outgoing_request or 'digest' in outgoing_request:
+                    requeue = requeue_digest_run if 'digest' in outgoing_request else requeue_run
+                    requeue(run)
+                    taken += 1
+                    continue
+                integration = run.integration
+                if target_index is not None:
+                    integration = integration_target(integration, target_index)
+                request = build_delivery_request(integration, run.transformed_payload)
+            except Exception as e:
+                IntegrationRun.objects.filter(id=run.id).update(status='error', error_message=str(e),
+                                                                next_retry_at=None)
+                continue
+            condition = outgoing_request.get('condition')
+            self.schedule(0, RetryJob(run.integration_id, run.id, request, run.attempt_count + 1, condition,
+                                      outgoing_request.get('condition_result') is not False,
+                                      target_index=target_index))
+            taken += 1
+        return taken
+
+    def _on_done(self, job: RetryJob, future) -> None:
+        # Runs on the engine loop: only hand the result back to the scheduler thread
+        with self._condition:
+            self._completed.append((job, future))
+            self._condition.notify()
+
+    def _finish(self, job: RetryJob, future) -> None:
+        from .integration_processor import finish_delivery, integration_target
+        from .models import IntegrationConfiguration
+
+        if job.batch is not None:
+            from .batch_delivery import record_batch
+
+            try:
+                response, error = future.result(), None
+            except Exception as e:
+                response, error = None, e
+            record_batch(job.batch, job.request, response, error, attempt=job.attempt)
+            return
+
+        integration = IntegrationConfiguration.objects.filter(id=job.integration_id).first()
+        if integration is None:
+            return
+        if job.target_index is not None:
+            integration = integration_target(integration, job.target_index)
+        finish_delivery(integration, None, job.request, future, 0, job.condition, job.condition_result,
+                        attempt=job.attempt, run_id=job.run_id)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_retry_scheduler() -> RetryScheduler:
+    """Get or start the process-wide retry scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RetryScheduler()
+                _scheduler.start()
+    return _scheduler
@@ -0,0 +1,117 @@
+# response_capture.py
+"""
+Bounded capture of target responses.
+
+Response bodies are read as a stream: only the first `maxBytes` are kept
+for the run log, while the whole body is hashed (SHA-256) and counted so a
+truncated capture can still be identified. Bodies are drained up to
+RESPONSE_DRAIN_MAX_BYTES so the connection can go back to the pool; past
+that the connection is dropped and the hash only covers what was read.
+
+Configured per integration in `target.responseCapture`:
+
+    "responseCapture": {"maxBytes": 65536, "parseMaxBytes": 16384, "body": true}
+
+With `"body": false` only the status code, headers, size and hash are
+stored. Captured bodies are only JSON-decoded when complete and no larger
+than `parseMaxBytes`; otherwise they are stored as text.
+"""
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from .serialization import loads
+
+CHUNK_SIZE = 65536
+
+
+class CaptureOptions:
+    """Parsed `target.responseCapture` settings"""
+
+    __slots__ = ('max_bytes', 'parse_max_bytes', 'body', 'drain_max_bytes')
+
+    def __init__(self, max_bytes: Optional[int] = None, parse_max_bytes: Optional[int] = None,
+                 body: bool = True, drain_max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            getattr(settings, 'RESPONSE_CAPTURE_MAX_BYTES', 262144)
+        self.parse_max_bytes = parse_max_bytes if parse_max_bytes is not None else \
+            getattr(settings, 'RESPONSE_PARSE_MAX_BYTES', 65536)
+        self.body = body
+        self.drain_max_bytes = drain_max_bytes if drain_max_bytes is not None else \
+            getattr(settings, 'RESPONSE_DRAIN_MAX_BYTES', 16777216)
+
+    @classmethod
+    def from_config(cls, capture_config: Any) -> 'CaptureOptions':
+        """Options for a `target.responseCapture` value (defaults from settings)"""
+        if not isinstance(capture_config, dict):
+            return cls()
+        return cls(
+            max_bytes=capture_config.get('maxBytes'),
+            parse_max_bytes=capture_config.get('parseMaxBytes'),
+            body=bool(capture_config.get('body', True)),
+        )
+
+
+class StreamCapture:
+    """Accumulates a streamed body: keeps a bounded prefix, hashes and counts everything"""
+
+    def __init__(self, options: CaptureOptions):
+        self.options = options
+        self.limit = options.max_bytes if options.body else 0
+        self.buffer = bytearray()
+        self.size = 0
+        self.complete = True
+        self._hash = hashlib.sha256()
+
+    def feed(self, chunk: bytes) -> bool:
+        """Add a chunk; returns False once the drain limit is reached and reading should stop"""
+        self.size += len(chunk)
+        self._hash.update(chunk)
+        room = self.limit - len(self.buffer)
+        if room > 0:
+            self.buffer += chunk[:room]
+        if self.size >= self.options.drain_max_bytes:
+            self.complete = False
+            return False
+        return True
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+
+def response_log(response, options: Optional[CaptureOptions] = None) -> Tuple[Dict[str, Any], Any]:
+    """
+    Build the `outgoing_response` entry for a DeliveryResponse.
+    Returns (outgoing_response, response_data), where response_data is the
+    decoded JSON body, {'body': text} for other bodies, or None when the
+    body is not stored.
+    """
+    options = options or CaptureOptions()
+    outgoing_response = {
+        'status_code': response.status_code,
+        'headers': response.headers,
+        'body_size': response.size,
+        'body_sha256': response.sha256,
+    }
+    if not response.complete:
+        outgoing_response['body_complete'] = False
+    if not options.body:
+        return outgoing_response, None
+
+    response_data = None
+    if not response.truncated and len(response.content) <= options.parse_max_bytes:
+        try:
+            response_data = loads(response.content)
+        except ValueError:
+            pass
+        else:
+            outgoing_response['body'] = response_data
+            return outgoing_response, response_data
+
+    response_data = {'body': response.text}
+    if response.truncated:
+        outgoing_response['body_truncated'] = True
+    outgoing_response['body'] = response_data
+    return outgoing_response, response_data
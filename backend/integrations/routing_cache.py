@@ -0,0 +1,240 @@
+# routing_cache.py
+"""
+In-process routing table for the webhook and Pub/Sub push endpoints.
+
+Maps an endpoint path to a snapshot of its active IntegrationConfiguration
+(with the mapping plan already compiled), so requests to hot endpoints are
+routed and transformed without touching the database.
+
+Entries are dropped when an integration is saved or deleted (post_save /
+post_delete). Other processes are told through Redis pub/sub when REDIS_URL
+is set, and otherwise through Postgres LISTEN/NOTIFY when the database is
+PostgreSQL; each process also reloads entries older than
+ROUTING_CACHE_TTL_SECONDS, which only bounds staleness when neither is
+available (or a notification was missed). Unknown paths are not cached, so
+every miss still goes to the database.
+
+Lookups return a shallow copy of the cached integration, so attributes set
+on it by one request are not seen by others; its config_json is shared and
+must be treated as read-only.
+"""
+import copy
+import select
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .mapping_compiler import get_mapping_plan, invalidate_mapping_plan
+from .models import IntegrationConfiguration
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+CHANNEL = 'integrations:routing'
+PG_CHANNEL = 'integrations_routing'
+
+# Endpoint kind -> the field holding its path
+ROUTE_FIELDS = {
+    'webhook': 'webhook_path',
+    'pubsub': 'pubsub_push_endpoint',
+}
+
+RouteKey = Tuple[str, str]
+
+
+class RoutingTable:
+    """Endpoint path -> integration snapshot, per process"""
+
+    def __init__(self, ttl_seconds: float = 60):
+        self.ttl_seconds = ttl_seconds
+        self._routes: Dict[RouteKey, Tuple[IntegrationConfiguration, float]] = {}
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; a load that raced one is not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, source_type: str, path: str) -> Optional[IntegrationConfiguration]:
+        """The cached integration for `path`, without going to the database (safe in async code)"""
+        entry = self._routes.get((source_type, path))
+        if entry is not None and time.monotonic() - entry[1] < self.ttl_seconds:
+            self.hits += 1
+            return copy.copy(entry[0])
+        return None
+
+    def get(self, source_type: str, path: str) -> Optional[IntegrationConfiguration]:
+        """The active integration of `source_type` serving `path`, or None"""
+        integration = self.cached(source_type, path)
+        if integration is not None:
+            return integration
+
+        self.misses += 1
+        key = (source_type, path)
+        generation = self._generation
+        integration = IntegrationConfiguration.objects.filter(
+            source_type=source_type, is_active=True, **{ROUTE_FIELDS[source_type]: path}
+        ).first()
+        if integration is None:
+            return None
+        try:
+            get_mapping_plan(integration)
+        except Exception:
+            # Invalid mappings fail when the message is processed, as before
+            pass
+        with self._lock:
+            if generation == self._generation:
+                self._routes[key] = (integration, time.monotonic())
+        return copy.copy(integration)
+
+    def invalidate(self, integration_id: Any) -> None:
+        """Drop the routes served by an integration"""
+        integration_id = str(integration_id)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key, (integration, _) in self._routes.items() if str(integration.id) == integration_id]:
+                del self._routes[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._routes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'routes': len(self._routes),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidation': _invalidation_backend(),
+        }
+
+
+def _redis_url() -> Optional[str]:
+    return getattr(settings, 'REDIS_URL', None) if redis is not None else None
+
+
+def _invalidation_backend() -> str:
+    """How other processes are told about changes: 'redis', 'postgres' or 'local' (TTL only)"""
+    if _redis_url():
+        return 'redis'
+    return 'postgres' if connection.vendor == 'postgresql' else 'local'
+
+
+def _listen(table: RoutingTable, url: str) -> None:
+    """Apply invalidations published by other processes; resubscribes after errors"""
+    while True:
+        try:
+            pubsub = redis.Redis.from_url(url).pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CHANNEL)
+            # Messages published while we were not subscribed are lost
+            table.clear()
+            for message in pubsub.listen():
+                data = message['data']
+                table.invalidate(data.decode() if isinstance(data, bytes) else data)
+        except Exception as e:
+            print(f"Routing cache invalidation listener error: {e}")
+            table.clear()
+            time.sleep(5)
+
+
+def _listen_postgres(table: RoutingTable) -> None:
+    """Apply invalidations NOTIFYed by other processes, on a connection of its own; reconnects after errors"""
+    while True:
+        listener = None
+        try:
+            database = connections['default']
+            listener = database.get_new_connection(database.get_connection_params())
+            listener.autocommit = True
+            with listener.cursor() as cursor:
+                cursor.execute(f"LISTEN {PG_CHANNEL}")
+            # Notifications sent while we were not listening are lost
+            table.clear()
+            while True:
+                if select.select([listener], [], [], 60)[0]:
+                    listener.poll()
+                    while listener.notifies:
+                        table.invalidate(listener.notifies.pop(0).payload)
+        except Exception as e:
+            print(f"Routing cache invalidation listener error: {e}")
+            table.clear()
+            time.sleep(5)
+        finally:
+            if listener is not None:
+                try:
+                    listener.close()
+                except Exception:
+                    pass
+
+
+_publisher = None
+
+
+def publish_invalidation(integration_id: Any) -> None:
+    """Tell other processes to drop an integration's routes"""
+    global _publisher
+    backend = _invalidation_backend()
+    try:
+        if backend == 'redis':
+            if _publisher is None:
+                _publisher = redis.Redis.from_url(_redis_url())
+            _publisher.publish(CHANNEL, str(integration_id))
+        elif backend == 'postgres':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", [PG_CHANNEL, str(integration_id)])
+    except Exception as e:
+        print(f"Warning: could not publish routing cache invalidation: {e}")
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_routing_table() -> RoutingTable:
+    """Get or create the process-wide routing table (subscribing to invalidations through Redis or Postgres)"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                table = RoutingTable(ttl_seconds=getattr(settings, 'ROUTING_CACHE_TTL_SECONDS', 60))
+                backend = _invalidation_backend()
+                if backend == 'redis':
+                    threading.Thread(target=_listen, args=(table, _redis_url()), name='routing-invalidation',
+                                     daemon=True).start()
+                elif backend == 'postgres':
+                    threading.Thread(target=_listen_postgres, args=(table,), name='routing-invalidation',
+                                     daemon=True).start()
+                _table = table
+    return _table
+
+
+def get_routed_integration(source_type: str, path: str) -> Optional[IntegrationConfiguration]:
+    return get_routing_table().get(source_type, path)
+
+
+async def aget_routed_integration(source_type: str, path: str) -> Optional[IntegrationConfiguration]:
+    """Async lookup: cache hits are answered on the event loop, misses query on a worker thread"""
+    table = get_routing_table()
+    integration = table.cached(source_type, path)
+    if integration is None:
+        integration = await sync_to_async(table.get)(source_type, path)
+    return integration
+
+
+@receiver([post_save, post_delete], sender=IntegrationConfiguration)
+def integration_changed(sender, instance, **kwargs):
+    """Drop an edited or deleted integration's routes and mapping plans here, then everywhere once committed"""
+    def invalidate():
+        if _table is not None:
+            _table.invalidate(instance.id)
+        invalidate_mapping_plan(instance.id)
+
+    invalidate()
+    # Again after commit: a request may have reloaded the old row in the meantime
+    transaction.on_commit(lambda: (invalidate(), publish_invalidation(instance.id)))
@@ -0,0 +1,130 @@
+# serialization.py
+"""
+JSON encoding and decoding for the integration pipeline.
+
+Uses orjson or msgspec when installed and falls back to the standard
+library. The backend can be pinned with the JSON_BACKEND setting
+('auto', 'orjson', 'msgspec' or 'json').
+
+`encode_payload` encodes a payload once and returns an EncodedPayload: a dict
+that carries its JSON bytes along, so the same bytes are sent to the target
+and written to the IntegrationRun log through PayloadJSONEncoder.
+"""
+import json
+from typing import Any, Union
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+_django_encoder = DjangoJSONEncoder()
+
+
+def _default(obj: Any) -> Any:
+    """Fallback for types the JSON backends don't handle (Decimal, lazy strings, ...)"""
+    return _django_encoder.default(obj)
+
+
+def _load_backend() -> str:
+    requested = getattr(settings, 'JSON_BACKEND', 'auto')
+    candidates = ['orjson', 'msgspec'] if requested == 'auto' else [requested]
+    for name in candidates:
+        if name == 'json':
+            return 'json'
+        try:
+            __import__(name)
+            return name
+        except ImportError:
+            if requested != 'auto':
+                print(f"Warning: JSON backend {name} not installed, using json")
+    return 'json'
+
+
+BACKEND = _load_backend()
+
+if BACKEND == 'orjson':
+    import orjson
+
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(obj: Any) -> bytes:
+        """Encode to compact JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def dumps_pretty(obj: Any) -> str:
+        """Encode to JSON text indented by two spaces"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS | orjson.OPT_INDENT_2).decode('utf-8')
+
+    def loads(data: Union[bytes, str]) -> Any:
+        """Decode JSON bytes or text; raises ValueError on invalid input"""
+        return orjson.loads(data)
+
+elif BACKEND == 'msgspec':
+    import msgspec
+
+    _msgspec_encoder = msgspec.json.Encoder(enc_hook=_default)
+    _msgspec_decoder = msgspec.json.Decoder()
+
+    def dumps(obj: Any) -> bytes:
+        """Encode to compact JSON bytes"""
+        return _msgspec_encoder.encode(obj)
+
+    def dumps_pretty(obj: Any) -> str:
+        """Encode to JSON text indented by two spaces"""
+        return msgspec.json.format(_msgspec_encoder.encode(obj), indent=2).decode('utf-8')
+
+    def loads(data: Union[bytes, str]) -> Any:
+        """Decode JSON bytes or text; raises ValueError on invalid input"""
+        try:
+            return _msgspec_decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e))
+
+else:
+    def dumps(obj: Any) -> bytes:
+        """Encode to compact JSON bytes"""
+        return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    def dumps_pretty(obj: Any) -> str:
+        """Encode to JSON text indented by two spaces"""
+        return json.dumps(obj, default=_default, indent=2, ensure_ascii=False)
+
+    def loads(data: Union[bytes, str]) -> Any:
+        """Decode JSON bytes or text; raises ValueError on invalid input"""
+        return json.loads(data)
+
+
+def dumps_str(obj: Any) -> str:
+    """Encode to compact JSON text"""
+    return dumps(obj).decode('utf-8')
+
+
+class EncodedPayload(dict):
+    """
+    A payload dict together with its encoded JSON bytes.
+    Treat it as read-only: the bytes are not updated when the dict changes.
+    """
+
+    __slots__ = ('encoded',)
+
+    def __init__(self, payload: dict, encoded: bytes):
+        super().__init__(payload)
+        self.encoded = encoded
+
+
+def encode_payload(payload: Any) -> EncodedPayload:
+    """Encode a dict payload once for delivery and logging"""
+    if isinstance(payload, EncodedPayload):
+        return payload
+    return EncodedPayload(payload, dumps(payload))
+
+
+class PayloadJSONEncoder(DjangoJSONEncoder):
+    """
+    JSONField encoder that goes through the fast backend and reuses the bytes
+    of an EncodedPayload instead of encoding it again.
+    """
+
+    def encode(self, obj: Any) -> str:
+        if type(obj) is EncodedPayload:
+            return obj.encoded.decode('utf-8')
+        return dumps_str(obj)
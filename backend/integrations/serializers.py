@@ -81,7 +81,7 @@ class IntegrationRunSerializer(serializers.ModelSerializer):
             'id', 'integration', 'integration_name', 'incoming_payload',
             'transformed_payload', 'outgoing_request', 'outgoing_response',
             'status', 'error_message', 'transformation_time_ms',
-            'api_call_time_ms', 'created_at'
+            'api_call_time_ms', 'parent_run', 'created_at'
         ]
         read_only_fields = ['id', 'created_at']
 
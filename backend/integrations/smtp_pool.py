@@ -0,0 +1,172 @@
+# smtp_pool.py
+"""
+Pool of authenticated SMTP connections for email targets.
+
+Connections are keyed by server, port, username, TLS mode and a hash of the
+password (so a changed password never reuses a session logged in with the
+old one, and integrations sharing a username but not its password never
+share connections), and reused
+across messages and threads instead of connecting, upgrading to TLS and
+logging in for every email. A connection is checked out by one thread at a
+time; one that sat idle for SMTP_POOL_NOOP_SECONDS is health-checked with
+NOOP before reuse, and idle connections older than SMTP_POOL_IDLE_SECONDS
+are closed. If a pooled connection turns out to be dead when sending, the
+message is sent once more on a fresh connection.
+"""
+import hashlib
+import smtplib
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+
+PoolKey = Tuple[str, int, str, bool, str]
+
+
+def pool_key(email_config: Dict[str, Any]) -> PoolKey:
+    password = email_config.get('smtpPassword') or ''
+    return (
+        email_config.get('smtpServer'),
+        int(email_config.get('smtpPort', 587)),
+        email_config.get('smtpUsername') or '',
+        bool(email_config.get('useTLS', True)),
+        hashlib.sha256(password.encode('utf-8')).hexdigest(),
+    )
+
+
+class SMTPConnectionPool:
+    """Idle SMTP connections per (server, port, username, TLS, password hash), checked out one thread at a time"""
+
+    def __init__(self, max_idle: int = 4, idle_seconds: float = 60, noop_after: float = 5, timeout: float = 30):
+        self.max_idle = max_idle
+        self.idle_seconds = idle_seconds
+        self.noop_after = noop_after
+        self.timeout = timeout
+        self._idle: Dict[PoolKey, List[Tuple[smtplib.SMTP, float]]] = {}
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.messages_sent = 0
+
+    def _connect(self, email_config: Dict[str, Any]) -> smtplib.SMTP:
+        server, port, username, use_tls, _ = pool_key(email_config)
+        connection = smtplib.SMTP(server, port, timeout=self.timeout)
+        try:
+            if use_tls:
+                connection.starttls()
+            if username:
+                connection.login(username, email_config.get('smtpPassword'))
+        except Exception:
+            self._close(connection)
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        return connection
+
+    @staticmethod
+    def _close(connection: smtplib.SMTP) -> None:
+        try:
+            connection.quit()
+        except Exception:
+            connection.close()
+
+    @staticmethod
+    def _healthy(connection: smtplib.SMTP) -> bool:
+        try:
+            return connection.noop()[0] == 250
+        except Exception:
+            return False
+
+    def acquire(self, email_config: Dict[str, Any]) -> Tuple[smtplib.SMTP, bool]:
+        """Check out a connection; returns (connection, reused)"""
+        key = pool_key(email_config)
+        now = time.monotonic()
+        stale = []
+        connection = None
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                candidate, idle_since = idle.pop()
+                if now - idle_since > self.idle_seconds:
+                    stale.append(candidate)
+                else:
+                    connection = candidate
+                    break
+        for candidate in stale:
+            self._close(candidate)
+
+        if connection is not None:
+            if now - idle_since < self.noop_after or self._healthy(connection):
+                return connection, True
+            self._close(connection)
+        return self._connect(email_config), False
+
+    def release(self, email_config: Dict[str, Any], connection: smtplib.SMTP) -> None:
+        """Return a healthy connection to the pool"""
+        key = pool_key(email_config)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((connection, time.monotonic()))
+                return
+        self._close(connection)
+
+    def send(self, email_config: Dict[str, Any], from_email: str, to_emails: List[str], message: str) -> None:
+        """Send a message on a pooled connection, retrying once on a fresh one if it was dead"""
+        connection, reused = self.acquire(email_config)
+        try:
+            connection.sendmail(from_email, to_emails, message)
+        except smtplib.SMTPServerDisconnected:
+            connection.close()
+            if not reused:
+                raise
+            connection = self._connect(email_config)
+            try:
+                connection.sendmail(from_email, to_emails, message)
+            except Exception:
+                self._close(connection)
+                raise
+        except smtplib.SMTPRecipientsRefused:
+            # The message was rejected but the session is still usable
+            self.release(email_config, connection)
+            raise
+        except Exception:
+            self._close(connection)
+            raise
+        with self._lock:
+            self.messages_sent += 1
+        self.release(email_config, connection)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                self._close(connection)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'connections_opened': self.connections_opened,
+                'messages_sent': self.messages_sent,
+                'idle': {f"{server}:{port}/{username}": len(connections)
+                         for (server, port, username, _, _), connections in self._idle.items() if connections},
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_smtp_pool() -> SMTPConnectionPool:
+    """Get or create the process-wide SMTP pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SMTPConnectionPool(
+                    max_idle=getattr(settings, 'SMTP_POOL_MAX_IDLE', 4),
+                    idle_seconds=getattr(settings, 'SMTP_POOL_IDLE_SECONDS', 60),
+                    noop_after=getattr(settings, 'SMTP_POOL_NOOP_SECONDS', 5),
+                )
+    return _pool
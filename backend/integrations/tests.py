@@ -1,8 +1,9 @@
 # tests.py
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 from integrations.models import IntegrationConfiguration, IntegrationRun
 import json
+from unittest import mock
 
 
 class IntegrationAPITestCase(TestCase):
@@ -118,3 +119,1791 @@ class IntegrationAPITestCase(TestCase):
         run = IntegrationRun.objects.first()
         self.assertEqual(run.integration, integration)
         self.assertEqual(run.incoming_payload, webhook_data)
+
+
+class MappingCompilerTestCase(TestCase):
+    def setUp(self):
+        self.mappings = [
+            {"source": "customer.name", "target": "contact.name", "transform": "uppercase", "params": []},
+            {"source": "order.total", "target": "amount", "transform": "number", "params": []},
+            {"source": "customer.email", "target": "contact.email", "transform": "concat", "params": ["!"]},
+        ]
+        self.payload = {
+            "customer": {"name": "jane", "email": "jane@example.com"},
+            "order": {"total": "12.5"}
+        }
+
+    def test_plan_matches_uncompiled_output(self):
+        """Compiled plans produce the same output shape and order as the original mapper"""
+        from integrations.mapping_compiler import compile_mappings
+
+        output = compile_mappings(self.mappings).apply(self.payload)
+
+        self.assertEqual(output, {
+            "contact": {"name": "JANE", "email": "jane@example.com!"},
+            "amount": 12.5
+        })
+        self.assertEqual(list(output), ["contact", "amount"])
+
+    def test_failed_mapping_is_left_out(self):
+        """A mapping that raises does not leave placeholders or empty containers behind"""
+        from integrations.mapping_compiler import compile_mappings
+
+        mappings = self.mappings + [
+            {"source": "customer.name", "target": "extra.value", "transform": "number", "params": []}
+        ]
+        output = compile_mappings(mappings).apply(self.payload)
+
+        self.assertNotIn("extra", output)
+        self.assertEqual(output["amount"], 12.5)
+
+    def test_plan_cached_until_updated(self):
+        """Plans are reused per integration until updated_at changes"""
+        from integrations.mapping_compiler import get_mapping_plan
+
+        integration = IntegrationConfiguration.objects.create(
+            name='Plan Cache',
+            config_json={"mappings": self.mappings},
+            source_type='webhook',
+            target_url='https://api.example.com/test',
+            target_method='POST'
+        )
+        plan = get_mapping_plan(integration)
+        self.assertIs(get_mapping_plan(integration), plan)
+
+        integration.config_json = {"mappings": self.mappings[:1]}
+        integration.save()
+        self.assertIsNot(get_mapping_plan(integration), plan)
+        self.assertEqual(len(get_mapping_plan(integration).steps), 1)
+
+    def test_plan_cache_bounded_and_evicted_on_delete(self):
+        """The plan cache drops least recently used plans past its size and plans of deleted integrations"""
+        from integrations import mapping_compiler
+
+        integrations = [
+            IntegrationConfiguration.objects.create(
+                name=f'Plan {n}', config_json={"mappings": self.mappings}, source_type='webhook',
+                target_url='https://api.example.com/test', target_method='POST'
+            )
+            for n in range(3)
+        ]
+        with mock.patch.object(mapping_compiler, '_plan_cache', mapping_compiler.OrderedDict()) as cache, \
+                override_settings(MAPPING_PLAN_CACHE_SIZE=2):
+            for integration in integrations:
+                mapping_compiler.get_mapping_plan(integration)
+            self.assertEqual(list(cache), [str(integrations[1].id), str(integrations[2].id)])
+
+            integrations[2].delete()
+            self.assertEqual(list(cache), [str(integrations[1].id)])
+
+
+class JavaScriptEngineTestCase(TestCase):
+    def test_compiled_script_is_reused(self):
+        """Scripts are translated once and called with fields as an argument"""
+        from integrations.js_engine import compile_script
+
+        code = "return fields['first'] + ' ' + fields['last'];"
+        script = compile_script(code)
+
+        self.assertIs(compile_script(code), script)
+        self.assertEqual(script({'first': 'Ada', 'last': 'Lovelace'}), 'Ada Lovelace')
+        self.assertEqual(script({'first': 'Alan', 'last': 'Turing'}), 'Alan Turing')
+
+    def test_condition_uses_flattened_fields(self):
+        """Conditions see nested payload values under dotted keys"""
+        from integrations.integration_processor import evaluate_condition
+
+        condition = "return fields['order.status'] === 'paid';"
+        self.assertTrue(evaluate_condition(condition, {'order': {'status': 'paid'}}))
+        self.assertFalse(evaluate_condition(condition, {'order': {'status': 'open'}}))
+
+
+class FieldAccessTestCase(TestCase):
+    def test_static_keys_extracted(self):
+        """Only the keys a condition references are pulled from the payload"""
+        from integrations.field_access import analyze_field_access
+
+        access = analyze_field_access("return fields['order.status'] === 'paid' && fields.amount > 100;")
+        self.assertEqual(access.mode, 'static')
+        self.assertEqual(access.keys, ('order.status', 'amount'))
+
+        payload = {'order': {'status': 'paid', 'lines': [1, 2, 3]}, 'amount': 150, 'notes': 'x' * 1000}
+        self.assertEqual(access.build(payload), {'order.status': 'paid', 'amount': 150})
+
+    def test_dynamic_and_whole_object_access(self):
+        """Computed keys use the lazy proxy; whole-object use falls back to flattening"""
+        from integrations.field_access import LazyFields, analyze_field_access
+
+        lazy = analyze_field_access("var k = 'order' + '.status'; return fields[k] === 'paid';")
+        self.assertIsInstance(lazy.build({'order': {'status': 'paid'}}), LazyFields)
+        self.assertEqual(analyze_field_access("return Object.keys(fields).length > 0;").mode, 'full')
+
+    def test_lazy_condition_evaluation(self):
+        """Js2Py reads computed keys through the lazy proxy"""
+        from integrations.integration_processor import evaluate_condition
+
+        condition = "var k = 'order' + '.status'; return fields[k] === 'paid' && fields['missing'] === undefined;"
+        self.assertTrue(evaluate_condition(condition, {'order': {'status': 'paid'}}))
+        self.assertFalse(evaluate_condition(condition, {'order': {'status': 'open'}}))
+
+
+class ExpressionEngineTestCase(TestCase):
+    def test_simple_condition_compiled_natively(self):
+        """Conditions in the supported subset skip the JavaScript runtime"""
+        from integrations.js_engine import compile_script
+
+        script = compile_script("return fields['status'] === 'paid' && fields['amount'] > 100;", kind='condition')
+        self.assertEqual(script.engine, 'native')
+        self.assertTrue(script({'status': 'paid', 'amount': 150}))
+        self.assertFalse(script({'status': 'paid', 'amount': '50'}))
+        self.assertFalse(script({'status': 'open', 'amount': 150}))
+
+    def test_javascript_semantics(self):
+        """Values follow JavaScript rules for equality, truthiness and string methods"""
+        from integrations.expression_engine import compile_expression
+
+        evaluate = lambda code, fields=None: compile_expression(code)(fields or {})
+        self.assertTrue(evaluate("return fields.missing === undefined && fields.empty == null", {'empty': None}))
+        self.assertFalse(evaluate("return 1 === '1'"))
+        self.assertTrue(evaluate("return 1 == '1'"))
+        self.assertEqual(evaluate("return fields.items.length ? 'some' : 'none'", {'items': []}), 'none')
+        self.assertEqual(evaluate("return fields.name.trim().toUpperCase() + '!'", {'name': ' ada '}), 'ADA!')
+        self.assertEqual(evaluate("return {total: fields.a * 2, tag: fields.b || 'n/a'}", {'a': 2}),
+                         {'total': 4, 'tag': 'n/a'})
+
+    def test_math_rounding_passes_nan_and_infinity_through(self):
+        """Math.floor/ceil/round of NaN or Infinity return it unchanged instead of failing the condition"""
+        import math
+        from integrations.expression_engine import compile_expression
+        from integrations.integration_processor import evaluate_condition
+
+        self.assertFalse(evaluate_condition("return Math.floor(fields.x) > 3;", {}))
+        self.assertFalse(evaluate_condition("return Math.ceil(fields.x) > 3;", {}))
+        for function in ('floor', 'ceil', 'round'):
+            evaluate = compile_expression(f"return Math.{function}(fields.x)")
+            self.assertTrue(math.isnan(evaluate({})))
+            self.assertEqual(evaluate({'x': math.inf}), math.inf)
+            self.assertEqual(evaluate({'x': -math.inf}), -math.inf)
+        self.assertEqual(compile_expression("return Math.ceil(fields.x)")({'x': 2.1}), 3)
+
+    def test_unsupported_code_falls_back(self):
+        """Statements outside the subset run on the full JavaScript engine"""
+        from integrations.js_engine import compile_script
+
+        script = compile_script("var total = 0; for (var i = 0; i < 3; i++) { total += i; } return total;")
+        self.assertEqual(script.engine, 'js2py')
+        self.assertEqual(script({}), 3)
+
+
+class BatchTransformTestCase(TestCase):
+    def test_batch_matches_single_transform(self):
+        """Batch transforms give the same outputs as transforming one payload at a time"""
+        from integrations.integration_processor import transform_batch, transform_data
+
+        mappings = [
+            {"source": "name", "target": "user.name", "transform": "uppercase", "params": []},
+            {"transform": "javascript", "target": "user.label",
+             "jsCode": "var parts = [fields['name'], fields['age']]; return parts.join(':');",
+             "sourceFields": ["name", "age"]},
+            {"source": "age", "target": "user.age", "transform": "number", "params": []},
+        ]
+        payloads = [{"name": "ada", "age": "36"}, {"name": "alan", "age": "41"}]
+
+        outputs, errors = transform_batch(iter(payloads), mappings)
+
+        self.assertEqual(outputs, [transform_data(payload, mappings) for payload in payloads])
+        self.assertEqual(outputs[1], {"user": {"name": "ALAN", "label": "alan:41", "age": 41.0}})
+        self.assertEqual(errors, [[], []])
+
+    def test_number_batch_matches_scalar_for_mixed_inputs(self):
+        """The batch `number` transform (NumPy when installed) matches the scalar one, errors included"""
+        from integrations.integration_processor import transform_batch, transform_data
+
+        mappings = [{"source": "v", "target": "n", "transform": "number", "params": []}]
+        for column in ([1, 2.5, 3], [1, "2.5", True, None], [1, [1, 2], "x", "1e3", {"a": 1}]):
+            payloads = [{"v": value} for value in column]
+            outputs, _ = transform_batch(payloads, mappings)
+            self.assertEqual(outputs, [transform_data(payload, mappings) for payload in payloads])
+
+    def test_errors_reported_per_record(self):
+        """A failing record does not affect the rest of the batch"""
+        from integrations.integration_processor import transform_batch
+
+        mappings = [{"source": "amount", "target": "amount", "transform": "number", "params": []}]
+        outputs, errors = transform_batch([{"amount": "1"}, {"amount": "n/a"}, {"amount": 3}], mappings)
+
+        self.assertEqual(outputs, [{"amount": 1.0}, {}, {"amount": 3.0}])
+        self.assertEqual(errors[0], [])
+        self.assertEqual(errors[1][0]["target"], "amount")
+        self.assertEqual(errors[2], [])
+
+    def test_process_batch_logs_run_per_payload(self):
+        """Every payload in a batch gets its own run"""
+        from integrations.integration_processor import process_integration_batch
+
+        integration = IntegrationConfiguration.objects.create(
+            name='Batch',
+            config_json={"condition": "return fields['status'] === 'paid';", "mappings": []},
+            source_type='pubsub',
+            target_url='https://api.example.com/test',
+            target_method='POST'
+        )
+        results = process_integration_batch(integration, [{"status": "open"}, {"status": "void"}])
+
+        self.assertEqual([result['status'] for result in results], ['skipped', 'skipped'])
+        self.assertEqual(IntegrationRun.objects.filter(integration=integration).count(), 2)
+
+
+class TransformRegistryTestCase(TestCase):
+    def test_custom_transform_used_by_mappings(self):
+        """Registered transforms are resolved at compile time with prepared params"""
+        from integrations.mapping_compiler import compile_mappings
+        from integrations.transforms import register_transform
+
+        prepared = []
+
+        def prepare(params):
+            prepared.append(params)
+            return params[0]
+
+        register_transform('surround', lambda value, mark: f"{mark}{value}{mark}",
+                           batch=lambda values, mark: [f"{mark}{value}{mark}" for value in values],
+                           prepare=prepare)
+        plan = compile_mappings([{"source": "code", "target": "code", "transform": "surround", "params": ["*"]}])
+
+        self.assertEqual(plan.apply({"code": "a1"}), {"code": "*a1*"})
+        self.assertEqual(plan.apply_batch([{"code": "a1"}, {"code": "b2"}])[0], [{"code": "*a1*"}, {"code": "*b2*"}])
+        self.assertEqual(prepared, [["*"]])
+
+    def test_failing_batch_falls_back_to_scalar(self):
+        """A batch implementation that raises is retried value by value"""
+        from integrations.integration_processor import transform_batch
+
+        mappings = [{"source": "n", "target": "n", "transform": "number", "params": []}]
+        outputs, errors = transform_batch([{"n": "1"}, {"n": None}, {"n": "x"}], mappings)
+
+        self.assertEqual(outputs, [{"n": 1.0}, {"n": None}, {}])
+        self.assertEqual([len(record_errors) for record_errors in errors], [0, 0, 1])
+
+
+class FieldPathTestCase(TestCase):
+    def test_selector_getters(self):
+        """Indices, wildcards and filters are compiled into getters"""
+        from integrations.field_paths import compile_getter
+
+        payload = {"items": [{"sku": "a", "qty": 1}, {"sku": "b", "qty": 3}, {"qty": 5}]}
+
+        self.assertEqual(compile_getter("items[1].sku")(payload), "b")
+        self.assertEqual(compile_getter("items.0.sku")(payload), "a")
+        self.assertEqual(compile_getter("items[-1].qty")(payload), 5)
+        self.assertEqual(compile_getter("items[*].sku")(payload), ["a", "b", None])
+        self.assertEqual(compile_getter("$.items[?(@.qty > 1)].qty")(payload), [3, 5])
+        self.assertIsNone(compile_getter("items[7].sku")(payload))
+
+    def test_wildcard_targets_in_mappings(self):
+        """Per-element mappings write into output arrays without JavaScript"""
+        from integrations.mapping_compiler import compile_mappings
+
+        plan = compile_mappings([
+            {"source": "order.id", "target": "id", "transform": "", "params": []},
+            {"source": "items[*].sku", "target": "lines[*].code", "transform": "uppercase", "params": []},
+            {"source": "currency", "target": "lines[*].currency", "transform": "", "params": []},
+        ])
+        source = {"order": {"id": 7}, "currency": "EUR", "items": [{"sku": "a1"}, {"sku": "b2"}]}
+        expected = {"id": 7, "lines": [{"code": "A1", "currency": "EUR"}, {"code": "B2", "currency": "EUR"}]}
+
+        self.assertEqual(plan.apply(source), expected)
+        self.assertEqual(plan.apply_batch([source])[0], [expected])
+
+    def test_invalid_selectors(self):
+        """Malformed selectors and filters in targets are rejected at compile time"""
+        from integrations.field_paths import PathSyntaxError, compile_getter, compile_setter
+
+        with self.assertRaises(PathSyntaxError):
+            compile_getter("items[abc]")
+        with self.assertRaises(PathSyntaxError):
+            compile_setter("items[?(@.qty > 1)].sku")
+
+    def test_dollar_prefixed_keys_are_literal(self):
+        """Only `$`, `$.` and `$[` mark the root; `$distinct_id` is a key"""
+        from integrations.field_paths import compile_getter
+
+        payload = {"$distinct_id": "u1", "distinct_id": "other", "items": [1, 2]}
+
+        self.assertEqual(compile_getter("$distinct_id")(payload), "u1")
+        self.assertEqual(compile_getter("$.distinct_id")(payload), "other")
+        self.assertEqual(compile_getter("$['$distinct_id']")(payload), "u1")
+        self.assertEqual(compile_getter("$.items[1]")(payload), 2)
+
+    def test_invalid_selectors_in_mappings_fall_back_to_dotted_keys(self):
+        """A mapping whose path is not a valid selector is read and written as plain keys"""
+        from integrations.mapping_compiler import compile_mappings
+
+        plan = compile_mappings([
+            {"source": "tags[primary]", "target": "out[0", "transform": "uppercase", "params": []},
+            {"source": "meta.name", "target": "name", "transform": "", "params": []},
+        ])
+        source = {"tags[primary]": "red", "meta": {"name": "n"}}
+        expected = {"out[0": "RED", "name": "n"}
+
+        self.assertEqual(plan.apply(source), expected)
+        self.assertEqual(plan.apply_batch([source])[0], [expected])
+
+
+class JavaScriptSandboxTestCase(TestCase):
+    def test_runaway_script_becomes_mapping_error(self):
+        """Scripts exceeding the CPU limit are reported as mapping errors instead of hanging"""
+        from integrations import js_sandbox
+        from integrations.js_engine import clear_compiled_scripts
+        from integrations.mapping_compiler import compile_mappings
+
+        pool = js_sandbox.SandboxPool(1, 0.5, 256)
+        try:
+            with override_settings(JS_SANDBOX_ENABLED=True), mock.patch.object(js_sandbox, '_pool', pool):
+                clear_compiled_scripts()
+                plan = compile_mappings([
+                    {"target": "total", "transform": "javascript", "sourceFields": ["n"],
+                     "jsCode": "var t = 0; for (var i = 0; i < 3; i++) { t += fields.n; } return t;"},
+                    {"target": "spin", "transform": "javascript", "sourceFields": [],
+                     "jsCode": "while (true) {} return 1;"},
+                ])
+
+                outputs, errors = plan.apply_batch([{"n": 2}])
+                self.assertEqual(outputs, [{"total": 6}])
+                self.assertIn("CPU time limit", errors[0][0]["error"])
+                # Single records drop the timed out target the same way
+                self.assertEqual(plan.apply({"n": 2}), outputs[0])
+        finally:
+            pool.shutdown()
+            clear_compiled_scripts()
+
+    def test_workers_warm_up_before_their_first_job(self):
+        """Workers report ready once Js2Py is loaded; one that never does is replaced instead of run"""
+        import multiprocessing
+        from integrations import js_sandbox
+
+        pool = js_sandbox.SandboxPool(1, 0.5, 256, start_timeout=30)
+        try:
+            worker = pool._idle.get()
+            worker.wait_ready(30)
+            self.assertTrue(worker.ready)
+            pool._idle.put(worker)
+            self.assertEqual(pool.run("return fields.n + 1;", [{"n": 1}]), [(True, 2)])
+        finally:
+            pool.shutdown()
+
+        silent = js_sandbox._Worker.__new__(js_sandbox._Worker)
+        silent.connection, other_end = multiprocessing.Pipe()
+        silent.ready = False
+        with self.assertRaises(js_sandbox.SandboxError):
+            silent.wait_ready(0.1)
+        other_end.close()
+
+
+class SerializationTestCase(TestCase):
+    def test_round_trip(self):
+        """Payloads round-trip through the configured backend, with Django fallbacks for other types"""
+        from decimal import Decimal
+        from integrations.serialization import dumps, dumps_pretty, loads
+
+        data = {"id": 1, "name": "Zoë", "amount": Decimal("1.50"), "tags": ["a", None]}
+        expected = {"id": 1, "name": "Zoë", "amount": "1.50", "tags": ["a", None]}
+
+        self.assertEqual(loads(dumps(data)), expected)
+        self.assertEqual(loads(dumps_pretty(data)), expected)
+        with self.assertRaises(ValueError):
+            loads(b"{not json")
+
+    def test_payload_encoded_once_for_delivery_and_log(self):
+        """The bytes sent to the target are reused for the run log"""
+        from concurrent.futures import Future
+        from integrations.delivery_engine import DeliveryResponse
+        from integrations.integration_processor import deliver_payload
+        from integrations.serialization import PayloadJSONEncoder, encode_payload
+
+        payload = encode_payload({"order": {"id": 7}})
+        with mock.patch('integrations.serialization.dumps', side_effect=AssertionError("encoded twice")):
+            self.assertEqual(PayloadJSONEncoder().encode(payload), payload.encoded.decode('utf-8'))
+
+        integration = IntegrationConfiguration.objects.create(
+            name="Serialization", config_json={"target": {"method": "POST"}, "mappings": []},
+            source_type='webhook', target_url="https://api.example.com/orders", target_method='POST'
+        )
+        response = Future()
+        response.set_result(DeliveryResponse(200, {}, b'{"ok": true}', 'utf-8', 12))
+        with mock.patch('integrations.integration_processor.submit_delivery', return_value=response) as send:
+            result = deliver_payload(integration, {"id": 7}, {"order": {"id": 7}}, 0)
+
+        self.assertEqual(send.call_args.args[0].body, b'{"order":{"id":7}}')
+        self.assertEqual(result['response'], {"ok": True})
+        run = IntegrationRun.objects.get(id=result['run_id'])
+        self.assertEqual(run.transformed_payload, {"order": {"id": 7}})
+
+
+def start_test_server(handle_post):
+    """Start a local HTTP/1.1 server on a random port; returns the server (call shutdown() when done)"""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            status, headers, content = handle_post(self, body)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.handle_error = lambda request, client_address: None  # clients that gave up (timeouts)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class HTTPSessionTestCase(TestCase):
+    def test_connections_reused_per_origin(self):
+        """Deliveries to the same origin share one keep-alive connection and never store cookies"""
+        from integrations.http_sessions import SessionRegistry
+
+        server = start_test_server(lambda handler, body: (200, {'Set-Cookie': 'session=abc'}, b'{}'))
+        registry = SessionRegistry(pool_maxsize=2)
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/ingest"
+            for _ in range(3):
+                session = registry.get_session(url)
+                self.assertEqual(session.post(url, data=b'{}', timeout=5).status_code, 200)
+
+            self.assertIs(registry.get_session(url.replace('/ingest', '/other')), session)
+            self.assertEqual(len(session.cookies), 0)
+            stats = registry.stats()[f"http://127.0.0.1:{server.server_port}"]
+            self.assertEqual(stats['connections_opened'], 1)
+            self.assertEqual(stats['requests'], 3)
+        finally:
+            registry.close()
+            server.shutdown()
+            server.server_close()
+
+
+class DeliveryEngineTestCase(TestCase):
+    def test_concurrency_capped_per_integration(self):
+        """Deliveries run concurrently on the engine loop, but never above the integration's cap"""
+        import threading
+        import time
+        from integrations.delivery_engine import DeliveryEngine, DeliveryRequest
+
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+
+        def handle(handler, body):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.1)
+            with lock:
+                state['active'] -= 1
+            return 200, {'Content-Type': 'application/json'}, body
+
+        server = start_test_server(handle)
+        engine = DeliveryEngine(per_integration=2, per_host=10)
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/bulk"
+            futures = [
+                engine.submit(DeliveryRequest('integration-a', 'POST', url, {}, body=b'{"n": %d}' % n))
+                for n in range(6)
+            ]
+            responses = [future.result(timeout=10) for future in futures]
+
+            self.assertEqual([response.content for response in responses], [b'{"n": %d}' % n for n in range(6)])
+            self.assertTrue(all(response.ok for response in responses))
+            self.assertEqual(state['peak'], 2)
+        finally:
+            engine.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_query_params_encoded_like_requests(self):
+        """httpx deliveries send the same query string as the requests fallback"""
+        from integrations.delivery_engine import DeliveryEngine, DeliveryRequest
+
+        paths = []
+
+        def handle(handler, body):
+            paths.append(handler.path)
+            return 200, {}, b'{}'
+
+        server = start_test_server(handle)
+        engine = DeliveryEngine()
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/ingest?source=a"
+            params = {'flag': True, 'off': False, 'missing': None, 'n': 1.5, 'tags': ['x', None, 'y z'],
+                      'raw': b'caf\xc3\xa9', 'name': 'a&b'}
+            engine.submit(DeliveryRequest('integration-a', 'POST', url, {}, params=params, body=b'{}')).result(timeout=10)
+            DeliveryEngine._send_requests(DeliveryRequest('integration-a', 'POST', url, {}, params=params, body=b'{}'),
+                                          (5, 5))
+
+            self.assertEqual(paths[0], paths[1])
+            self.assertEqual(paths[1], '/ingest?source=a&flag=True&off=False&n=1.5&tags=x&tags=y+z&raw=caf%C3%A9&name=a%26b')
+        finally:
+            engine.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_redirects_followed_like_requests(self):
+        """Both transports follow a target's redirect and report the final response"""
+        from integrations.delivery_engine import DeliveryEngine, DeliveryRequest
+
+        def handle(handler, body):
+            if handler.path == '/old':
+                return 307, {'Location': '/new'}, b''
+            return 200, {}, b'{"moved": true}'
+
+        server = start_test_server(handle)
+        engine = DeliveryEngine()
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/old"
+            responses = [
+                engine.submit(DeliveryRequest('integration-a', 'POST', url, {}, body=b'{}')).result(timeout=10),
+                DeliveryEngine._send_requests(DeliveryRequest('integration-a', 'POST', url, {}, body=b'{}'), (5, 5)),
+            ]
+            for response in responses:
+                self.assertEqual((response.status_code, response.content), (200, b'{"moved": true}'))
+        finally:
+            engine.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_pool_stats_follow_the_transport_in_use(self):
+        """Pool statistics come from whichever transport sent the deliveries"""
+        from integrations import delivery_engine
+        from integrations.delivery_engine import DeliveryEngine, DeliveryRequest
+
+        server = start_test_server(lambda handler, body: (200, {}, b'{}'))
+        engine = DeliveryEngine()
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/ingest"
+            for _ in range(3):
+                engine.submit(DeliveryRequest('integration-a', 'POST', url, {}, body=b'{}')).result(timeout=10)
+
+            stats = engine.pool_stats()[f"http://127.0.0.1:{server.server_port}"]
+            if delivery_engine.httpx is not None:
+                self.assertEqual(stats['open_connections'], 1)
+                self.assertEqual(stats['idle_connections'], 1)
+            else:
+                self.assertEqual(stats['connections_opened'], 1)
+                self.assertEqual(stats['requests'], 3)
+        finally:
+            engine.close()
+            server.shutdown()
+            server.server_close()
+
+
+class BatchDeliveryTestCase(TestCase):
+    def _integration(self, url, batch):
+        return IntegrationConfiguration.objects.create(
+            name="Bulk", config_json={"target": {"method": "POST", "batch": batch}, "mappings": []},
+            source_type='webhook', target_url=url, target_method='POST'
+        )
+
+    def _deliver_all(self, batch, payloads):
+        from integrations.batch_delivery import BatchDeliveryQueue, get_batch_options
+
+        received = []
+        server = start_test_server(lambda handler, body: (
+            received.append((handler.headers['Content-Type'], body)) or (200, {}, b'{"accepted": true}')
+        ))
+        try:
+            integration = self._integration(f"http://127.0.0.1:{server.server_port}/bulk", batch)
+            queue = BatchDeliveryQueue()
+            results = [
+                queue.enqueue(integration, get_batch_options(integration), payload, payload, 0)
+                for payload in payloads
+            ]
+            queue.flush_all()
+        finally:
+            server.shutdown()
+            server.server_close()
+        return results, received
+
+    def test_array_batches_split_at_max_count(self):
+        """Payloads are sent as JSON arrays of at most maxCount items; each run points at its batch"""
+        results, received = self._deliver_all({"maxCount": 2}, [{"n": 1}, {"n": 2}, {"n": 3}])
+
+        self.assertEqual([result['status'] for result in results], ['queued'] * 3)
+        self.assertEqual(sorted((json.loads(body) for _, body in received), key=len, reverse=True),
+                         [[{"n": 1}, {"n": 2}], [{"n": 3}]])
+        self.assertEqual({content_type for content_type, _ in received}, {'application/json'})
+
+        runs = [IntegrationRun.objects.get(id=result['run_id']) for result in results]
+        self.assertEqual([run.status for run in runs], ['success'] * 3)
+        self.assertEqual(runs[0].outgoing_request['batch_id'], runs[1].outgoing_request['batch_id'])
+        self.assertNotEqual(runs[0].outgoing_request['batch_id'], runs[2].outgoing_request['batch_id'])
+        self.assertEqual(runs[2].outgoing_response['body'], {"accepted": True})
+
+    def test_ndjson_format(self):
+        """NDJSON batches put one payload per line"""
+        _, received = self._deliver_all({"format": "ndjson"}, [{"n": 1}, {"n": 2}])
+
+        self.assertEqual(received, [('application/x-ndjson', b'{"n":1}\n{"n":2}\n')])
+
+    def test_failed_batch_retried_under_retry_policy(self):
+        """A retryable batch failure marks every run 'retrying' and resends the same request"""
+        from integrations.batch_delivery import BatchDeliveryQueue, get_batch_options, record_batch
+        from integrations.delivery_engine import submit_delivery
+
+        statuses = [503, 200]
+        server = start_test_server(lambda handler, body: (statuses.pop(0), {}, b'{}'))
+        scheduler = mock.Mock()
+        try:
+            integration = self._integration(f"http://127.0.0.1:{server.server_port}/bulk", True)
+            integration.config_json['target']['retry'] = {"maxAttempts": 3, "backoffMs": 10}
+            queue = BatchDeliveryQueue()
+            run_ids = [queue.enqueue(integration, get_batch_options(integration), {"n": n}, {"n": n}, 0)['run_id']
+                       for n in range(2)]
+            with mock.patch('integrations.batch_delivery.get_retry_scheduler', return_value=scheduler):
+                queue.flush_all()
+
+            self.assertEqual(set(IntegrationRun.objects.filter(id__in=run_ids).values_list('status', flat=True)),
+                             {'retrying'})
+            _, job = scheduler.schedule.call_args.args
+            record_batch(job.batch, job.request, submit_delivery(job.request).result(timeout=10), None,
+                         attempt=job.attempt)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        runs = IntegrationRun.objects.filter(id__in=run_ids)
+        self.assertEqual({(run.status, run.attempt_count, run.next_retry_at) for run in runs}, {('success', 2, None)})
+        self.assertEqual(len({run.outgoing_request['batch_id'] for run in runs}), 1)
+
+    def test_fanout_target_with_batch_is_batched(self):
+        """A fan-out target with `batch` joins a batch; the parent run follows it once sent"""
+        from integrations.batch_delivery import BatchDeliveryQueue
+        from integrations.integration_processor import deliver_payload
+
+        received = []
+        server = start_test_server(lambda handler, body: received.append(body) or (200, {}, b'{}'))
+        queue = BatchDeliveryQueue()
+        try:
+            integration = IntegrationConfiguration.objects.create(
+                name="Fan", source_type='webhook', target_method='POST', target_url='',
+                config_json={"mappings": [], "targets": [
+                    {"url": f"http://127.0.0.1:{server.server_port}/bulk", "method": "POST", "batch": True}
+                ]}
+            )
+            with mock.patch('integrations.integration_processor.get_batch_queue', return_value=queue):
+                result = deliver_payload(integration, {"n": 1}, {"n": 1}, 0)
+                self.assertEqual(result['status'], 'queued')
+                queue.flush_all()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(received, [b'[{"n":1}]'])
+        leg = IntegrationRun.objects.get(parent_run_id=result['run_id'])
+        self.assertEqual((leg.status, leg.outgoing_request['target_index']), ('success', 0))
+        self.assertEqual(IntegrationRun.objects.get(id=result['run_id']).status, 'success')
+
+    def test_abandoned_queued_runs_rebatched_by_sweeper(self):
+        """Batched runs still queued long after their batch was due go into a new batch"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from integrations.resilience import RetryScheduler
+
+        integration = self._integration("http://127.0.0.1:9/bulk", True)
+        run = IntegrationRun.objects.create(
+            integration=integration, incoming_payload={"n": 1}, transformed_payload={"n": 1},
+            outgoing_request={'queued': True, 'batch_format': 'array'}, outgoing_response={}, status='queued',
+            next_retry_at=timezone.now() - timedelta(hours=1)
+        )
+        queue = mock.Mock()
+
+        with mock.patch('integrations.batch_delivery.get_batch_queue', return_value=queue):
+            self.assertEqual(RetryScheduler().sweep(), 1)
+
+        self.assertEqual(queue.enqueue.call_args.kwargs['run_id'], run.id)
+
+
+class ResilienceTestCase(TestCase):
+    def test_circuit_breaker_opens_and_probes(self):
+        """The breaker fails fast once open and lets a single half-open probe through"""
+        import time
+        from integrations.resilience import CircuitBreaker, CircuitOpenError
+
+        breaker = CircuitBreaker('https://api.example.com:443', failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        breaker.before_request()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request()
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, 'half_open')
+        breaker.before_request()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request()
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_retryable_status_rescheduled_on_same_run(self):
+        """A retryable response marks the run 'retrying'; the next attempt updates the same run"""
+        from integrations.delivery_engine import submit_delivery
+        from integrations.integration_processor import deliver_payload, finish_delivery
+
+        statuses = [503, 200]
+        server = start_test_server(lambda handler, body: (statuses.pop(0), {}, b'{}'))
+        scheduler = mock.Mock()
+        try:
+            integration = IntegrationConfiguration.objects.create(
+                name="Retry", source_type='webhook', target_method='POST',
+                target_url=f"http://127.0.0.1:{server.server_port}/orders",
+                config_json={"target": {"method": "POST", "retry": {"maxAttempts": 3, "backoffMs": 10}}}
+            )
+            with mock.patch('integrations.integration_processor.get_retry_scheduler', return_value=scheduler):
+                result = deliver_payload(integration, {"id": 1}, {"id": 1}, 0)
+
+                self.assertEqual(result['status'], 'retrying')
+                run = IntegrationRun.objects.get(id=result['run_id'])
+                self.assertEqual((run.attempt_count, run.outgoing_response['status_code']), (1, 503))
+                self.assertIsNotNone(run.next_retry_at)
+
+                delay, job = scheduler.schedule.call_args.args
+                self.assertLessEqual(delay, 0.01)
+                result = finish_delivery(integration, None, job.request, submit_delivery(job.request), 0,
+                                         attempt=job.attempt, run_id=job.run_id)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        run.refresh_from_db()
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual((run.status, run.attempt_count, run.next_retry_at), ('success', 2, None))
+        self.assertEqual(run.circuit_state, 'closed')
+        self.assertEqual(scheduler.schedule.call_count, 1)
+
+    def test_overdue_retrying_runs_swept_from_database(self):
+        """Retrying runs left behind by a dead process are re-scheduled once, by whoever claims them"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from integrations.resilience import RetryScheduler
+
+        integration = IntegrationConfiguration.objects.create(
+            name="Retry", source_type='webhook', target_method='POST', target_url="http://127.0.0.1:9/orders",
+            config_json={"target": {"method": "POST", "retry": {"maxAttempts": 3}}}
+        )
+        overdue, recent = [
+            IntegrationRun.objects.create(
+                integration=integration, incoming_payload={"id": n}, transformed_payload={"id": n},
+                outgoing_request={'url': integration.target_url}, outgoing_response={}, status='retrying',
+                attempt_count=2, next_retry_at=timezone.now() - timedelta(seconds=age)
+            )
+            for n, age in ((1, 3600), (2, 5))
+        ]
+        scheduler = RetryScheduler()
+
+        self.assertEqual(scheduler.sweep(), 1)
+        self.assertEqual(scheduler.sweep(), 0)
+
+        _, _, job = scheduler._heap[0]
+        self.assertEqual((job.run_id, job.attempt, job.request.body), (overdue.id, 3, b'{"id":1}'))
+        overdue.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertGreater(overdue.next_retry_at, recent.next_retry_at)
+
+    def test_failed_request_logged_once_on_queued_run(self):
+        """A delivery that raises without a retry policy keeps the request it logged on the run"""
+        import socket
+        from integrations.integration_processor import process_integration
+
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        integration = IntegrationConfiguration.objects.create(
+            name="Down", source_type='webhook', target_method='POST', target_url=f"http://127.0.0.1:{port}/orders",
+            config_json={"target": {"method": "POST"}, "mappings": []}
+        )
+        run = IntegrationRun.objects.create(integration=integration, incoming_payload={"id": 1},
+                                            transformed_payload={}, outgoing_request={'queued': True},
+                                            outgoing_response={}, status='queued')
+
+        with self.assertRaises(Exception):
+            process_integration(integration, {"id": 1}, run_id=run.id)
+
+        run.refresh_from_db()
+        self.assertEqual(IntegrationRun.objects.filter(integration=integration).count(), 1)
+        self.assertEqual((run.status, run.outgoing_request['url']), ('error', integration.target_url))
+
+
+class RateLimiterTestCase(TestCase):
+    def test_local_bucket_reserves_and_refuses(self):
+        """Reservations past the burst wait for refill; ones beyond max_wait are refused"""
+        from integrations.rate_limiter import RateLimit, RateLimiter, RateLimitExceeded
+
+        limiter = RateLimiter(max_wait=0.5)
+        limit = RateLimit.from_config({"requestsPerSecond": 10, "burst": 2})
+        self.assertEqual(limiter.backend, 'local')
+        self.assertEqual(limiter.reserve('integration:a', limit), 0)
+        self.assertEqual(limiter.reserve('integration:a', limit), 0)
+        self.assertAlmostEqual(limiter.reserve('integration:a', limit), 0.1, delta=0.02)
+        self.assertEqual(limiter.reserve('integration:b', limit), 0)
+
+        for _ in range(4):
+            limiter.reserve('integration:a', limit)
+        with self.assertRaises(RateLimitExceeded):
+            limiter.reserve('integration:a', limit)
+        self.assertIsNone(RateLimit.from_config({"burst": 5}))
+
+    def test_refused_reservation_gives_back_earlier_tokens(self):
+        """A refusal from the host bucket releases the integration token; fan-out legs have their own buckets"""
+        import asyncio
+        from integrations.delivery_engine import DeliveryEngine, DeliveryRequest
+        from integrations.rate_limiter import RateLimit, RateLimiter, RateLimitExceeded
+
+        limiter = RateLimiter(max_wait=0)
+        integration_limit = RateLimit(1, burst=1)
+        host_limit = RateLimit(1, burst=1)
+        limiter.reserve('host:h', host_limit)
+        with self.assertRaises(RateLimitExceeded):
+            limiter.reserve_all([('integration:a', integration_limit), ('host:h', host_limit)])
+        self.assertEqual(limiter.reserve('integration:a', integration_limit), 0)
+
+        engine = DeliveryEngine()
+        seen = []
+        limiter.reserve_all = lambda buckets: seen.extend(key for key, _ in buckets) or 0.0
+        try:
+            with mock.patch('integrations.delivery_engine.get_rate_limiter', return_value=limiter):
+                for target_index in (None, 1):
+                    request = DeliveryRequest('fan', 'POST', 'http://unused.example.com', {},
+                                              rate_limit=integration_limit, target_index=target_index)
+                    asyncio.run_coroutine_threadsafe(engine._wait_for_rate_limits(request, 'http://unused.example.com'),
+                                                     engine._loop).result(timeout=5)
+        finally:
+            engine.close()
+        self.assertEqual(seen, ['integration:fan', 'integration:fan:targets[1]'])
+
+    def test_engine_paces_requests_to_rate(self):
+        """The engine spaces out an integration's deliveries according to target.rateLimit"""
+        import time
+        from integrations.delivery_engine import DeliveryEngine, DeliveryRequest
+        from integrations.rate_limiter import RateLimit, RateLimiter
+
+        arrivals = []
+
+        def handle(handler, body):
+            arrivals.append(time.monotonic())
+            return 200, {}, b'{}'
+
+        server = start_test_server(handle)
+        engine = DeliveryEngine()
+        limit = RateLimit(10, burst=1)
+        start = time.monotonic()
+        try:
+            with mock.patch('integrations.delivery_engine.get_rate_limiter', return_value=RateLimiter()):
+                url = f"http://127.0.0.1:{server.server_port}/paced"
+                futures = [engine.submit(DeliveryRequest('paced', 'POST', url, {}, body=b'{}', rate_limit=limit))
+                           for _ in range(4)]
+                self.assertTrue(all(future.result(timeout=10).ok for future in futures))
+        finally:
+            engine.close()
+            server.shutdown()
+            server.server_close()
+
+        # One request per 100ms after the first
+        self.assertGreaterEqual(max(arrivals) - start, 0.29)
+
+
+class ResponseCaptureTestCase(TestCase):
+    def test_large_body_truncated_and_hashed(self):
+        """Both engine backends keep only maxBytes of a large body, but hash and count all of it"""
+        import contextlib
+        import hashlib
+        from integrations.delivery_engine import DeliveryEngine, DeliveryRequest
+        from integrations.response_capture import CaptureOptions, response_log
+
+        content = b'[' + b','.join(b'{"n": %d}' % n for n in range(50000)) + b']'
+        server = start_test_server(lambda handler, body: (200, {'Content-Type': 'application/json'}, content))
+        options = CaptureOptions(max_bytes=1000, parse_max_bytes=500)
+        url = f"http://127.0.0.1:{server.server_port}/large"
+        try:
+            for backend in (contextlib.nullcontext(), mock.patch('integrations.delivery_engine.httpx', None)):
+                engine = DeliveryEngine()
+                try:
+                    with backend:
+                        request = DeliveryRequest('capture', 'POST', url, {}, body=b'{}', capture=options)
+                        response = engine.submit(request).result(timeout=10)
+                finally:
+                    engine.close()
+
+                self.assertEqual(len(response.content), 1000)
+                outgoing_response, response_data = response_log(response, options)
+                self.assertEqual(outgoing_response['body_size'], len(content))
+                self.assertEqual(outgoing_response['body_sha256'], hashlib.sha256(content).hexdigest())
+                self.assertTrue(outgoing_response['body_truncated'])
+                self.assertEqual(response_data, {'body': content[:1000].decode()})
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_small_body_decoded_and_headers_only_option(self):
+        """Small complete bodies are decoded; body=false stores only status, headers, size and hash"""
+        from integrations.delivery_engine import DeliveryResponse
+        from integrations.response_capture import CaptureOptions, response_log
+
+        response = DeliveryResponse(201, {'X-Id': '7'}, b'{"id": 7}', 'utf-8', 5)
+        outgoing_response, response_data = response_log(response, CaptureOptions())
+        self.assertEqual(response_data, {'id': 7})
+        self.assertNotIn('body_truncated', outgoing_response)
+
+        options = CaptureOptions.from_config({"body": False})
+        outgoing_response, response_data = response_log(response, options)
+        self.assertIsNone(response_data)
+        self.assertEqual(set(outgoing_response), {'status_code', 'headers', 'body_size', 'body_sha256'})
+
+        # Complete but over parseMaxBytes: kept as text, never decoded
+        _, response_data = response_log(response, CaptureOptions(parse_max_bytes=4))
+        self.assertEqual(response_data, {'body': '{"id": 7}'})
+
+
+class AdaptiveTimeoutTestCase(TestCase):
+    def test_timeouts_follow_p99_within_bounds(self):
+        """Timeouts are the ceilings until enough samples exist, then a multiple of p99 clamped to the floor"""
+        from integrations.latency_tracker import TimeoutPolicy, get_histogram, record_latency
+
+        origin = 'https://adaptive.example.com:443'
+        policy = TimeoutPolicy(multiplier=4)
+        with override_settings(DELIVERY_TIMEOUT_MIN_SAMPLES=10, DELIVERY_CONNECT_TIMEOUT_MIN=0.5,
+                               DELIVERY_CONNECT_TIMEOUT_MAX=10, DELIVERY_READ_TIMEOUT_MIN=1,
+                               DELIVERY_READ_TIMEOUT_MAX=30):
+            for _ in range(9):
+                record_latency(origin, 300)
+            self.assertEqual(policy.resolve(origin), (10.0, 30.0))
+
+            record_latency(origin, 300)
+            p99 = get_histogram(origin).percentile(99)
+            self.assertTrue(300 <= p99 < 375)
+            connect, read = policy.resolve(origin)
+            self.assertAlmostEqual(read, p99 * 4 / 1000)
+            self.assertEqual(connect, read)
+
+            for _ in range(10):
+                record_latency(origin, 2)
+            self.assertEqual(TimeoutPolicy(multiplier=1).resolve(origin), (0.5, 1.0))
+
+        self.assertEqual(TimeoutPolicy.from_config({"connect": 2, "read": 5}).resolve(origin), (2.0, 5.0))
+        self.assertEqual(TimeoutPolicy.from_config(3).resolve(origin), (3.0, 3.0))
+
+    def test_slow_target_times_out_at_adaptive_read_timeout(self):
+        """A target far slower than its recorded p99 is cut off at the adaptive timeout and raises its p99"""
+        import time
+        from integrations.delivery_engine import DeliveryEngine, DeliveryRequest, TIMEOUT_ERRORS
+        from integrations.http_sessions import get_origin
+        from integrations.latency_tracker import TimeoutPolicy, get_histogram, record_latency
+
+        server = start_test_server(lambda handler, body: (time.sleep(2), (200, {}, b'{}'))[1])
+        url = f"http://127.0.0.1:{server.server_port}/slow"
+        origin = get_origin(url)
+        engine = DeliveryEngine()
+        try:
+            for _ in range(20):
+                record_latency(origin, 50)
+            policy = TimeoutPolicy(multiplier=4, min_seconds=0.2)
+            start = time.monotonic()
+            with self.assertRaises(TIMEOUT_ERRORS):
+                engine.submit(DeliveryRequest('slow', 'POST', url, {}, body=b'{}', timeout=policy)).result(timeout=10)
+            self.assertLess(time.monotonic() - start, 1.5)
+            self.assertGreater(get_histogram(origin).percentile(99), 150)
+        finally:
+            engine.close()
+            server.shutdown()
+            server.server_close()
+
+
+class FanOutTestCase(TestCase):
+    def test_targets_delivered_concurrently_with_partial_status(self):
+        """One transform goes to every target at once; a failing leg makes the message run 'partial'"""
+        import time
+        from integrations.integration_processor import process_integration
+
+        received = {}
+
+        def handle(handler, body):
+            time.sleep(0.3)
+            received[handler.path] = json.loads(body)
+            return (500 if handler.path == '/down' else 200), {}, b'{"ok": true}'
+
+        server = start_test_server(handle)
+        base = f"http://127.0.0.1:{server.server_port}"
+        try:
+            integration = IntegrationConfiguration.objects.create(
+                name="Fan-out", source_type='webhook', target_method='POST', target_url=f"{base}/crm",
+                config_json={
+                    "mappings": [{"source": "order.id", "target": "id"}, {"source": "order.total", "target": "total"}],
+                    "targets": [
+                        {"name": "crm", "url": f"{base}/crm", "method": "POST"},
+                        {"name": "erp", "url": f"{base}/erp", "method": "POST",
+                         "mappings": [{"source": "order.currency", "target": "meta.currency"}]},
+                        {"name": "down", "url": f"{base}/down", "method": "POST"},
+                    ]
+                }
+            )
+            start = time.monotonic()
+            result = process_integration(integration, {"order": {"id": 7, "total": 9.5, "currency": "EUR"}})
+            elapsed = time.monotonic() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertLess(elapsed, 0.8)
+        self.assertEqual(result['status'], 'partial')
+        self.assertEqual([leg['status'] for leg in result['targets']], ['success', 'success', 'error'])
+        self.assertEqual(received['/crm'], {"id": 7, "total": 9.5})
+        self.assertEqual(received['/erp'], {"id": 7, "total": 9.5, "meta": {"currency": "EUR"}})
+
+        parent = IntegrationRun.objects.get(id=result['run_id'])
+        self.assertEqual(parent.status, 'partial')
+        self.assertEqual(parent.error_message, '1 of 3 targets failed')
+        legs = {run.outgoing_request['target_name']: run for run in parent.leg_runs.all()}
+        self.assertEqual(set(legs), {'crm', 'erp', 'down'})
+        self.assertEqual(legs['down'].outgoing_response['status_code'], 500)
+
+    def test_mixed_email_and_http_targets(self):
+        """Email legs are sent alongside HTTP legs and logged under the same parent run"""
+        from integrations.integration_processor import fanout_status, process_integration
+
+        server = start_test_server(lambda handler, body: (200, {}, b'{}'))
+        sent = {'smtp_server': 'smtp.example.com', 'from': 'a@example.com', 'to': ['ops@example.com'],
+                'subject': 'Order', 'email_time': 3}
+        try:
+            integration = IntegrationConfiguration.objects.create(
+                name="Mixed", source_type='webhook', target_method='POST', target_url="http://unused.example.com",
+                config_json={
+                    "mappings": [{"source": "id", "target": "id"}],
+                    "targets": [
+                        {"type": "email", "emailConfig": {"toEmail": "ops@example.com"}},
+                        {"url": f"http://127.0.0.1:{server.server_port}/hook", "method": "POST"},
+                    ]
+                }
+            )
+            with mock.patch('integrations.integration_processor.send_email', return_value=sent) as send_email:
+                result = process_integration(integration, {"id": 1})
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        send_email.assert_called_once_with({"toEmail": "ops@example.com"}, {"id": 1})
+        self.assertEqual(result['status'], 'success')
+        parent = IntegrationRun.objects.get(id=result['run_id'])
+        self.assertEqual(parent.leg_runs.filter(status='success').count(), 2)
+        self.assertEqual(fanout_status(['success', 'retrying']), 'retrying')
+        self.assertEqual(fanout_status(['error', 'error']), 'error')
+
+
+class CompressionTestCase(TestCase):
+    def test_large_bodies_gzipped_small_ones_sent_plain(self):
+        """Bodies over minBytes are sent gzip-encoded; smaller ones are left alone"""
+        import gzip
+        from integrations.delivery_engine import send_delivery
+        from integrations.integration_processor import build_delivery_request
+
+        received = []
+
+        def handle(handler, body):
+            encoding = handler.headers.get('Content-Encoding')
+            received.append((encoding, json.loads(gzip.decompress(body) if encoding == 'gzip' else body)))
+            return 200, {}, b'{}'
+
+        server = start_test_server(handle)
+        try:
+            integration = IntegrationConfiguration.objects.create(
+                name="Compressed", source_type='webhook', target_method='POST',
+                target_url=f"http://127.0.0.1:{server.server_port}/bulk",
+                config_json={"target": {"method": "POST", "compression": {"algorithm": "gzip", "minBytes": 512}}}
+            )
+            large = {"items": [{"sku": f"SKU-{n}", "qty": n} for n in range(200)]}
+            request = build_delivery_request(integration, large)
+            self.assertLess(len(request.body), len(request.payload.encoded) / 4)
+            send_delivery(request)
+            send_delivery(build_delivery_request(integration, {"small": True}))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(received, [('gzip', large), (None, {"small": True})])
+
+    def test_compression_options(self):
+        """String and dict configs are accepted, "none" turns compression off; zstd falls back to gzip (logged once)"""
+        from integrations import compression
+        from integrations.compression import CompressionOptions
+
+        self.assertIsNone(CompressionOptions.from_config(None))
+        self.assertIsNone(CompressionOptions.from_config({"algorithm": "gzip", "enabled": False}))
+        for disabled in ("", False, "none", "None", {"algorithm": "none"}):
+            self.assertIsNone(CompressionOptions.from_config(disabled))
+        self.assertEqual(CompressionOptions.from_config("gzip").level, 6)
+        with mock.patch.object(compression, 'zstandard', None), \
+                mock.patch.object(compression, '_zstd_fallback_logged', False), \
+                mock.patch('builtins.print') as warn:
+            self.assertEqual(CompressionOptions.from_config({"algorithm": "zstd"}).algorithm, 'gzip')
+            self.assertEqual(CompressionOptions.from_config("zstd").algorithm, 'gzip')
+        self.assertEqual(warn.call_count, 1)
+        with self.assertRaises(ValueError):
+            CompressionOptions.from_config("brotli")
+
+
+class FakeSMTP:
+    """Stand-in for smtplib.SMTP that records connections and can be made to drop"""
+    instances = []
+
+    def __init__(self, host, port, timeout=None):
+        self.host, self.port = host, port
+        self.calls = []
+        self.alive = True
+        FakeSMTP.instances.append(self)
+
+    def starttls(self):
+        self.calls.append('starttls')
+
+    def login(self, username, password):
+        self.calls.append('login')
+
+    def noop(self):
+        self.calls.append('noop')
+        return (250, b'OK') if self.alive else (421, b'closing')
+
+    def sendmail(self, from_email, to_emails, message):
+        import smtplib
+        if not self.alive:
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        self.calls.append('sendmail')
+
+    def quit(self):
+        self.calls.append('quit')
+
+    def close(self):
+        self.calls.append('close')
+
+
+class SMTPPoolTestCase(TestCase):
+    config = {"smtpServer": "smtp.example.com", "smtpPort": 587, "smtpUsername": "alerts",
+              "smtpPassword": "secret", "fromEmail": "alerts@example.com", "toEmail": "ops@example.com"}
+
+    def setUp(self):
+        FakeSMTP.instances = []
+
+    def test_connection_reused_across_messages_and_threads(self):
+        """One authenticated connection serves sequential messages from several threads"""
+        from concurrent.futures import ThreadPoolExecutor
+        from integrations.smtp_pool import SMTPConnectionPool
+
+        pool = SMTPConnectionPool(noop_after=60)
+        with mock.patch('integrations.smtp_pool.smtplib.SMTP', FakeSMTP):
+            for _ in range(3):
+                pool.send(self.config, 'alerts@example.com', ['ops@example.com'], 'body')
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(lambda _: pool.send(self.config, 'a@example.com', ['b@example.com'], 'x'), range(4)))
+
+        self.assertLessEqual(len(FakeSMTP.instances), 2)
+        self.assertEqual(FakeSMTP.instances[0].calls[:3], ['starttls', 'login', 'sendmail'])
+        self.assertEqual(sum(smtp.calls.count('login') for smtp in FakeSMTP.instances), len(FakeSMTP.instances))
+        self.assertEqual(pool.stats()['messages_sent'], 7)
+
+        other_user = dict(self.config, smtpUsername='reports')
+        with mock.patch('integrations.smtp_pool.smtplib.SMTP', FakeSMTP):
+            pool.send(other_user, 'reports@example.com', ['ops@example.com'], 'body')
+        self.assertEqual(pool.stats()['connections_opened'], len(FakeSMTP.instances))
+
+        # A changed password never reuses a connection logged in with the old one
+        opened = len(FakeSMTP.instances)
+        with mock.patch('integrations.smtp_pool.smtplib.SMTP', FakeSMTP):
+            pool.send(dict(self.config, smtpPassword='rotated'), 'alerts@example.com', ['ops@example.com'], 'body')
+        self.assertEqual(len(FakeSMTP.instances), opened + 1)
+
+    def test_dead_connections_replaced(self):
+        """Idle connections failing NOOP, or dropping mid-send, are replaced by fresh ones"""
+        from integrations.smtp_pool import SMTPConnectionPool
+
+        pool = SMTPConnectionPool(noop_after=0)
+        with mock.patch('integrations.smtp_pool.smtplib.SMTP', FakeSMTP):
+            pool.send(self.config, 'a@example.com', ['b@example.com'], 'x')
+            FakeSMTP.instances[0].alive = False
+            pool.send(self.config, 'a@example.com', ['b@example.com'], 'x')
+            self.assertEqual(len(FakeSMTP.instances), 2)
+            self.assertIn('noop', FakeSMTP.instances[0].calls)
+
+            # Dropped after a passing health check: resent once on a new connection
+            pool.noop_after = 60
+            FakeSMTP.instances[1].alive = False
+            pool.send(self.config, 'a@example.com', ['b@example.com'], 'x')
+        self.assertEqual(len(FakeSMTP.instances), 3)
+        self.assertEqual(FakeSMTP.instances[2].calls, ['starttls', 'login', 'sendmail'])
+        self.assertEqual(pool.stats()['messages_sent'], 3)
+
+
+class EmailDigestTestCase(TestCase):
+    def test_messages_collected_into_one_digest_email(self):
+        """Queued runs are sent as one email with a table of all records and share its digest_id"""
+        from integrations.email_digest import DigestQueue
+        from integrations.integration_processor import process_integration
+
+        integration = IntegrationConfiguration.objects.create(
+            name="Alerts", source_type='webhook', target_method='POST', target_url="http://unused.example.com",
+            config_json={
+                "mappings": [{"source": "host", "target": "host"}, {"source": "cpu", "target": "metrics.cpu"}],
+                "target": {"type": "email", "emailConfig": {
+                    "smtpServer": "smtp.example.com", "fromEmail": "alerts@example.com",
+                    "toEmail": "oncall@example.com", "subject": "CPU alerts",
+                    "digest": {"windowSeconds": 60, "maxCount": 3}
+                }}
+            }
+        )
+        sent = {'smtp_server': 'smtp.example.com', 'from': 'alerts@example.com', 'to': ['oncall@example.com'],
+                'subject': 'CPU alerts (3 messages)', 'email_time': 4}
+        # Not started: digests are only sent by flush_all, on the test's DB connection
+        queue = DigestQueue()
+        with mock.patch('integrations.integration_processor.get_digest_queue', return_value=queue), \
+                mock.patch('integrations.integration_processor.send_email_body', return_value=sent) as send_email_body:
+            results = [process_integration(integration, {"host": f"web-{n}", "cpu": 90 + n}) for n in range(4)]
+            queue.flush_all()
+
+        self.assertEqual([result['status'] for result in results], ['queued'] * 4)
+        self.assertEqual(send_email_body.call_count, 2)
+        config, subject, text, html_body = send_email_body.call_args_list[0].args
+        self.assertEqual(subject, 'CPU alerts (3 messages)')
+        self.assertEqual(text.splitlines()[0].split(), ['host', '|', 'metrics.cpu'])
+        self.assertIn('web-2 | 92', text)
+        self.assertIn('<td>web-0</td><td>90</td>', html_body)
+
+        runs = IntegrationRun.objects.filter(integration=integration)
+        self.assertEqual(set(runs.values_list('status', flat=True)), {'success'})
+        digest_ids = {run.outgoing_request['digest_id'] for run in runs}
+        self.assertEqual(len(digest_ids), 2)
+        self.assertEqual(sorted(run.outgoing_request['digest_size'] for run in runs), [1, 3, 3, 3])
+        self.assertEqual(set(runs.values_list('next_retry_at', flat=True)), {None})
+
+    def test_abandoned_digest_runs_requeued_by_sweeper(self):
+        """Digest runs still queued long after their window closed go into a new digest"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from integrations.resilience import RetryScheduler
+
+        integration = IntegrationConfiguration.objects.create(
+            name="Alerts", source_type='webhook', target_method='POST', target_url="http://unused.example.com",
+            config_json={"target": {"type": "email", "emailConfig": {"digest": True}}}
+        )
+        run = IntegrationRun.objects.create(
+            integration=integration, incoming_payload={"n": 1}, transformed_payload={"n": 1},
+            outgoing_request={'type': 'email', 'queued': True, 'digest': True}, outgoing_response={},
+            status='queued', next_retry_at=timezone.now() - timedelta(hours=1)
+        )
+        queue = mock.Mock()
+
+        with mock.patch('integrations.email_digest.get_digest_queue', return_value=queue):
+            self.assertEqual(RetryScheduler().sweep(), 1)
+
+        self.assertEqual(queue.enqueue.call_args.args[3], {"n": 1})
+        self.assertEqual(queue.enqueue.call_args.kwargs['run_id'], run.id)
+
+    def test_fanout_email_target_with_digest_is_digested(self):
+        """A fan-out email target with `digest` joins a digest; the parent run follows it once sent"""
+        from integrations.email_digest import DigestQueue
+        from integrations.integration_processor import deliver_payload
+
+        integration = IntegrationConfiguration.objects.create(
+            name="Fan alerts", source_type='webhook', target_method='POST', target_url='',
+            config_json={"mappings": [], "targets": [
+                {"name": "oncall", "type": "email", "emailConfig": {
+                    "smtpServer": "smtp.example.com", "fromEmail": "alerts@example.com",
+                    "toEmail": "oncall@example.com", "digest": {"windowSeconds": 60}
+                }}
+            ]}
+        )
+        sent = {'smtp_server': 'smtp.example.com', 'from': 'alerts@example.com', 'to': ['oncall@example.com'],
+                'subject': 'Integration Notification (2 messages)', 'email_time': 4}
+        queue = DigestQueue()
+        with mock.patch('integrations.integration_processor.get_digest_queue', return_value=queue), \
+                mock.patch('integrations.integration_processor.send_email') as send_email, \
+                mock.patch('integrations.integration_processor.send_email_body', return_value=sent) as send_email_body:
+            results = [deliver_payload(integration, {"n": n}, {"n": n}, 0) for n in range(2)]
+            self.assertEqual([result['status'] for result in results], ['queued', 'queued'])
+            queue.flush_all()
+
+        send_email.assert_not_called()
+        self.assertEqual(send_email_body.call_count, 1)
+        legs = IntegrationRun.objects.filter(parent_run_id__in=[result['run_id'] for result in results])
+        self.assertEqual({(leg.status, leg.outgoing_request['target_index'], leg.outgoing_request['digest_size'])
+                          for leg in legs}, {('success', 0, 2)})
+        self.assertEqual({IntegrationRun.objects.get(id=result['run_id']).status for result in results}, {'success'})
+
+    def test_render_table_clips_and_escapes(self):
+        """The text table clips long values; the HTML table escapes them"""
+        from integrations.email_digest import TEXT_CELL_WIDTH, render_table
+
+        text, table = render_table([{"note": "x" * 100}, {"note": "<b>", "extra": None}])
+        self.assertTrue(all(len(line) <= TEXT_CELL_WIDTH + 10 for line in text.splitlines()))
+        self.assertIn('<td>&lt;b&gt;</td>', table)
+
+
+class WebhookQueueTestCase(TestCase):
+    def _integration(self, url, path):
+        return IntegrationConfiguration.objects.create(
+            name="Async", source_type='webhook', target_method='POST', target_url=url,
+            webhook_path=f'/webhook/{path}/',
+            config_json={
+                "async": True,
+                "mappings": [{"source": "id", "target": "order.id"}],
+                "target": {"method": "POST", "url": url}
+            }
+        )
+
+    def test_webhook_acknowledged_then_processed_by_worker(self):
+        """Async webhooks get 202 with a queued run id; a worker delivers the message and fills in that run"""
+        from integrations.models import WebhookJob
+        from integrations.webhook_queue import drain
+
+        received = []
+
+        def handle(handler, body):
+            received.append(json.loads(body))
+            return 200, {'Content-Type': 'application/json'}, b'{"ok": true}'
+
+        server = start_test_server(handle)
+        try:
+            integration = self._integration(f"http://127.0.0.1:{server.server_port}/orders", 'async-orders')
+            response = APIClient().post('/webhook/async-orders/', {"id": 7}, format='json')
+
+            self.assertEqual(response.status_code, 202)
+            run_id = response.json()['run_id']
+            run = IntegrationRun.objects.get(id=run_id)
+            self.assertEqual(run.status, 'queued')
+            self.assertEqual(run.incoming_payload, {"id": 7})
+            self.assertEqual(received, [])
+
+            self.assertEqual(drain('test-worker'), 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(received, [{"order": {"id": 7}}])
+        self.assertFalse(WebhookJob.objects.exists())
+        self.assertEqual(IntegrationRun.objects.filter(integration=integration).count(), 1)
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'success')
+        self.assertEqual(run.transformed_payload, {"order": {"id": 7}})
+        self.assertIsNotNone(run.transformation_time_ms)
+        self.assertEqual(drain('test-worker'), 0)
+
+    def test_claims_are_exclusive_and_expire(self):
+        """A claimed job is not handed to another worker until its lock expires; then it counts an attempt"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from integrations.models import WebhookJob
+        from integrations.webhook_queue import claim_jobs, enqueue_webhook
+
+        integration = self._integration("http://unused.example.com", 'async-claims')
+        first = enqueue_webhook(integration, {"id": 1})
+        second = enqueue_webhook(integration, {"id": 2})
+
+        self.assertEqual([job.run_id for job in claim_jobs('worker-a', 1)], [first])
+        self.assertEqual([job.run_id for job in claim_jobs('worker-b', 10)], [second])
+        self.assertEqual(claim_jobs('worker-c', 10), [])
+
+        # worker-a died: its claim expires and the job is claimed again
+        WebhookJob.objects.filter(run_id=first).update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed = claim_jobs('worker-c', 10)
+        self.assertEqual([(job.run_id, job.locked_by, job.attempts) for job in reclaimed], [(first, 'worker-c', 2)])
+
+        # ...until it runs out of attempts
+        WebhookJob.objects.filter(run_id=first).update(locked_until=timezone.now() - timedelta(seconds=1))
+        with override_settings(WEBHOOK_QUEUE_MAX_ATTEMPTS=2):
+            self.assertEqual(claim_jobs('worker-d', 10), [])
+        self.assertFalse(WebhookJob.objects.filter(run_id=first).exists())
+        self.assertEqual(IntegrationRun.objects.get(id=first).status, 'error')
+
+
+class RoutingCacheTestCase(TestCase):
+    def setUp(self):
+        from integrations import routing_cache
+
+        self.table = routing_cache.RoutingTable(ttl_seconds=60)
+        patcher = mock.patch.object(routing_cache, '_table', self.table)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.integration = IntegrationConfiguration.objects.create(
+            name="Routed", source_type='webhook', target_method='POST', target_url="http://unused.example.com",
+            webhook_path='/webhook/routed/', config_json={"mappings": [{"source": "a", "target": "b"}]}
+        )
+
+    def test_hot_lookups_skip_database_until_integration_changes(self):
+        """Repeated lookups are served from memory; saving or deleting the integration drops its route"""
+        from integrations.routing_cache import get_routed_integration
+
+        self.assertEqual(get_routed_integration('webhook', '/webhook/routed/').id, self.integration.id)
+        with self.assertNumQueries(0):
+            cached = get_routed_integration('webhook', '/webhook/routed/')
+        self.assertEqual(cached.config_json['mappings'][0]['target'], 'b')
+        self.assertIsNone(get_routed_integration('pubsub', '/webhook/routed/'))
+
+        self.integration.config_json = {"mappings": [{"source": "a", "target": "c"}]}
+        self.integration.save()
+        self.assertEqual(get_routed_integration('webhook', '/webhook/routed/').config_json['mappings'][0]['target'], 'c')
+
+        self.integration.is_active = False
+        self.integration.save()
+        self.assertIsNone(get_routed_integration('webhook', '/webhook/routed/'))
+        self.assertEqual(self.table.stats()['routes'], 0)
+
+    def test_invalidation_published_on_commit_and_races_not_cached(self):
+        """Other processes are notified after commit; a load that raced an invalidation is not kept"""
+        from integrations import routing_cache
+
+        publisher = mock.Mock()
+        with override_settings(REDIS_URL='redis://localhost:6379/0'), \
+                mock.patch.object(routing_cache, 'redis', mock.Mock()), \
+                mock.patch.object(routing_cache, '_publisher', publisher):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.integration.save()
+                publisher.publish.assert_not_called()
+        publisher.publish.assert_called_once_with(routing_cache.CHANNEL, str(self.integration.id))
+
+        original_filter = IntegrationConfiguration.objects.filter
+
+        def filter_then_invalidate(*args, **kwargs):
+            queryset = original_filter(*args, **kwargs)
+            self.table.invalidate(self.integration.id)
+            return queryset
+
+        with mock.patch.object(IntegrationConfiguration.objects, 'filter', side_effect=filter_then_invalidate):
+            self.assertIsNotNone(self.table.get('webhook', '/webhook/routed/'))
+        self.assertEqual(self.table.stats()['routes'], 0)
+
+    def test_lookups_return_copies(self):
+        """Requests get their own instance; attributes set on it do not leak into the cache"""
+        from integrations.routing_cache import get_routed_integration
+
+        first = get_routed_integration('webhook', '/webhook/routed/')
+        first.target_index = 3
+        first.name = "Changed"
+        second = get_routed_integration('webhook', '/webhook/routed/')
+
+        self.assertIsNot(first, second)
+        self.assertEqual(second.name, "Routed")
+        self.assertFalse(hasattr(second, 'target_index'))
+
+    def test_invalidation_notified_through_postgres_without_redis(self):
+        """Without Redis, a PostgreSQL database carries invalidations with pg_notify"""
+        from integrations import routing_cache
+
+        database = mock.MagicMock(vendor='postgresql')
+        cursor = database.cursor.return_value.__enter__.return_value
+        with override_settings(REDIS_URL=None), mock.patch.object(routing_cache, 'connection', database):
+            self.assertEqual(routing_cache.RoutingTable().stats()['invalidation'], 'postgres')
+            routing_cache.publish_invalidation(self.integration.id)
+
+        cursor.execute.assert_called_once_with("SELECT pg_notify(%s, %s)",
+                                               [routing_cache.PG_CHANNEL, str(self.integration.id)])
+
+
+class BatchIngestTestCase(TestCase):
+    def test_ndjson_batch_processed_with_per_record_results(self):
+        """Valid lines are transformed and delivered; malformed lines are reported without failing the batch"""
+        received = []
+
+        def handle(handler, body):
+            received.append(json.loads(body))
+            return 200, {'Content-Type': 'application/json'}, b'{}'
+
+        server = start_test_server(handle)
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/events"
+            integration = IntegrationConfiguration.objects.create(
+                name="Bulk", source_type='webhook', target_method='POST', target_url=url,
+                webhook_path='/webhook/bulk-events/',
+                config_json={"mappings": [{"source": "id", "target": "event.id"}],
+                             "target": {"method": "POST", "url": url}}
+            )
+            body = b'{"id": 1}\n{"id": 2\n\n[3]\n{"id": 4}'
+            response = self.client.post('/webhook/bulk-events/batch/', body, content_type='application/x-ndjson')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['status'], 'partial')
+        self.assertEqual(data['summary'], {'success': 2, 'error': 2})
+        self.assertEqual([(r['index'], r['status']) for r in data['results']],
+                         [(0, 'success'), (1, 'error'), (2, 'error'), (3, 'success')])
+        self.assertIn('Invalid JSON', data['results'][1]['message'])
+        self.assertEqual(data['results'][2]['message'], 'Record is not a JSON object')
+        self.assertEqual(sorted(payload['event']['id'] for payload in received), [1, 4])
+        self.assertEqual(IntegrationRun.objects.filter(integration=integration).count(), 2)
+
+    def test_json_array_split_incrementally(self):
+        """Array elements are split on top-level commas across chunk boundaries; a bad element is skipped"""
+        import io
+        from integrations.batch_ingest import iter_records
+        from integrations.models import WebhookJob
+
+        body = b' [{"text": "a, [b] {c} \\"d\\""}, {"nested": [1, {"x": 2}]}, {bad}, 5, {"last": true} ]  '
+        records = list(iter_records(io.BytesIO(body), chunk_size=3))
+        self.assertEqual([record for record, _ in records],
+                         [{"text": 'a, [b] {c} "d"'}, {"nested": [1, {"x": 2}]}, None, None, {"last": True}])
+        self.assertEqual([error is None for _, error in records], [True, True, False, False, True])
+        self.assertEqual(list(iter_records(io.BytesIO(b'[{"a": 1}, {"b": '))), [({"a": 1}, None),
+                                                                               (None, 'Unterminated JSON array')])
+        self.assertEqual(list(iter_records(io.BytesIO(b'[ ]'))), [])
+
+        # Async integrations queue the whole batch in one go
+        IntegrationConfiguration.objects.create(
+            name="Bulk async", source_type='webhook', target_method='POST', target_url="http://unused.example.com",
+            webhook_path='/webhook/bulk-async/', config_json={"async": True, "mappings": []}
+        )
+        response = self.client.post('/webhook/bulk-async/batch/', b'[{"id": 1}, {"id": 2}]',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['summary'], {'queued': 2})
+        self.assertEqual(WebhookJob.objects.count(), 2)
+
+
+class AsyncIngestionTestCase(TestCase):
+    async def test_concurrent_webhooks_wait_on_event_loop(self):
+        """Concurrent async webhook requests overlap their deliveries and log their runs"""
+        import asyncio
+        import time
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncRequestFactory
+        from integrations.views import async_webhook_handler
+
+        def handle(handler, body):
+            time.sleep(0.3)
+            return 200, {'Content-Type': 'application/json'}, body
+
+        server = start_test_server(handle)
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/hooks"
+            integration = await IntegrationConfiguration.objects.acreate(
+                name="Async view", source_type='webhook', target_method='POST', target_url=url,
+                webhook_path='/webhook/async-view/',
+                config_json={"mappings": [{"source": "n", "target": "number"}], "target": {"method": "POST", "url": url}}
+            )
+            factory = AsyncRequestFactory()
+            started = time.monotonic()
+            responses = await asyncio.gather(*[
+                async_webhook_handler(factory.post('/webhook/async-view/', {"n": n}, content_type='application/json'),
+                                      'async-view')
+                for n in range(5)
+            ])
+            elapsed = time.monotonic() - started
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual([response.status_code for response in responses], [200] * 5)
+        self.assertLess(elapsed, 1.2)
+        runs = await sync_to_async(list)(IntegrationRun.objects.filter(integration=integration))
+        self.assertEqual(sorted(run.transformed_payload['number'] for run in runs), [0, 1, 2, 3, 4])
+        self.assertEqual({run.status for run in runs}, {'success'})
+
+    async def test_push_handler_skips_and_404s(self):
+        """The async push handler logs skipped runs and 404s on unknown endpoints"""
+        import base64
+        from django.http import Http404
+        from django.test import AsyncRequestFactory
+        from integrations.views import async_pubsub_push_handler
+
+        integration = await IntegrationConfiguration.objects.acreate(
+            name="Async push", source_type='pubsub', target_method='POST', target_url="http://unused.example.com",
+            pubsub_push_endpoint='/pubsub/async-push/',
+            config_json={"condition": "return fields['level'] === 'error';", "mappings": []}
+        )
+        envelope = {"message": {"data": base64.b64encode(b'{"level": "info"}').decode(), "messageId": "m-1"}}
+        factory = AsyncRequestFactory()
+        response = await async_pubsub_push_handler(
+            factory.post('/pubsub/async-push/', envelope, content_type='application/json'), 'async-push'
+        )
+        self.assertEqual(response.status_code, 204)
+        run = await IntegrationRun.objects.aget(integration=integration)
+        self.assertEqual(run.status, 'skipped')
+
+        with self.assertRaises(Http404):
+            await async_pubsub_push_handler(
+                factory.post('/pubsub/missing/', envelope, content_type='application/json'), 'missing'
+            )
+
+    async def test_views_check_method_and_release_keys_on_failure(self):
+        """The async views stay coroutines, answer 405 to non-POST requests and forget dedup keys of failures"""
+        import asyncio
+        from django.test import AsyncRequestFactory
+        from integrations import views
+
+        self.assertTrue(asyncio.iscoroutinefunction(views.async_webhook_handler))
+        self.assertTrue(views.async_webhook_handler.csrf_exempt)
+        factory = AsyncRequestFactory()
+        response = await views.async_webhook_handler(factory.get('/webhook/async-fail/'), 'async-fail')
+        self.assertEqual(response.status_code, 405)
+
+        await IntegrationConfiguration.objects.acreate(
+            name="Async fail", source_type='webhook', target_method='POST', target_url="http://unused.example.com",
+            webhook_path='/webhook/async-fail/', config_json={"mappings": [], "deduplication": True}
+        )
+        failing = mock.AsyncMock(side_effect=[RuntimeError('target down'), {'run_id': 'r-1'}])
+        with mock.patch.object(views, 'process_integration_async', failing):
+            statuses = [
+                (await views.async_webhook_handler(
+                    factory.post('/webhook/async-fail/', {"id": 7}, content_type='application/json',
+                                 headers={'Idempotency-Key': 'k-7'}), 'async-fail')).status_code
+                for _ in range(2)
+            ]
+        self.assertEqual(statuses, [500, 200])
+
+
+class DeduplicationTestCase(TestCase):
+    def setUp(self):
+        from integrations import dedup
+
+        self.filter = dedup.DuplicateFilter()
+        patcher = mock.patch.object(dedup, '_filter', self.filter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_duplicate_webhooks_short_circuited(self):
+        """Repeated Idempotency-Keys and payload field hashes skip the pipeline; failures release the key"""
+        integration = IntegrationConfiguration.objects.create(
+            name="Dedup", source_type='webhook', target_method='POST', target_url="http://unused.example.com",
+            webhook_path='/webhook/dedup/',
+            config_json={"deduplication": {"fields": ["order.id"]}, "mappings": []}
+        )
+        client = APIClient()
+        result = {'run_id': 'run-1', 'status': 'success'}
+        with mock.patch('integrations.views.process_integration', return_value=result) as process:
+            first = client.post('/webhook/dedup/', {"order": {"id": 1}}, format='json', HTTP_IDEMPOTENCY_KEY='k-1')
+            again = client.post('/webhook/dedup/', {"order": {"id": 2}}, format='json', HTTP_IDEMPOTENCY_KEY='k-1')
+            other = client.post('/webhook/dedup/', {"order": {"id": 1}}, format='json', HTTP_IDEMPOTENCY_KEY='k-2')
+            # Without a header the listed fields identify the message
+            client.post('/webhook/dedup/', {"order": {"id": 3}, "note": "a"}, format='json')
+            same_fields = client.post('/webhook/dedup/', {"order": {"id": 3}, "note": "b"}, format='json')
+        self.assertEqual(process.call_count, 3)
+        self.assertEqual(first.json()['status'], 'success')
+        self.assertEqual(again.json()['status'], 'duplicate')
+        self.assertEqual(other.json()['status'], 'success')
+        self.assertEqual(same_fields.json()['status'], 'duplicate')
+        self.assertEqual(self.filter.stats()['duplicates'], {str(integration.id): 2})
+
+        with mock.patch('integrations.views.process_integration',
+                        side_effect=[RuntimeError('target down'), result]) as process:
+            failed = client.post('/webhook/dedup/', {"order": {"id": 4}}, format='json')
+            retried = client.post('/webhook/dedup/', {"order": {"id": 4}}, format='json')
+        self.assertEqual(failed.status_code, 500)
+        self.assertEqual(retried.json()['status'], 'success')
+        self.assertEqual(process.call_count, 2)
+
+    def test_seen_keys_expire_evict_and_survive_redis_outage(self):
+        """Local keys expire after their TTL and are LRU-evicted; a Redis error falls back to local keys"""
+        import base64
+        from integrations.dedup import DuplicateFilter, LocalSeenKeys, claim_message
+
+        keys = LocalSeenKeys(max_keys=2)
+        self.assertTrue(keys.add('a', 60))
+        self.assertFalse(keys.add('a', 60))
+        self.assertTrue(keys.add('b', 60))
+        self.assertTrue(keys.add('c', 60))
+        self.assertTrue(keys.add('a', 60))
+        self.assertTrue(keys.add('expired', 0))
+        self.assertTrue(keys.add('expired', 60))
+
+        duplicate_filter = DuplicateFilter()
+        duplicate_filter.shared = mock.Mock()
+        duplicate_filter.shared.add.side_effect = ConnectionError('redis down')
+        self.assertTrue(duplicate_filter.first_seen('k', 60))
+        self.assertEqual(duplicate_filter.backend, 'local')
+        self.assertFalse(duplicate_filter.first_seen('k', 60))
+        self.assertEqual(duplicate_filter.shared.add.call_count, 1)
+
+        # Pub/Sub redeliveries are recognised by messageId
+        integration = IntegrationConfiguration.objects.create(
+            name="Dedup push", source_type='pubsub', target_method='POST', target_url="http://unused.example.com",
+            pubsub_push_endpoint='/pubsub/dedup-push/', config_json={"deduplication": True, "mappings": []}
+        )
+        self.assertEqual(claim_message(integration, {"a": 1}, message_id='m-1')[0], False)
+        self.assertEqual(claim_message(integration, {"a": 2}, message_id='m-1')[0], True)
+        envelope = {"message": {"data": base64.b64encode(b'{"a": 1}').decode(), "messageId": "m-1"}}
+        with mock.patch('integrations.views.process_integration') as process:
+            response = APIClient().post('/pubsub/dedup-push/', envelope, format='json')
+        self.assertEqual(response.json()['status'], 'duplicate')
+        process.assert_not_called()
+
+    def test_whole_payload_hash_uses_short_ttl(self):
+        """Hashing the whole payload only suppresses retries; an id source or ttlSeconds keeps the full TTL"""
+        from integrations.dedup import DedupOptions
+
+        with self.settings(DEDUP_TTL_SECONDS=86400, DEDUP_PAYLOAD_TTL_SECONDS=300):
+            defaults = DedupOptions.from_config(True)
+            payload_key = defaults.message_key({"alert": "cpu"}, {}, None)
+            self.assertEqual(defaults.ttl_for(payload_key), 300)
+            self.assertEqual(defaults.ttl_for(defaults.message_key({"alert": "cpu"}, {}, 'm-1')), 86400)
+
+            by_fields = DedupOptions.from_config({"fields": ["id"]})
+            self.assertEqual(by_fields.ttl_for(by_fields.message_key({"id": 1}, {}, None)), 86400)
+
+            explicit = DedupOptions.from_config({"ttlSeconds": 3600})
+            self.assertEqual(explicit.ttl_for(explicit.message_key({"alert": "cpu"}, {}, None)), 3600)
+
+        with mock.patch.object(self.filter, 'first_seen', return_value=True) as first_seen:
+            integration = IntegrationConfiguration.objects.create(
+                name="Dedup alerts", source_type='webhook', target_method='POST',
+                target_url="http://unused.example.com", config_json={"deduplication": True, "mappings": []}
+            )
+            from integrations.dedup import claim_message
+            with self.settings(DEDUP_PAYLOAD_TTL_SECONDS=300):
+                claim_message(integration, {"alert": "cpu"})
+        self.assertEqual(first_seen.call_args[0][1], 300)
+
+    def test_failed_batch_chunks_release_their_keys(self):
+        """A failing chunk reports its records as errors and lets them retry; a failed read releases every key"""
+        from integrations.batch_ingest import ingest_batch
+
+        IntegrationConfiguration.objects.create(
+            name="Dedup bulk", source_type='webhook', target_method='POST', target_url="http://unused.example.com",
+            webhook_path='/webhook/dedup-bulk/', config_json={"deduplication": True, "mappings": []}
+        )
+        body = b'{"id": 1}\n{"id": 2}'
+        ok = lambda integration, records: [{'run_id': 'run-1', 'status': 'success'} for _ in records]
+        with self.settings(WEBHOOK_BATCH_CHUNK_SIZE=1), \
+                mock.patch('integrations.integration_processor.process_integration_batch',
+                           side_effect=[ok(None, [1]), RuntimeError('database down'), ok(None, [1])]):
+            first = self.client.post('/webhook/dedup-bulk/batch/', body, content_type='application/x-ndjson',
+                                     HTTP_IDEMPOTENCY_KEY='b-1')
+            retry = self.client.post('/webhook/dedup-bulk/batch/', body, content_type='application/x-ndjson',
+                                     HTTP_IDEMPOTENCY_KEY='b-1')
+        self.assertEqual(first.json()['status'], 'partial')
+        self.assertEqual([(r['status'], r.get('message')) for r in first.json()['results']],
+                         [('success', None), ('error', 'database down')])
+        self.assertEqual([r['status'] for r in retry.json()['results']], ['duplicate', 'success'])
+
+        class BrokenStream:
+            def __init__(self, fail=True):
+                self.chunks = [b'{"id": 3}\n{"id": 4}\n']
+                self.fail = fail
+
+            def read(self, size):
+                if self.chunks:
+                    return self.chunks.pop()
+                if self.fail:
+                    raise OSError('client disconnected')
+                return b''
+
+        integration = IntegrationConfiguration.objects.get(name="Dedup bulk")
+        with self.settings(WEBHOOK_BATCH_CHUNK_SIZE=1), \
+                mock.patch('integrations.integration_processor.process_integration_batch', side_effect=ok):
+            with self.assertRaises(OSError):
+                ingest_batch(integration, BrokenStream(), headers={'Idempotency-Key': 'b-2'})
+            retried = ingest_batch(integration, BrokenStream(fail=False), headers={'Idempotency-Key': 'b-2'})
+        self.assertEqual(retried['summary'], {'success': 2})
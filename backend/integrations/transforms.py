@@ -0,0 +1,158 @@
+# transforms.py
+"""
+Registry of mapping transforms.
+
+Each transform declares a scalar function and, optionally, a batch function
+working on a whole column of values plus a `prepare` hook that turns the
+mapping's raw `params` into whatever the functions need. `prepare` runs once
+when mappings are compiled, not once per value.
+
+Apps add their own transforms from a `transforms.py` module, which is
+imported automatically at startup:
+
+    from integrations.transforms import register_transform
+
+    @register_transform('slugify', prepare=lambda params: params[0] if params else '-')
+    def slugify(value, separator):
+        return separator.join(str(value).lower().split()) if value is not None else None
+"""
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Transform:
+    """A named transform with scalar and optional batch implementations"""
+
+    def __init__(self, name: str, scalar: Callable[[Any, Any], Any],
+                 batch: Optional[Callable[[List[Any], Any], List[Any]]] = None,
+                 prepare: Optional[Callable[[list], Any]] = None):
+        self.name = name
+        self.scalar = scalar
+        self.batch = batch
+        self.prepare = prepare
+
+    def bind(self, params: list) -> 'BoundTransform':
+        """Prepare the params once and bind them to the implementations"""
+        prepared = self.prepare(params or []) if self.prepare else (params or [])
+        scalar = self.scalar
+        batch = self.batch
+        return BoundTransform(
+            lambda value: scalar(value, prepared),
+            (lambda values: batch(values, prepared)) if batch else None
+        )
+
+
+class BoundTransform:
+    """A transform with its params bound: `scalar(value)` and optionally `batch(values)`"""
+
+    __slots__ = ('scalar', 'batch')
+
+    def __init__(self, scalar: Callable[[Any], Any], batch: Optional[Callable[[List[Any]], List[Any]]] = None):
+        self.scalar = scalar
+        self.batch = batch
+
+
+_registry: Dict[str, Transform] = {}
+_registry_lock = threading.Lock()
+
+_IDENTITY = BoundTransform(lambda value: value, lambda values: list(values))
+
+
+def register_transform(name: str, scalar: Callable[[Any, Any], Any] = None,
+                       batch: Callable[[List[Any], Any], List[Any]] = None,
+                       prepare: Callable[[list], Any] = None):
+    """
+    Register a transform under `name`. Can be called directly or used as a
+    decorator on the scalar function. Registering an existing name replaces it.
+    """
+    def register(function):
+        with _registry_lock:
+            _registry[name] = Transform(name, function, batch=batch, prepare=prepare)
+        return function
+
+    if scalar is not None:
+        return register(scalar)
+    return register
+
+
+def get_transform(name: str) -> Optional[Transform]:
+    return _registry.get(name)
+
+
+def registered_transforms() -> List[str]:
+    return sorted(_registry)
+
+
+def resolve_transform(name: Optional[str], params: list) -> BoundTransform:
+    """Bind a transform by name; unknown or empty names pass values through unchanged"""
+    transform = _registry.get(name) if name else None
+    if transform is None:
+        return _IDENTITY
+    return transform.bind(params)
+
+
+def bind_transform(name: Optional[str], params: list) -> Callable[[Any], Any]:
+    """Resolve a transform name and its params into a single-argument callable"""
+    return resolve_transform(name, params).scalar
+
+
+# ---------------------------------------------------------------------------
+# Built-in transforms
+# ---------------------------------------------------------------------------
+
+def _string_transform(name: str, function: Callable[[str], Any]) -> None:
+    register_transform(
+        name,
+        lambda value, params: function(str(value)) if value is not None else None,
+        batch=lambda values, params: [function(str(value)) if value is not None else None for value in values]
+    )
+
+
+_string_transform('uppercase', str.upper)
+_string_transform('lowercase', str.lower)
+_string_transform('trim', str.strip)
+_string_transform('string', str)
+
+
+def _number_batch(values: List[Any], params: Any) -> List[Any]:
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    # NumPy only for plain numbers: it converts nested lists and some strings differently from float()
+    if numpy is not None and all(type(value) in (int, float) for value in values):
+        return numpy.asarray(values, dtype=float).tolist()
+    return [float(value) if value is not None else None for value in values]
+
+
+register_transform('number', lambda value, params: float(value) if value is not None else None, batch=_number_batch)
+register_transform(
+    'boolean',
+    lambda value, params: bool(value) if value is not None else None,
+    batch=lambda values, params: [bool(value) if value is not None else None for value in values]
+)
+register_transform(
+    'concat',
+    lambda value, suffix: str(value) + suffix if value is not None else None,
+    batch=lambda values, suffix: [str(value) + suffix if value is not None else None for value in values],
+    prepare=lambda params: str(params[0] if params else '')
+)
+register_transform(
+    'replace',
+    lambda value, args: str(value).replace(*args) if value is not None else None,
+    batch=lambda values, args: [str(value).replace(*args) if value is not None else None for value in values],
+    prepare=lambda params: (params[0] if len(params) > 0 else '', params[1] if len(params) > 1 else '')
+)
+register_transform(
+    'split',
+    lambda value, delim: str(value).split(delim) if value is not None else None,
+    batch=lambda values, delim: [str(value).split(delim) if value is not None else None for value in values],
+    prepare=lambda params: params[0] if params else ','
+)
+register_transform(
+    'join',
+    lambda value, delim: delim.join(value) if isinstance(value, list) else value,
+    batch=lambda values, delim: [delim.join(value) if isinstance(value, list) else value for value in values],
+    prepare=lambda params: params[0] if params else ','
+)
@@ -2,14 +2,27 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
-from django.http import JsonResponse
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.shortcuts import get_object_or_404, render
+from django.views.decorators.http import require_POST
+from django.shortcuts import render
 from django.views.generic import TemplateView
 from django.conf import settings
 from .models import IntegrationConfiguration, IntegrationRun
 from .serializers import IntegrationConfigurationSerializer, IntegrationRunSerializer
-from .integration_processor import process_integration
+from .integration_processor import process_integration, process_integration_async
+from .delivery_engine import get_delivery_engine, pool_stats
+from .latency_tracker import latency_stats
+from .rate_limiter import get_rate_limiter
+from .routing_cache import aget_routed_integration, get_routed_integration, get_routing_table
+from .resilience import circuit_stats
+from .smtp_pool import get_smtp_pool
+from .batch_ingest import ingest_batch
+from .dedup import (
+    aclaim_message, arelease_message, claim_message, duplicate_result, get_duplicate_filter, release_message
+)
+from .serialization import loads
+from .webhook_queue import enqueue_webhook, is_async, queue_stats
 from .pubsub_manager import (
     create_push_subscription,
     create_pull_subscription,
@@ -18,6 +31,7 @@ from .pubsub_manager import (
     handle_pubsub_push
 )
 from .pubsub_scheduler import get_scheduler
+from asgiref.sync import sync_to_async
 import time
 import os
 import json
@@ -105,6 +119,21 @@ class IntegrationConfigurationViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def delivery_stats(self, request):
+        """Delivery engine concurrency, circuit breakers, rate limiting, target latency, HTTP/SMTP pool, webhook queue, routing cache and deduplication statistics"""
+        return Response({
+            'delivery_engine': get_delivery_engine().stats(),
+            'circuit_breakers': circuit_stats(),
+            'rate_limiter': {'backend': get_rate_limiter().backend},
+            'latency': latency_stats(),
+            'http_pools': pool_stats(),
+            'smtp_pool': get_smtp_pool().stats(),
+            'webhook_queue': queue_stats(),
+            'routing_cache': get_routing_table().stats(),
+            'deduplication': get_duplicate_filter().stats(),
+        })
+
     @action(detail=True, methods=['post'])
     def test_pubsub(self, request, pk=None):
         """Test Pub/Sub integration by publishing a test message"""
@@ -245,16 +274,28 @@ def webhook_handler(request, webhook_path):
     # Find integration by webhook path
     # Ensure trailing slash for consistency
     full_path = f"/webhook/{webhook_path}/"
-    integration = get_object_or_404(
-        IntegrationConfiguration,
-        webhook_path=full_path,
-        is_active=True,
-        source_type='webhook'
-    )
+    integration = get_routed_integration('webhook', full_path)
+    if integration is None:
+        raise Http404
 
     # Process the webhook
+    dedup_key = None
     try:
         incoming_payload = request.data if hasattr(request, 'data') else json.loads(request.body)
+
+        # Retried deliveries of a message already seen stop here
+        duplicate, dedup_key = claim_message(integration, incoming_payload, headers=request.headers)
+        if duplicate:
+            return JsonResponse(duplicate_result(), status=200)
+
+        # Async integrations acknowledge once the message is stored; workers process it
+        if is_async(integration):
+            return JsonResponse({
+                'status': 'accepted',
+                'run_id': str(enqueue_webhook(integration, incoming_payload)),
+                'message': 'Webhook queued for processing'
+            }, status=202)
+
         result = process_integration(integration, incoming_payload)
 
         return JsonResponse({
@@ -264,12 +305,36 @@ def webhook_handler(request, webhook_path):
         }, status=200)
 
     except Exception as e:
+        release_message(dedup_key)
         return JsonResponse({
             'status': 'error',
             'message': str(e)
         }, status=500)
 
 
+@csrf_exempt
+@require_POST
+def webhook_batch_handler(request, webhook_path):
+    """
+    Batch variant of the webhook handler: the body is a JSON array or NDJSON
+    stream of payloads, read incrementally. Returns a result per record.
+    """
+    integration = get_routed_integration('webhook', f"/webhook/{webhook_path}/")
+    if integration is None:
+        raise Http404
+
+    try:
+        # Plain Django view: the body is streamed from the request, not parsed up front
+        result = ingest_batch(integration, request, headers=request.headers)
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
+    return JsonResponse(result, status=202 if result['status'] == 'accepted' else 200)
+
+
 @csrf_exempt
 @api_view(['POST'])
 def pubsub_push_handler(request, push_path):
@@ -277,20 +342,24 @@ def pubsub_push_handler(request, push_path):
 
     # Find integration by push endpoint path
     full_path = f"/pubsub/{push_path}/"
-    integration = get_object_or_404(
-        IntegrationConfiguration,
-        pubsub_push_endpoint=full_path,
-        is_active=True,
-        source_type='pubsub'
-    )
+    integration = get_routed_integration('pubsub', full_path)
+    if integration is None:
+        raise Http404
 
     # Process the Pub/Sub push message
+    dedup_key = None
     try:
         request_body = request.data if hasattr(request, 'data') else json.loads(request.body)
 
         # Decode Pub/Sub message
         decoded_message = handle_pubsub_push(request_body)
 
+        # Redelivered messages are acknowledged without processing them again
+        duplicate, dedup_key = claim_message(integration, decoded_message['data'],
+                                             message_id=decoded_message['message_id'])
+        if duplicate:
+            return JsonResponse(dict(duplicate_result(), message_id=decoded_message['message_id']), status=200)
+
         # Process through integration pipeline
         result = process_integration(integration, decoded_message['data'])
 
@@ -303,6 +372,7 @@ def pubsub_push_handler(request, push_path):
         }, status=204)
 
     except Exception as e:
+        release_message(dedup_key)
         print(f"Error processing Pub/Sub message: {e}")
         # Return error but still acknowledge receipt to prevent retries
         return JsonResponse({
@@ -311,6 +381,90 @@ def pubsub_push_handler(request, push_path):
         }, status=500)
 
 
+# The async views check the method inline and are marked CSRF exempt below:
+# csrf_exempt() and require_POST() only wrap coroutine functions from Django 5.0 on
+
+async def async_webhook_handler(request, webhook_path):
+    """
+    Native async webhook handler for ASGI deployments (ASYNC_INGESTION):
+    while the target is called, the request waits on the event loop instead
+    of holding a worker thread. Accepts JSON bodies.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    integration = await aget_routed_integration('webhook', f"/webhook/{webhook_path}/")
+    if integration is None:
+        raise Http404
+
+    dedup_key = None
+    try:
+        incoming_payload = loads(request.body)
+
+        duplicate, dedup_key = await aclaim_message(integration, incoming_payload, headers=request.headers)
+        if duplicate:
+            return JsonResponse(duplicate_result(), status=200)
+
+        if is_async(integration):
+            run_id = await sync_to_async(enqueue_webhook)(integration, incoming_payload)
+            return JsonResponse({
+                'status': 'accepted',
+                'run_id': str(run_id),
+                'message': 'Webhook queued for processing'
+            }, status=202)
+
+        result = await process_integration_async(integration, incoming_payload)
+
+        return JsonResponse({
+            'status': 'success',
+            'run_id': str(result['run_id']),
+            'message': 'Integration executed successfully'
+        }, status=200)
+
+    except Exception as e:
+        await arelease_message(dedup_key)
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
+
+async def async_pubsub_push_handler(request, push_path):
+    """Native async Pub/Sub push handler for ASGI deployments (ASYNC_INGESTION)"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    integration = await aget_routed_integration('pubsub', f"/pubsub/{push_path}/")
+    if integration is None:
+        raise Http404
+
+    dedup_key = None
+    try:
+        decoded_message = handle_pubsub_push(loads(request.body))
+        duplicate, dedup_key = await aclaim_message(integration, decoded_message['data'],
+                                                    message_id=decoded_message['message_id'])
+        if duplicate:
+            return JsonResponse(dict(duplicate_result(), message_id=decoded_message['message_id']), status=200)
+
+        result = await process_integration_async(integration, decoded_message['data'])
+
+        return JsonResponse({
+            'status': 'success',
+            'run_id': str(result['run_id']),
+            'message_id': decoded_message['message_id']
+        }, status=204)
+
+    except Exception as e:
+        await arelease_message(dedup_key)
+        print(f"Error processing Pub/Sub message: {e}")
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
+
+async_webhook_handler.csrf_exempt = True
+async_pubsub_push_handler.csrf_exempt = True
+
+
 def mapper_view(request):
     """Serve the mapper frontend"""
     frontend_path = os.path.join(settings.BASE_DIR.parent, 'frontend', 'index.html')
@@ -0,0 +1,139 @@
+# webhook_queue.py
+"""
+Asynchronous webhook acknowledgement.
+
+Integrations with `"async": true` in their config answer a webhook with
+202 Accepted as soon as the message is stored: the request handler only
+writes a 'queued' IntegrationRun (holding the payload) and a WebhookJob
+pointing at it, in one transaction. Transformation and delivery happen in
+`manage.py run_webhook_workers`, which claims jobs and fills in the same
+run, so the run id returned with the 202 shows the eventual outcome.
+
+Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED where the database
+supports it, and with a conditional UPDATE per job otherwise, so several
+worker processes can drain the table without taking the same job. A claim
+holds a job for WEBHOOK_QUEUE_LOCK_SECONDS; jobs of a worker that died are
+claimed again after that, and failed after WEBHOOK_QUEUE_MAX_ATTEMPTS
+claims. Delivery is at least once.
+"""
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import IntegrationConfiguration, IntegrationRun, WebhookJob
+
+
+def is_async(integration: IntegrationConfiguration) -> bool:
+    """Whether webhooks for the integration are acknowledged before processing"""
+    return bool(integration.config_json.get('async'))
+
+
+def enqueue_webhook(integration: IntegrationConfiguration, incoming_payload: Dict[str, Any]) -> Any:
+    """Store a webhook message for the workers; returns the queued run's id"""
+    return enqueue_webhooks(integration, [incoming_payload])[0]
+
+
+def enqueue_webhooks(integration: IntegrationConfiguration, incoming_payloads: List[Dict[str, Any]]) -> List[Any]:
+    """Store several webhook messages in one transaction; returns their queued runs' ids"""
+    with transaction.atomic():
+        runs = IntegrationRun.objects.bulk_create([
+            IntegrationRun(
+                integration=integration,
+                incoming_payload=incoming_payload,
+                transformed_payload={},
+                outgoing_request={'queued': True, 'async': True},
+                outgoing_response={},
+                status='queued',
+                error_message=None,
+                transformation_time_ms=None,
+                api_call_time_ms=None
+            )
+            for incoming_payload in incoming_payloads
+        ])
+        WebhookJob.objects.bulk_create([WebhookJob(integration=integration, run=run) for run in runs])
+    return [run.id for run in runs]
+
+
+def claim_jobs(worker_id: str, limit: int = 10) -> List[WebhookJob]:
+    """
+    Claim up to `limit` jobs for `worker_id`, oldest first: pending jobs and
+    processing jobs whose claim expired. Jobs that have used up their attempts
+    are failed instead of returned.
+    """
+    now = timezone.now()
+    claimable = Q(status='pending') | Q(status='processing', locked_until__lt=now)
+    claim = {
+        'status': 'processing',
+        'locked_by': worker_id,
+        'locked_until': now + timedelta(seconds=getattr(settings, 'WEBHOOK_QUEUE_LOCK_SECONDS', 300)),
+        'attempts': F('attempts') + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job_ids = list(
+                WebhookJob.objects.select_for_update(skip_locked=True)
+                .filter(claimable).order_by('created_at').values_list('id', flat=True)[:limit]
+            )
+            WebhookJob.objects.filter(id__in=job_ids).update(**claim)
+    else:
+        # No row locks to skip: claim each candidate only if nobody changed it since it was read
+        job_ids = []
+        candidates = WebhookJob.objects.filter(claimable).order_by('created_at') \
+            .values_list('id', 'status', 'locked_until')[:limit]
+        for job_id, status, locked_until in candidates:
+            if WebhookJob.objects.filter(id=job_id, status=status, locked_until=locked_until).update(**claim):
+                job_ids.append(job_id)
+
+    jobs = []
+    max_attempts = getattr(settings, 'WEBHOOK_QUEUE_MAX_ATTEMPTS', 5)
+    for job in WebhookJob.objects.filter(id__in=job_ids).select_related('integration', 'run').order_by('created_at'):
+        if job.attempts > max_attempts:
+            fail_job(job, f"Gave up after {max_attempts} attempt(s) to process the webhook")
+        else:
+            jobs.append(job)
+    return jobs
+
+
+def fail_job(job: WebhookJob, message: str) -> None:
+    """Mark a job's run as failed and drop the job"""
+    IntegrationRun.objects.filter(id=job.run_id).update(
+        status='error',
+        error_message=message,
+        outgoing_response={'error': message}
+    )
+    job.delete()
+
+
+def process_job(job: WebhookJob) -> Dict[str, Any]:
+    """Run a claimed job through the integration pipeline, logging the outcome on its queued run"""
+    from .integration_processor import process_integration
+
+    try:
+        # Errors are logged on the run by process_integration
+        return process_integration(job.integration, job.run.incoming_payload, run_id=job.run_id)
+    except Exception as e:
+        print(f"Webhook job {job.id} for {job.integration.name} failed: {e}")
+        return {'run_id': job.run_id, 'status': 'error', 'message': str(e)}
+    finally:
+        job.delete()
+
+
+def drain(worker_id: str, batch_size: int = 10) -> int:
+    """Claim and process one batch of jobs; returns how many were claimed"""
+    jobs = claim_jobs(worker_id, batch_size)
+    for job in jobs:
+        process_job(job)
+    return len(jobs)
+
+
+def queue_stats() -> Dict[str, int]:
+    """Jobs waiting for and held by workers"""
+    stats = {'pending': 0, 'processing': 0}
+    for row in WebhookJob.objects.values('status').order_by().annotate(count=Count('id')):
+        stats[row['status']] = row['count']
+    return stats